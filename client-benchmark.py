@@ -0,0 +1,134 @@
+"""
+Compares the old JANE request (GET, text in the url, plain response) with
+the POST + gzip one, against a local server answering with synthetic
+articles. For each blip length and result count it prints the bytes sent
+and received and the time to fetch and parse, best of a few runs. A link
+speed can be given to make the server pace its writes like a real network,
+localhost alone mostly shows the cost of compressing. Run from the
+repository root:
+
+    python client-benchmark.py [kilobytes per second]
+
+"""
+import BaseHTTPServer
+import gzip
+import imp
+import StringIO
+import sys
+import threading
+import time
+import urllib
+
+import jane_fixtures
+
+janey = imp.load_source('janey_robot', 'janey-robot.py')
+generator = jane_fixtures.FixtureGenerator()
+
+BLIP_LENGTHS = [100, 2000, 8000] # characters of blip text
+ARTICLE_COUNTS = [10, 100]
+REPEATS = 5
+WORDS = 'plasmodium falciparum malaria vaccine antigen trial cohort'.split()
+
+
+class JaneHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1 # see jane_standin.StandinHandler
+    disable_nagle_algorithm = True
+    link_speed = None # bytes per second, None for as fast as possible
+    received = 0
+    sent = 0
+
+    def do_GET(self):
+        self.answer(self.path.split('?', 1)[1])
+
+    def do_POST(self):
+        length = int(self.headers.getheader('content-length'))
+        self.answer(self.rfile.read(length), length)
+
+    def answer(self, query, body_length=0):
+        JaneHandler.received += (len(self.raw_requestline) +
+                                 len(str(self.headers)) + 2 + body_length)
+        count = int(dict(part.split('=', 1)
+                         for part in query.split('&'))['count'])
+        body = generator.articles(count)
+        headers = [('Content-Type', 'text/xml')]
+        if 'gzip' in self.headers.getheader('accept-encoding', ''):
+            buf = StringIO.StringIO()
+            f = gzip.GzipFile(fileobj=buf, mode='wb')
+            f.write(body)
+            f.close()
+            body = buf.getvalue()
+            headers.append(('Content-Encoding', 'gzip'))
+        headers.append(('Content-Length', str(len(body))))
+        response = ['HTTP/1.1 200 OK']
+        response.extend(['%s: %s' % header for header in headers])
+        response = '\r\n'.join(response) + '\r\n\r\n' + body
+        JaneHandler.sent += len(response)
+        if self.link_speed:
+            time.sleep(len(response) / float(self.link_speed))
+        self.wfile.write(response)
+
+    def log_message(self, *args):
+        pass
+
+
+def blip_text(length):
+    words = []
+    size = 0
+    while size < length:
+        word = WORDS[len(words) % len(WORDS)]
+        words.append(word)
+        size += len(word) + 1
+    return ' '.join(words)[:length]
+
+
+def fetch(url, use_post, encoding):
+    janey.JANE_USE_POST = use_post
+    janey.JANE_ACCEPT_ENCODING = encoding
+    JaneHandler.received = JaneHandler.sent = 0
+    start = time.time()
+    results = janey.fetchResultsFromJane(url, 'articles')
+    elapsed = time.time() - start
+    return results, elapsed, JaneHandler.received, JaneHandler.sent
+
+
+def best(url, use_post, encoding):
+    runs = [fetch(url, use_post, encoding) for i in range(REPEATS)]
+    return min(runs, key=lambda run: run[1])
+
+
+def run(link_speed):
+    JaneHandler.link_speed = link_speed
+    server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), JaneHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.setDaemon(True)
+    thread.start()
+    root = 'http://127.0.0.1:%d/jane/articles' % server.server_address[1]
+    print '%6s %8s %10s %10s %9s %10s %10s %9s' % ('blip', 'articles',
+            'GET sent', 'GET recv', 'GET ms', 'POST sent', 'POST recv',
+            'POST ms')
+    try:
+        for length in BLIP_LENGTHS:
+            for count in ARTICLE_COUNTS:
+                url = '%s?text=%s&count=%d' % (root,
+                        urllib.quote(blip_text(length)), count)
+                old = best(url, False, None)
+                new = best(url, True, janey.jane_http.ACCEPT_ENCODING)
+                if (janey.packResults('articles', old[0]) !=
+                    janey.packResults('articles', new[0])):
+                    raise AssertionError('GET and POST disagree')
+                print '%6d %8d %10d %10d %9.2f %10d %10d %9.2f' % (length,
+                        count, old[2], old[3], old[1] * 1000, new[2], new[3],
+                        new[1] * 1000)
+    finally:
+        # the server handles one connection at a time and would otherwise
+        # wait on our idle keep-alive connection forever
+        janey.jane_pool.close()
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    if sys.argv[1:]:
+        run(float(sys.argv[1]) * 1024)
+    else:
+        run(None)
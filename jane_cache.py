@@ -0,0 +1,374 @@
+"""
+Result cache that sits in front of the JANE service.
+
+People re-submit the same blip text all the time, so janey keeps recent
+answers around for a while. The cache itself only deals with expiry and
+hit/miss accounting, storage is delegated to a backend:
+
+    MemoryBackend   - in-process LRU dict bounded by entries and bytes
+    DiskBackend     - one pickle per key in a directory, LRU by access time
+    MemcacheBackend - anything with the memcache get/set/delete API, e.g.
+                      google.appengine.api.memcache or LocalMemcache below
+
+"""
+import cPickle as pickle
+import hashlib
+import os
+import threading
+import time
+
+DEFAULT_TTL = 60 * 60 # one hour
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_MAX_BYTES = 4 * 1024 * 1024
+
+
+def _now():
+    return time.time()
+
+
+def entry_size(value):
+    """
+    Rough size of a cached value, used for the memory bound. Strings are
+    measured exactly, anything else by its pickled length.
+
+    """
+    if isinstance(value, basestring):
+        return len(value)
+    return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+
+def hashed_key(key):
+    """
+    Keys are query urls and can be long, backends with key length limits
+    (memcache, file names) store a digest instead.
+
+    """
+    if isinstance(key, unicode):
+        key = key.encode('utf-8')
+    return hashlib.sha1(key).hexdigest()
+
+
+class _Node(object):
+    __slots__ = ('key', 'value', 'size', 'prev', 'next')
+
+    def __init__(self, key, value, size):
+        self.key = key
+        self.value = value
+        self.size = size
+        self.prev = None
+        self.next = None
+
+
+class MemoryBackend(object):
+    """
+    In-process LRU store. Entries live in a dict for lookup and on a
+    doubly linked list ordered by recency, so get, set and eviction are all
+    constant time.
+
+    """
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES,
+                 max_bytes=DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.evictions = 0
+        self._map = {}
+        self._head = _Node(None, None, 0) # most recently used end
+        self._tail = _Node(None, None, 0) # least recently used end
+        self._head.next = self._tail
+        self._tail.prev = self._head
+        self._lock = threading.Lock()
+
+    def _unlink(self, node):
+        node.prev.next = node.next
+        node.next.prev = node.prev
+
+    def _push_front(self, node):
+        node.prev = self._head
+        node.next = self._head.next
+        self._head.next.prev = node
+        self._head.next = node
+
+    def _remove(self, node):
+        self._unlink(node)
+        del self._map[node.key]
+        self.bytes -= node.size
+
+    def get(self, key):
+        self._lock.acquire()
+        try:
+            node = self._map.get(key)
+            if node is None:
+                return None
+            self._unlink(node)
+            self._push_front(node)
+            return node.value
+        finally:
+            self._lock.release()
+
+    def set(self, key, value):
+        size = entry_size(value[1])
+        self._lock.acquire()
+        try:
+            node = self._map.get(key)
+            if node is not None:
+                self._remove(node)
+            if size > self.max_bytes:
+                return
+            node = _Node(key, value, size)
+            self._map[key] = node
+            self._push_front(node)
+            self.bytes += size
+            while (len(self._map) > self.max_entries or
+                   self.bytes > self.max_bytes):
+                self._remove(self._tail.prev)
+                self.evictions += 1
+        finally:
+            self._lock.release()
+
+    def delete(self, key):
+        self._lock.acquire()
+        try:
+            node = self._map.get(key)
+            if node is not None:
+                self._remove(node)
+        finally:
+            self._lock.release()
+
+    def __len__(self):
+        return len(self._map)
+
+
+class DiskBackend(object):
+    """
+    Stores each entry as a pickle in directory, named by the key digest.
+    Reads touch the file so that eviction can drop the least recently used
+    files once there are more than max_entries of them.
+
+    """
+    def __init__(self, directory, max_entries=DEFAULT_MAX_ENTRIES * 4):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.evictions = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashed_key(key) + '.cache')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            f = open(path, 'rb')
+            try:
+                stored_key, value = pickle.load(f)
+            finally:
+                f.close()
+        except (IOError, EOFError, pickle.UnpicklingError, ValueError):
+            return None
+        if stored_key != key: # digest collision, treat as a miss
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return value
+
+    def set(self, key, value):
+        path = self._path(key)
+        tmp_path = '%s.%d.%s.tmp' % (path, os.getpid(),
+                                     threading.currentThread().getName())
+        f = open(tmp_path, 'wb')
+        try:
+            try:
+                pickle.dump((key, value), f, pickle.HIGHEST_PROTOCOL)
+            finally:
+                f.close()
+        except:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        os.rename(tmp_path, path)
+        self._evict()
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _entries(self):
+        return [os.path.join(self.directory, name)
+                for name in os.listdir(self.directory)
+                if name.endswith('.cache')]
+
+    def _evict(self):
+        entries = self._entries()
+        overflow = len(entries) - self.max_entries
+        if overflow <= 0:
+            return
+        entries.sort(key=lambda path: os.path.getmtime(path))
+        for path in entries[:overflow]:
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except OSError:
+                pass
+
+    def __len__(self):
+        return len(self._entries())
+
+
+class LocalMemcache(object):
+    """
+    In-process stand-in for the memcache client API (get/set/delete with a
+    time argument), for running the memcache backend away from App Engine.
+
+    """
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        self._lock.acquire()
+        try:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires and expires < _now():
+                del self._data[key]
+                return None
+            return value
+        finally:
+            self._lock.release()
+
+    def set(self, key, value, time=0):
+        if time:
+            expires = _now() + time
+        else:
+            expires = 0
+        self._lock.acquire()
+        try:
+            self._data[key] = (expires, value)
+        finally:
+            self._lock.release()
+        return True
+
+    def delete(self, key):
+        self._lock.acquire()
+        try:
+            self._data.pop(key, None)
+        finally:
+            self._lock.release()
+        return 2
+
+
+class MemcacheBackend(object):
+    """
+    Adapts a memcache-compatible client. Memcache does its own LRU eviction,
+    so we just pass our expiry through as the item lifetime.
+
+    """
+    def __init__(self, client=None, namespace='janey:'):
+        if client is None:
+            client = LocalMemcache()
+        self.client = client
+        self.namespace = namespace
+        self.evictions = 0
+
+    def _key(self, key):
+        return self.namespace + hashed_key(key)
+
+    def get(self, key):
+        item = self.client.get(self._key(key))
+        if item is None:
+            return None
+        stored_key, value = item
+        if stored_key != key:
+            return None
+        return value
+
+    def set(self, key, value):
+        expires = value[0]
+        lifetime = max(1, int(expires - _now()) + 1)
+        self.client.set(self._key(key), (key, value), time=lifetime)
+
+    def delete(self, key):
+        self.client.delete(self._key(key))
+
+
+class QueryCache(object):
+    """
+    TTL cache over a pluggable backend, counting hits and misses.
+
+    Backends store (expiry time, value, fresh until) tuples and know nothing
+    about time beyond dropping an entry after its expiry time. An entry is
+    fresh for ttl seconds and then kept stale for stale_ttl more, get()
+    reports stale entries as misses but get_stale() still returns them, for
+    when the upstream is down and an old answer beats no answer.
+
+    """
+    def __init__(self, backend=None, ttl=DEFAULT_TTL, stale_ttl=0):
+        if backend is None:
+            backend = MemoryBackend()
+        self.backend = backend
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.stale_hits = 0
+
+    def get(self, key):
+        item = self.backend.get(key)
+        if item is not None:
+            expires, value, fresh_until = item
+            now = _now()
+            if fresh_until >= now:
+                self.hits += 1
+                return value
+            if expires < now:
+                self.backend.delete(key)
+            self.expired += 1
+        self.misses += 1
+        return None
+
+    def get_stale(self, key):
+        """
+        Returns the value for key whether it is fresh or stale, or None.
+
+        """
+        item = self.backend.get(key)
+        if item is not None:
+            expires, value, fresh_until = item
+            if expires >= _now():
+                self.stale_hits += 1
+                return value
+            self.backend.delete(key)
+        return None
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.ttl
+        fresh_until = _now() + ttl
+        self.backend.set(key, (fresh_until + self.stale_ttl, value,
+                               fresh_until))
+
+    def delete(self, key):
+        self.backend.delete(key)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        if lookups:
+            hit_rate = float(self.hits) / lookups
+        else:
+            hit_rate = 0.0
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'expired': self.expired,
+                'stale_hits': self.stale_hits,
+                'evictions': getattr(self.backend, 'evictions', 0),
+                'hit_rate': hit_rate}
@@ -0,0 +1,118 @@
+"""Unit tests for the jane_cache module."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import jane_cache
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestQueryCache(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.real_now = jane_cache._now
+        jane_cache._now = self.clock
+
+    def tearDown(self):
+        jane_cache._now = self.real_now
+
+    def testHitAndMiss(self):
+        cache = jane_cache.QueryCache(ttl=10)
+        self.assertEqual(None, cache.get('a'))
+        cache.set('a', 'journals')
+        self.assertEqual('journals', cache.get('a'))
+        stats = cache.stats()
+        self.assertEqual(1, stats['hits'])
+        self.assertEqual(1, stats['misses'])
+        self.assertEqual(0.5, stats['hit_rate'])
+
+    def testExpiry(self):
+        cache = jane_cache.QueryCache(ttl=10)
+        cache.set('a', 'journals')
+        self.clock.now += 11
+        self.assertEqual(None, cache.get('a'))
+        self.assertEqual(1, cache.stats()['expired'])
+        self.assertEqual(0, len(cache.backend))
+
+    def testStaleEntries(self):
+        cache = jane_cache.QueryCache(ttl=10, stale_ttl=20)
+        cache.set('a', 'journals')
+        self.clock.now += 11
+        self.assertEqual(None, cache.get('a'))
+        self.assertEqual('journals', cache.get_stale('a'))
+        self.clock.now += 20
+        self.assertEqual(None, cache.get_stale('a'))
+        self.assertEqual(0, len(cache.backend))
+        self.assertEqual(1, cache.stats()['stale_hits'])
+
+    def testLRUEvictionByEntries(self):
+        backend = jane_cache.MemoryBackend(max_entries=2)
+        cache = jane_cache.QueryCache(backend)
+        cache.set('a', '1')
+        cache.set('b', '2')
+        cache.get('a') # b is now the least recently used
+        cache.set('c', '3')
+        self.assertEqual('1', cache.get('a'))
+        self.assertEqual(None, cache.get('b'))
+        self.assertEqual('3', cache.get('c'))
+        self.assertEqual(1, backend.evictions)
+
+    def testLRUEvictionByBytes(self):
+        backend = jane_cache.MemoryBackend(max_bytes=10)
+        cache = jane_cache.QueryCache(backend)
+        cache.set('a', 'x' * 6)
+        cache.set('b', 'y' * 6)
+        self.assertEqual(None, cache.get('a'))
+        self.assertEqual(6, backend.bytes)
+        cache.set('c', 'z' * 11) # never fits
+        self.assertEqual(None, cache.get('c'))
+
+    def testDiskBackend(self):
+        directory = tempfile.mkdtemp()
+        try:
+            backend = jane_cache.DiskBackend(directory, max_entries=2)
+            cache = jane_cache.QueryCache(backend, ttl=10)
+            cache.set('a', '1')
+            cache.set('b', '2')
+            cache.set('c', '3')
+            self.assertEqual(2, len(backend))
+            self.assertEqual('3', cache.get('c'))
+            reopened = jane_cache.QueryCache(
+                jane_cache.DiskBackend(directory), ttl=10)
+            self.assertEqual('3', reopened.get('c'))
+        finally:
+            shutil.rmtree(directory)
+
+    def testDiskBackendFailedWriteLeavesNoFile(self):
+        directory = tempfile.mkdtemp()
+        try:
+            backend = jane_cache.DiskBackend(directory)
+            self.assertRaises(jane_cache.pickle.PicklingError,
+                              backend.set, 'a', lambda: None)
+            self.assertEqual([], os.listdir(directory))
+        finally:
+            shutil.rmtree(directory)
+
+    def testMemcacheBackend(self):
+        cache = jane_cache.QueryCache(jane_cache.MemcacheBackend(), ttl=10)
+        cache.set('http://biosemantics.org:8080/jane/journals?text=x', '1')
+        self.assertEqual(
+            '1', cache.get('http://biosemantics.org:8080/jane/journals?text=x'))
+        self.clock.now += 20
+        self.assertEqual(
+            None, cache.get('http://biosemantics.org:8080/jane/journals?text=x'))
+
+
+if __name__ == '__main__':
+    unittest.main()
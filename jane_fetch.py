@@ -0,0 +1,435 @@
+"""
+Resilient calls to the JANE backend.
+
+JANE is a single upstream, and when it slows down every blip waiting on it
+slows down with it. ResilientFetcher wraps each call to it with:
+
+    LatencyHistogram - per command latencies, from which the timeout (a
+                       multiple of the p99) and hedge delay are derived
+    hedging          - a duplicate request once the first has taken longer
+                       than the hedge percentile, first answer wins
+    retries          - a few more attempts after a transport error,
+                       timeout or 5xx, spaced by exponential backoff with
+                       full jitter
+    CircuitBreaker   - stops calling JANE for a while after repeated
+                       failures of that kind, so callers can fall back to
+                       stale answers
+
+A RejectedError, e.g. for a 4xx answer, is passed straight to the caller:
+asking again would get the same answer, and JANE was up to give it.
+
+SingleFlight sits in front of all that and lets identical calls made at
+the same time share one.
+
+"""
+import bisect
+import httplib
+import logging
+import Queue
+import random
+import threading
+import time
+
+import jane_http
+import jane_tasks
+
+logger = logging.getLogger('janey-robot')
+
+# bucket upper bounds in seconds, roughly 25% apart from 5ms to 60s
+LATENCY_BUCKETS = [0.005 * 1.25 ** i for i in range(43)]
+DEFAULT_TIMEOUT = 10.0 # seconds, used until there are enough samples
+MIN_TIMEOUT = 1.0
+MAX_TIMEOUT = 30.0
+TIMEOUT_MULTIPLIER = 2.0 # timeout = observed p99 * this
+MIN_SAMPLES = 20 # latencies needed before the histogram is trusted
+HEDGE_PERCENTILE = 95
+MAX_RETRIES = 2
+RETRY_BACKOFF = 0.1 # seconds, doubled for each retry
+FAILURE_THRESHOLD = 5 # failed calls in a row that open the circuit
+RESET_TIMEOUT = 30 # seconds the circuit stays open
+
+
+class FetchError(Exception):
+    """
+    Raised when a call to the backend fails or times out.
+
+    """
+    pass
+
+
+class CircuitOpenError(FetchError):
+    """
+    Raised instead of calling a backend whose circuit is open.
+
+    """
+    pass
+
+
+class RejectedError(FetchError):
+    """
+    Raised when the backend answered but refused the request, e.g. with a
+    4xx status. It is not retried and does not count against the circuit.
+
+    """
+    pass
+
+
+# What a failed attempt may raise for it to be retried and counted as a
+# failure by the circuit breaker: transport errors (socket errors are
+# IOErrors), timeouts and FetchError, which janey raises for a 5xx.
+RETRYABLE_ERRORS = (FetchError, EnvironmentError, httplib.HTTPException,
+                    jane_http.PoolError)
+
+
+class LatencyHistogram(object):
+    """
+    Counts latencies in exponentially sized buckets, so percentiles can be
+    read back in constant memory. A percentile is reported as the upper
+    bound of the bucket it falls in, i.e. rounded up by at most 25%.
+
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # the last one is overflow
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        self._lock.acquire()
+        try:
+            self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            self.count += 1
+            self.total += seconds
+        finally:
+            self._lock.release()
+
+    def percentile(self, p):
+        """
+        Returns the latency below which p percent of the recorded ones fall,
+        or None if nothing has been recorded.
+
+        """
+        self._lock.acquire()
+        try:
+            if not self.count:
+                return None
+            rank = self.count * p / 100.0
+            seen = 0
+            for i, count in enumerate(self.counts):
+                seen += count
+                if seen >= rank and count:
+                    break
+        finally:
+            self._lock.release()
+        if i == len(self.buckets):
+            return self.buckets[-1]
+        return self.buckets[i]
+
+    def mean(self):
+        if not self.count:
+            return None
+        return self.total / self.count
+
+
+class CircuitBreaker(object):
+    """
+    Closed while calls succeed. After failure_threshold failures in a row
+    it opens and allow() refuses calls for reset_timeout seconds, then lets
+    a single trial call through (half open): success closes the circuit
+    again, failure opens it for another reset_timeout.
+
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD,
+                 reset_timeout=RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        self._lock.acquire()
+        try:
+            if self.state == self.CLOSED:
+                return True
+            if (self.state == self.OPEN and
+                time.time() - self.opened_at >= self.reset_timeout):
+                self.state = self.HALF_OPEN
+                return True # the trial call
+            return False
+        finally:
+            self._lock.release()
+
+    def record_success(self):
+        self._lock.acquire()
+        try:
+            self.state = self.CLOSED
+            self.failures = 0
+        finally:
+            self._lock.release()
+
+    def record_failure(self):
+        self._lock.acquire()
+        try:
+            self.failures += 1
+            if (self.state == self.HALF_OPEN or
+                self.failures >= self.failure_threshold):
+                if self.state != self.OPEN:
+                    logger.warning('circuit opened after %d failures',
+                                   self.failures)
+                self.state = self.OPEN
+                self.opened_at = time.time()
+        finally:
+            self._lock.release()
+
+
+class ResilientFetcher(object):
+    """
+    Makes calls to one backend through a circuit breaker, with adaptive
+    timeouts, retries and, if hedge is on, hedged requests. Latencies are
+    kept per key (janey uses the command name), since a graph query and a
+    journals query take very different times.
+
+    A call is a function taking a timeout in seconds, it should give up by
+    raising once that has passed. Hedging runs attempts on worker threads,
+    so it is off unless asked for.
+
+    """
+    def __init__(self, hedge=False, workers=4, max_retries=MAX_RETRIES,
+                 breaker=None):
+        self.hedge = hedge
+        self.max_retries = max_retries
+        if breaker is None:
+            breaker = CircuitBreaker()
+        self.breaker = breaker
+        self.histograms = {}
+        self.calls = 0
+        self.retries = 0
+        self.hedges = 0
+        self.timeouts = 0
+        self._workers = workers
+        self._queue = None
+        self._lock = threading.Lock()
+
+    def histogram(self, key):
+        self._lock.acquire()
+        try:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = LatencyHistogram()
+            return histogram
+        finally:
+            self._lock.release()
+
+    def timeout_for(self, key):
+        """
+        A multiple of the key's p99 latency, clamped to [MIN_TIMEOUT,
+        MAX_TIMEOUT], or DEFAULT_TIMEOUT until there are enough samples.
+
+        """
+        histogram = self.histogram(key)
+        if histogram.count < MIN_SAMPLES:
+            return DEFAULT_TIMEOUT
+        timeout = histogram.percentile(99) * TIMEOUT_MULTIPLIER
+        return min(MAX_TIMEOUT, max(MIN_TIMEOUT, timeout))
+
+    def hedge_delay_for(self, key):
+        """
+        How long to wait on the first attempt before sending a duplicate,
+        or None if no duplicate should be sent.
+
+        """
+        histogram = self.histogram(key)
+        if not self.hedge or histogram.count < MIN_SAMPLES:
+            return None
+        return histogram.percentile(HEDGE_PERCENTILE)
+
+    def call(self, key, func):
+        """
+        Returns what func(timeout) returns. Raises CircuitOpenError without
+        calling func if the circuit is open, and FetchError (or whatever
+        func raised) once every attempt has failed.
+
+        Only RETRYABLE_ERRORS are retried and recorded as failures. Anything
+        else, a RejectedError or e.g. a parse error, is raised at once; the
+        backend did answer, so the breaker counts it as a success.
+
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError('circuit open for %s' % key)
+        self.calls += 1
+        attempt = 0
+        while True:
+            try:
+                value = self._attempt(key, func)
+            except Exception, e:
+                if (isinstance(e, RejectedError) or
+                    not isinstance(e, RETRYABLE_ERRORS)):
+                    self.breaker.record_success()
+                    raise
+                if attempt >= self.max_retries or not self.breaker.allow():
+                    self.breaker.record_failure()
+                    raise
+                logger.debug('retrying %s after %s', key, e)
+                attempt += 1
+                self.retries += 1
+                time.sleep(random.uniform(0, RETRY_BACKOFF * 2 ** attempt))
+            else:
+                self.breaker.record_success()
+                return value
+
+    def _attempt(self, key, func):
+        timeout = self.timeout_for(key)
+        hedge_delay = self.hedge_delay_for(key)
+        if hedge_delay is None:
+            start = time.time()
+            value = func(timeout)
+            self.histogram(key).record(time.time() - start)
+            return value
+        return self._hedged(key, func, timeout, hedge_delay)
+
+    def _hedged(self, key, func, timeout, hedge_delay):
+        """
+        Runs func on a worker and, if it hasn't answered within hedge_delay,
+        a second copy alongside it. The first success wins; the slower copy
+        is left to finish on its own and its answer dropped.
+
+        """
+        answers = Queue.Queue()
+        histogram = self.histogram(key)
+
+        def run():
+            start = time.time()
+            try:
+                value = func(timeout)
+            except Exception, e:
+                answers.put((e, None))
+            else:
+                histogram.record(time.time() - start)
+                answers.put((None, value))
+
+        queue = self._task_queue()
+        queue.add(run)
+        launched = 1
+        failed = 0
+        start = time.time()
+        deadline = start + timeout
+        hedge_at = start + hedge_delay
+        while True:
+            if hedge_at is not None:
+                wait = hedge_at - time.time()
+            else:
+                wait = deadline - time.time()
+            try:
+                error, value = answers.get(True, max(0, wait))
+            except Queue.Empty:
+                if hedge_at is not None:
+                    hedge_at = None
+                    self.hedges += 1
+                    queue.add(run)
+                    launched += 1
+                    continue
+                self.timeouts += 1
+                raise FetchError('%s timed out after %.2fs' % (key, timeout))
+            if error is None:
+                return value
+            failed += 1
+            if failed == launched: # nothing left in flight
+                raise error
+
+    def _task_queue(self):
+        self._lock.acquire()
+        try:
+            if self._queue is None:
+                self._queue = jane_tasks.LocalTaskQueue(workers=self._workers)
+            return self._queue
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        """
+        Counters plus the p50/p99 latency and current timeout of each key.
+
+        """
+        latencies = {}
+        for key, histogram in self.histograms.items():
+            latencies[key] = {'count': histogram.count,
+                              'p50': histogram.percentile(50),
+                              'p99': histogram.percentile(99),
+                              'timeout': self.timeout_for(key)}
+        return {'calls': self.calls,
+                'retries': self.retries,
+                'hedges': self.hedges,
+                'timeouts': self.timeouts,
+                'circuit': self.breaker.state,
+                'latencies': latencies}
+
+
+class _Flight(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight(object):
+    """
+    Coalesces concurrent calls with the same key: the first caller runs
+    the function, anyone asking for the same key before it returns waits
+    for it and gets the same value, or has the same exception raised. A
+    call made after that starts a new flight, caching is left to the
+    caller.
+
+    """
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args, **kwargs):
+        self._lock.acquire()
+        try:
+            self.calls += 1
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                flight.waiters += 1
+                leader = False
+            else:
+                flight = self._flights[key] = _Flight()
+                leader = True
+        finally:
+            self._lock.release()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            try:
+                flight.value = func(*args, **kwargs)
+            except Exception, e:
+                flight.error = e
+                raise
+        finally:
+            self._lock.acquire()
+            try:
+                del self._flights[key]
+            finally:
+                self._lock.release()
+            flight.done.set()
+        return flight.value
+
+    def in_flight(self):
+        return len(self._flights)
@@ -0,0 +1,189 @@
+"""Unit tests for the jane_fetch module."""
+
+import threading
+import time
+import unittest
+
+import jane_fetch
+
+
+class TestLatencyHistogram(unittest.TestCase):
+
+    def testPercentiles(self):
+        histogram = jane_fetch.LatencyHistogram()
+        self.assertEqual(None, histogram.percentile(50))
+        for i in range(99):
+            histogram.record(0.1)
+        histogram.record(2.0)
+        self.assertTrue(0.1 <= histogram.percentile(50) < 0.125)
+        self.assertTrue(0.1 <= histogram.percentile(99) < 0.125)
+        self.assertTrue(2.0 <= histogram.percentile(100) < 2.5)
+        histogram.record(1000)
+        self.assertEqual(histogram.buckets[-1], histogram.percentile(100))
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def testOpensAndRecovers(self):
+        breaker = jane_fetch.CircuitBreaker(failure_threshold=2,
+                                            reset_timeout=0.05)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow()) # the trial call
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.CLOSED, breaker.state)
+
+
+class TestResilientFetcher(unittest.TestCase):
+
+    def setUp(self):
+        self.real_backoff = jane_fetch.RETRY_BACKOFF
+        jane_fetch.RETRY_BACKOFF = 0
+
+    def tearDown(self):
+        jane_fetch.RETRY_BACKOFF = self.real_backoff
+
+    def testRetries(self):
+        fetcher = jane_fetch.ResilientFetcher(max_retries=2)
+        attempts = []
+        def flaky(timeout):
+            attempts.append(timeout)
+            if len(attempts) < 3:
+                raise IOError('reset')
+            return 'journals'
+        self.assertEqual('journals', fetcher.call('journals', flaky))
+        self.assertEqual([jane_fetch.DEFAULT_TIMEOUT] * 3, attempts)
+        self.assertEqual(2, fetcher.retries)
+
+    def testCircuitOpensAfterFailures(self):
+        breaker = jane_fetch.CircuitBreaker(failure_threshold=2)
+        fetcher = jane_fetch.ResilientFetcher(max_retries=0, breaker=breaker)
+        def down(timeout):
+            raise IOError('refused')
+        self.assertRaises(IOError, fetcher.call, 'journals', down)
+        self.assertRaises(IOError, fetcher.call, 'journals', down)
+        self.assertRaises(jane_fetch.CircuitOpenError, fetcher.call,
+                          'journals', lambda timeout: 'journals')
+
+    def testRejectedIsNotRetried(self):
+        breaker = jane_fetch.CircuitBreaker(failure_threshold=1)
+        fetcher = jane_fetch.ResilientFetcher(max_retries=2, breaker=breaker)
+        attempts = []
+        def not_found(timeout):
+            attempts.append(timeout)
+            raise jane_fetch.RejectedError('JANE answered 404 Not Found')
+        self.assertRaises(jane_fetch.RejectedError, fetcher.call, 'journals',
+                          not_found)
+        self.assertEqual(1, len(attempts))
+        self.assertEqual(0, fetcher.retries)
+        self.assertEqual(jane_fetch.CircuitBreaker.CLOSED, breaker.state)
+        self.assertEqual(0, breaker.failures)
+
+    def testOtherErrorsAreNotRetried(self):
+        breaker = jane_fetch.CircuitBreaker(failure_threshold=1)
+        fetcher = jane_fetch.ResilientFetcher(max_retries=2, breaker=breaker)
+        attempts = []
+        def broken(timeout):
+            attempts.append(timeout)
+            raise KeyError('rank')
+        self.assertRaises(KeyError, fetcher.call, 'journals', broken)
+        self.assertEqual(1, len(attempts))
+        self.assertEqual(jane_fetch.CircuitBreaker.CLOSED, breaker.state)
+
+    def testServerErrorsAreRetried(self):
+        breaker = jane_fetch.CircuitBreaker(failure_threshold=1)
+        fetcher = jane_fetch.ResilientFetcher(max_retries=2, breaker=breaker)
+        attempts = []
+        def unavailable(timeout):
+            attempts.append(timeout)
+            raise jane_fetch.FetchError('JANE answered 503 Unavailable')
+        self.assertRaises(jane_fetch.FetchError, fetcher.call, 'journals',
+                          unavailable)
+        self.assertEqual(3, len(attempts))
+        self.assertEqual(jane_fetch.CircuitBreaker.OPEN, breaker.state)
+
+    def testAdaptiveTimeout(self):
+        fetcher = jane_fetch.ResilientFetcher()
+        for i in range(jane_fetch.MIN_SAMPLES):
+            fetcher.histogram('graph').record(2.0)
+        self.assertEqual(jane_fetch.DEFAULT_TIMEOUT,
+                         fetcher.timeout_for('journals'))
+        timeout = fetcher.timeout_for('graph')
+        self.assertTrue(4.0 <= timeout <= 5.0)
+
+    def testHedgedRequestWins(self):
+        fetcher = jane_fetch.ResilientFetcher(hedge=True)
+        for i in range(jane_fetch.MIN_SAMPLES):
+            fetcher.histogram('journals').record(0.01)
+        release = threading.Event()
+        calls = []
+        def slow_then_fast(timeout):
+            calls.append(timeout)
+            if len(calls) == 1:
+                release.wait(5) # stuck until the test ends
+                return 'slow'
+            return 'fast'
+        try:
+            self.assertEqual('fast', fetcher.call('journals', slow_then_fast))
+        finally:
+            release.set()
+        self.assertEqual(1, fetcher.hedges)
+        self.assertEqual(2, len(calls))
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def run_together(self, flights, func, callers=4):
+        """
+        Starts callers threads calling func through flights, lets func
+        return once they are all in, and returns what each got.
+
+        """
+        release = threading.Event()
+        def blocked():
+            release.wait(5)
+            return func()
+        outcomes = []
+        def caller():
+            try:
+                outcomes.append(('value', flights.do('malaria', blocked)))
+            except Exception, e:
+                outcomes.append(('error', e))
+        threads = [threading.Thread(target=caller) for i in range(callers)]
+        for thread in threads:
+            thread.start()
+        while flights.calls < callers:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+        return outcomes
+
+    def testConcurrentCallsShareOneResult(self):
+        flights = jane_fetch.SingleFlight()
+        calls = []
+        def fetch():
+            calls.append(1)
+            return ['journal']
+        outcomes = self.run_together(flights, fetch)
+        self.assertEqual(1, len(calls))
+        self.assertEqual(3, flights.coalesced)
+        self.assertEqual(1, len(set([id(value) for kind, value in outcomes])))
+        self.assertEqual(0, flights.in_flight())
+        flights.do('malaria', fetch)
+        self.assertEqual(2, len(calls))
+
+    def testErrorsReachEveryWaiter(self):
+        flights = jane_fetch.SingleFlight()
+        def fetch():
+            raise jane_fetch.FetchError('down')
+        outcomes = self.run_together(flights, fetch, callers=3)
+        self.assertEqual(['error'] * 3, [kind for kind, value in outcomes])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+"""
+Synthetic JANE responses for tests and scale benchmarks.
+
+FixtureGenerator makes up journals, articles and authors responses shaped
+like the real ones, at anything from a handful to 100,000 records. Authors
+are drawn from a fixed pool with a Zipf distribution, so as in real
+literature a few authors turn up on many articles and most on one or two,
+which is what drives the size of the co-authorship graphs.
+
+Record i of a response only depends on the seed and i, so slicing a large
+response by count and offset gives the same records as asking for the
+slice directly.
+
+"""
+import bisect
+import hashlib
+import random
+from xml.sax.saxutils import escape
+
+DEFAULT_AUTHOR_POOL = 5000
+DEFAULT_ZIPF = 0.8
+DEFAULT_EVIDENCE = 3 # articles in each author's evidence
+AUTHORS_PER_ARTICLE = [1, 2, 2, 3, 3, 3, 4, 4, 4, 5, 5, 6, 7, 8, 12]
+
+FIRST_NAMES = 'A B C D E F G H J K L M N P R S T W Y'.split()
+SURNAMES = ('Smith Jones Wu Garcia Li Kumar Muller Rossi Tanaka Nguyen Kim '
+            'Silva Novak Cohen Dubois Ivanov Larsen Okafor Patel Santos '
+            'Schmidt Wang Zhang Chen Brown Taylor Wilson Martin Lee Moreau'
+            ).split()
+TITLE_WORDS = ('malaria vaccine plasmodium falciparum antigen cohort trial '
+               'randomized children efficacy immune response protein '
+               'expression resistance drug mosquito transmission clinical '
+               'study analysis genome infection model population').split()
+JOURNAL_WORDS = ('Journal Reviews Letters Research Medicine Biology '
+                 'Immunology Parasitology Tropical Infectious Diseases '
+                 'Vaccine Clinical Molecular International').split()
+
+
+def xmlDocument(body):
+    return '<?xml version="1.0" encoding="UTF-8"?><results>%s</results>' % body
+
+
+class FixtureGenerator(object):
+    """
+    Makes up JANE responses. author_pool is the number of distinct authors
+    and zipf the exponent of their popularity, the higher the more the
+    articles share the same few authors.
+
+    """
+    def __init__(self, seed=0, author_pool=DEFAULT_AUTHOR_POOL,
+                 zipf=DEFAULT_ZIPF):
+        self.seed = seed
+        self.author_pool = author_pool
+        self._cumulative = []
+        total = 0.0
+        for k in xrange(author_pool):
+            total += 1.0 / (k + 1) ** zipf
+            self._cumulative.append(total)
+
+    def _random(self, kind, i):
+        key = '%s:%s:%d' % (self.seed, kind, i)
+        return random.Random(int(hashlib.md5(key).hexdigest()[:15], 16))
+
+    def authorName(self, k):
+        """
+        The name of author k of the pool.
+
+        """
+        return '%s %s%s' % (SURNAMES[k % len(SURNAMES)],
+                            FIRST_NAMES[k // len(SURNAMES) % len(FIRST_NAMES)],
+                            k // (len(SURNAMES) * len(FIRST_NAMES)) or '')
+
+    def _drawAuthors(self, rng, count):
+        total = self._cumulative[-1]
+        authors = []
+        while len(authors) < count:
+            k = bisect.bisect_left(self._cumulative, rng.random() * total)
+            if k not in authors:
+                authors.append(k)
+        return authors
+
+    def article(self, i, include_author=None):
+        """
+        The XML for article i, as it appears at rank i + 1.
+
+        """
+        rng = self._random('article', i)
+        count = min(rng.choice(AUTHORS_PER_ARTICLE), self.author_pool)
+        authors = self._drawAuthors(rng, count)
+        if include_author is not None and include_author not in authors:
+            authors[rng.randrange(len(authors))] = include_author
+        title = ' '.join([rng.choice(TITLE_WORDS)
+                          for w in range(rng.randint(4, 12))])
+        author_tags = ''.join(['<author>%s</author>' %
+                               escape(self.authorName(k)) for k in authors])
+        return ('<article rank="%d" score="%d"><title>%s</title>'
+                '<pmid>%d</pmid><year>%d</year><authors>%s</authors>'
+                '</article>' % (i + 1, 1000000 - i, escape(title.capitalize()),
+                                10000000 + i, rng.randint(1970, 2009),
+                                author_tags))
+
+    def articles(self, count, offset=0):
+        """
+        An articles response holding count articles from offset on.
+
+        """
+        return xmlDocument('\n'.join([self.article(i) for i in
+                                      xrange(offset, offset + count)]))
+
+    def journals(self, count):
+        """
+        A journals response holding count journals.
+
+        """
+        journals = []
+        for i in xrange(count):
+            rng = self._random('journal', i)
+            name = ' '.join(rng.sample(JOURNAL_WORDS, rng.randint(2, 4)))
+            journals.append('<journal rank="%d" score="%d"><journalname>%s'
+                            '</journalname></journal>' % (i + 1, 100000 - i,
+                                                          escape(name)))
+        return xmlDocument('\n'.join(journals))
+
+    def authors(self, count, evidence=DEFAULT_EVIDENCE):
+        """
+        An authors response holding count metric/name/evidence triplets,
+        each author's evidence being evidence articles they wrote. Names
+        start repeating after author_pool authors.
+
+        """
+        triplets = []
+        for i in xrange(count):
+            k = i % self.author_pool
+            articles = [self.article(i * evidence + j, include_author=k)
+                        for j in xrange(evidence)]
+            triplets.append('<author rank="%d" score="%d"/><name>%s</name>'
+                            '<evidence>%s</evidence>' % (i + 1, 100000 - i,
+                            escape(self.authorName(k)), ''.join(articles)))
+        return xmlDocument('\n'.join(triplets))
+
+    def response(self, endpoint, count, offset=0):
+        if endpoint == 'journals':
+            return self.journals(count)
+        if endpoint == 'authors':
+            return self.authors(count)
+        return self.articles(count, offset)
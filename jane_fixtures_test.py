@@ -0,0 +1,62 @@
+"""Unit tests for the jane_fixtures module."""
+
+import unittest
+from xml.dom import minidom
+
+import jane_fixtures
+
+
+class TestFixtureGenerator(unittest.TestCase):
+
+    def setUp(self):
+        self.generator = jane_fixtures.FixtureGenerator(seed=1)
+
+    def testArticles(self):
+        document = minidom.parseString(self.generator.articles(50))
+        articles = document.getElementsByTagName('article')
+        self.assertEqual(50, len(articles))
+        self.assertEqual('1', articles[0].getAttribute('rank'))
+        for tag in ('title', 'pmid', 'year', 'authors'):
+            self.assertEqual(1, len(articles[0].getElementsByTagName(tag)))
+
+    def testSlicesMatch(self):
+        whole = self.generator.articles(30)
+        part = self.generator.articles(10, offset=20)
+        self.assertTrue(part.split('<results>')[1].split('</results>')[0]
+                        in whole)
+        self.assertEqual(whole, jane_fixtures.FixtureGenerator(seed=1)
+                         .articles(30))
+        self.assertNotEqual(whole, jane_fixtures.FixtureGenerator(seed=2)
+                            .articles(30))
+
+    def testAuthorOverlapIsSkewed(self):
+        document = minidom.parseString(self.generator.articles(500))
+        counts = {}
+        for author in document.getElementsByTagName('author'):
+            name = author.firstChild.data
+            counts[name] = counts.get(name, 0) + 1
+        ordered = sorted(counts.values(), reverse=True)
+        self.assertTrue(ordered[0] >= 10 * ordered[len(ordered) // 2])
+
+    def testAuthorTriplets(self):
+        document = minidom.parseString(self.generator.authors(5, evidence=2))
+        children = [node for node in document.documentElement.childNodes
+                    if node.nodeType == node.ELEMENT_NODE]
+        self.assertEqual(['author', 'name', 'evidence'] * 5,
+                         [node.tagName for node in children])
+        for metric, name, evidence in zip(children[0::3], children[1::3],
+                                          children[2::3]):
+            articles = evidence.getElementsByTagName('article')
+            self.assertEqual(2, len(articles))
+            for article in articles:
+                names = [author.firstChild.data for author in
+                         article.getElementsByTagName('author')]
+                self.assertTrue(name.firstChild.data in names)
+
+    def testJournals(self):
+        document = minidom.parseString(self.generator.journals(7))
+        self.assertEqual(7, len(document.getElementsByTagName('journalname')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,239 @@
+"""
+Weighted co-authorship graph engine.
+
+Nodes are integer ids 0..n-1 (positions in whatever list the caller built
+the graph from) and edges live in parallel array.array columns, so even a
+graph over several thousand articles is a handful of flat int arrays rather
+than string-keyed dicts or DOT text. Rendering limits are applied by the
+caller after the full graph has been computed.
+
+"""
+import array
+import bisect
+import heapq
+
+
+def _ints(values=()):
+    return array.array('i', values)
+
+
+class CoauthorshipGraph(object):
+    """
+    Undirected weighted graph stored as an edge list: edge k joins
+    sources[k] and targets[k] (sources[k] < targets[k]) with weight
+    weights[k], the number of authors two articles share or the number of
+    articles two authors wrote together.
+
+    """
+    def __init__(self, node_count):
+        self.node_count = node_count
+        self.sources = _ints()
+        self.targets = _ints()
+        self.weights = _ints()
+        self.degrees = _ints([0]) * node_count
+        self.strengths = _ints([0]) * node_count # sum of edge weights
+        self._adjacency = None
+
+    def addEdge(self, source, target, weight=1):
+        self.sources.append(source)
+        self.targets.append(target)
+        self.weights.append(weight)
+        self.degrees[source] += 1
+        self.degrees[target] += 1
+        self.strengths[source] += weight
+        self.strengths[target] += weight
+        self._adjacency = None
+
+    def edgeCount(self):
+        return len(self.sources)
+
+    def edges(self):
+        """
+        Yields (source, target, weight) for every edge in insertion order.
+
+        """
+        for k in xrange(len(self.sources)):
+            yield self.sources[k], self.targets[k], self.weights[k]
+
+    def adjacency(self):
+        """
+        Returns the graph in compressed sparse row form as (offsets,
+        neighbours, weights): the neighbours of node i are
+        neighbours[offsets[i]:offsets[i + 1]], with matching weights.
+
+        """
+        if self._adjacency is not None:
+            return self._adjacency
+        n = self.node_count
+        offsets = _ints([0]) * (n + 1)
+        for i in xrange(n):
+            offsets[i + 1] = offsets[i] + self.degrees[i]
+        fill = _ints(offsets[:n])
+        neighbours = _ints([0]) * (2 * len(self.sources))
+        weights = _ints([0]) * (2 * len(self.sources))
+        for source, target, weight in self.edges():
+            neighbours[fill[source]] = target
+            weights[fill[source]] = weight
+            fill[source] += 1
+            neighbours[fill[target]] = source
+            weights[fill[target]] = weight
+            fill[target] += 1
+        self._adjacency = (offsets, neighbours, weights)
+        return self._adjacency
+
+    def neighbours(self, node):
+        offsets, neighbours, weights = self.adjacency()
+        start, end = offsets[node], offsets[node + 1]
+        return zip(neighbours[start:end], weights[start:end])
+
+    def components(self):
+        """
+        Returns a list of connected components, largest first, each a sorted
+        list of node ids. Isolated nodes are components of their own.
+
+        """
+        parent = _ints(xrange(self.node_count))
+
+        def find(node):
+            while parent[node] != node:
+                parent[node] = parent[parent[node]] # path halving
+                node = parent[node]
+            return node
+
+        for source, target, weight in self.edges():
+            a, b = find(source), find(target)
+            if a != b:
+                if a < b:
+                    parent[b] = a
+                else:
+                    parent[a] = b
+        groups = {}
+        for node in xrange(self.node_count):
+            groups.setdefault(find(node), []).append(node)
+        components = groups.values()
+        components.sort(key=lambda members: (-len(members), members[0]))
+        return components
+
+    def degreeCentrality(self):
+        """
+        Returns the degree centrality of every node: its degree divided by
+        the largest possible degree, n - 1.
+
+        """
+        if self.node_count < 2:
+            return [0.0] * self.node_count
+        scale = 1.0 / (self.node_count - 1)
+        return [degree * scale for degree in self.degrees]
+
+    def mostConnected(self, n):
+        """
+        Returns the ids of the n nodes with the highest degree, breaking ties
+        on total edge weight and then on the lower id.
+
+        """
+        degrees = self.degrees
+        strengths = self.strengths
+        return heapq.nsmallest(n, xrange(self.node_count),
+                key=lambda node: (-degrees[node], -strengths[node], node))
+
+    def strongestEdges(self, limit):
+        """
+        Returns the indices of the limit heaviest edges, ties going to the
+        edge that was added first.
+
+        """
+        weights = self.weights
+        return heapq.nsmallest(limit, xrange(len(weights)),
+                               key=lambda k: (-weights[k], k))
+
+
+def buildCoauthorshipGraph(memberships):
+    """
+    Builds the graph for a list of author lists, one per node. Two nodes are
+    joined if they share an author, weighted by how many they share.
+
+    Authors are interned to integer ids and indexed to the ascending nodes
+    they appear in, so each node only visits the later nodes of its own
+    authors. Edges are added ordered by source and then target.
+
+    """
+    author_ids = {}
+    postings = []
+    node_authors = []
+    for node, authors in enumerate(memberships):
+        ids = []
+        for author in authors:
+            author_id = author_ids.get(author)
+            if author_id is None:
+                author_id = len(postings)
+                author_ids[author] = author_id
+                postings.append(_ints())
+            nodes = postings[author_id]
+            if nodes and nodes[-1] == node: # listed twice on one node
+                continue
+            nodes.append(node)
+            ids.append(author_id)
+        node_authors.append(ids)
+
+    graph = CoauthorshipGraph(len(node_authors))
+    for source, ids in enumerate(node_authors):
+        shared = {}
+        for author_id in ids:
+            nodes = postings[author_id]
+            for target in nodes[bisect.bisect_right(nodes, source):]:
+                shared[target] = shared.get(target, 0) + 1
+        targets = shared.keys()
+        targets.sort()
+        for target in targets:
+            graph.addEdge(source, target, shared[target])
+    return graph
+
+
+def canonicalAuthorName(name):
+    """
+    The same author can come back spelt with different spacing or case in
+    different evidence articles, these all map to one canonical form.
+
+    """
+    return u' '.join(name.split()).lower()
+
+
+def buildAuthorNetwork(author_lists, canonical=canonicalAuthorName):
+    """
+    Builds the author-author co-authorship graph for a list of author
+    lists, one per article, in a single pass. Two authors are joined if
+    they wrote an article together, weighted by how many they wrote.
+
+    Names are canonicalized and interned to integer ids as they are met,
+    and edges are counted in a dict keyed on (lower id, higher id) pairs,
+    so each pair of authors gives exactly one edge however many articles
+    and spellings it turns up in. Returns (names, graph) where names[i] is
+    the first spelling seen for node i.
+
+    """
+    author_ids = {}
+    names = []
+    pair_weights = {}
+    for authors in author_lists:
+        ids = set()
+        for name in authors:
+            key = canonical(name)
+            author_id = author_ids.get(key)
+            if author_id is None:
+                author_id = len(names)
+                author_ids[key] = author_id
+                names.append(name)
+            ids.add(author_id)
+        ids = sorted(ids)
+        for x in xrange(len(ids)):
+            a = ids[x]
+            for b in ids[x + 1:]:
+                pair = (a, b)
+                pair_weights[pair] = pair_weights.get(pair, 0) + 1
+
+    graph = CoauthorshipGraph(len(names))
+    pairs = pair_weights.keys()
+    pairs.sort()
+    for pair in pairs:
+        graph.addEdge(pair[0], pair[1], pair_weights[pair])
+    return names, graph
@@ -0,0 +1,80 @@
+"""Unit tests for the jane_graph module."""
+
+import unittest
+
+import jane_graph
+
+MEMBERSHIPS = [
+    ['Smith', 'Jones'],          # 0
+    ['Smith', 'Jones', 'Wu'],    # 1
+    ['Wu'],                      # 2
+    ['Garcia'],                  # 3
+    ['Garcia', 'Garcia', 'Li'],  # 4
+    [],                          # 5
+]
+
+
+class TestCoauthorshipGraph(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = jane_graph.buildCoauthorshipGraph(MEMBERSHIPS)
+
+    def testWeightedEdges(self):
+        self.assertEqual([(0, 1, 2), (1, 2, 1), (3, 4, 1)],
+                         list(self.graph.edges()))
+
+    def testComponents(self):
+        self.assertEqual([[0, 1, 2], [3, 4], [5]], self.graph.components())
+
+    def testDegreeCentrality(self):
+        self.assertEqual([0.2, 0.4, 0.2, 0.2, 0.2, 0.0],
+                         self.graph.degreeCentrality())
+
+    def testMostConnected(self):
+        # 0 and 2 have the same degree, 0 wins on edge weight
+        self.assertEqual([1, 0, 2], self.graph.mostConnected(3))
+        self.assertEqual(6, len(self.graph.mostConnected(10)))
+
+    def testStrongestEdges(self):
+        self.assertEqual([0, 1], self.graph.strongestEdges(2))
+        self.assertEqual([0, 1, 2], self.graph.strongestEdges(12))
+
+    def testAdjacency(self):
+        self.assertEqual([(1, 2)], self.graph.neighbours(0))
+        self.assertEqual([(0, 2), (2, 1)], sorted(self.graph.neighbours(1)))
+        self.assertEqual([], self.graph.neighbours(5))
+
+    def testMatchesPairwiseComparison(self):
+        memberships = [['a%d' % ((i * 7 + k) % 23) for k in range(3)]
+                       for i in range(60)]
+        graph = jane_graph.buildCoauthorshipGraph(memberships)
+        expected = []
+        for i in range(len(memberships)):
+            for j in range(i + 1, len(memberships)):
+                shared = len(set(memberships[i]) & set(memberships[j]))
+                if shared:
+                    expected.append((i, j, shared))
+        self.assertEqual(expected, list(graph.edges()))
+
+
+class TestAuthorNetwork(unittest.TestCase):
+
+    def testPairsAreDeduplicated(self):
+        names, graph = jane_graph.buildAuthorNetwork([
+            ['Smith J', 'Jones  K', 'Wu L'],
+            ['smith j', 'Jones K'],
+            ['Wu L', 'Wu L'],
+        ])
+        self.assertEqual(['Smith J', 'Jones  K', 'Wu L'], names)
+        self.assertEqual([(0, 1, 2), (0, 2, 1), (1, 2, 1)],
+                         list(graph.edges()))
+        self.assertEqual([[0, 1, 2]], graph.components())
+
+    def testEmpty(self):
+        names, graph = jane_graph.buildAuthorNetwork([])
+        self.assertEqual([], names)
+        self.assertEqual(0, graph.edgeCount())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,365 @@
+"""
+Pooled, keep-alive HTTP client used by janey to talk to the JANE service.
+
+Every blip used to pay a full TCP handshake to biosemantics.org because
+urllib.urlopen opens a fresh socket per call. Here we keep a small pool of
+persistent httplib connections per host and hand them out to callers.
+
+"""
+import errno
+import httplib
+import select
+import socket
+import threading
+import time
+import urlparse
+import zlib
+
+DEFAULT_POOL_SIZE = 4
+DEFAULT_IDLE_TIMEOUT = 30 # seconds a connection may sit unused in the pool
+DEFAULT_CHUNK_SIZE = 8192
+ACCEPT_ENCODING = 'gzip, deflate'
+
+
+class PoolError(Exception):
+    """
+    Raised when a request cannot be completed on a pooled connection.
+
+    """
+    pass
+
+
+class PooledResponse:
+    """
+    The parts of an httplib response that janey cares about. The body is
+    read in full (or streamed to a sink) before this is built, so the
+    underlying connection can go straight back into the pool. wire_bytes
+    is the size of the body as it came off the socket, before decoding.
+
+    """
+    def __init__(self, status, reason, headers, body, wire_bytes=None):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+        if wire_bytes is None:
+            wire_bytes = len(body)
+        self.wire_bytes = wire_bytes
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name.lower(), default)
+
+    def read(self):
+        return self.body
+
+
+def closed_by_server(error):
+    """
+    Whether error means the server closed a kept-alive connection before
+    our request got an answer, which is worth retrying on a new one. A
+    timeout is not: the request may well be under way, and sending it again
+    would double the caller's time budget.
+
+    """
+    if isinstance(error, httplib.BadStatusLine):
+        return True
+    if isinstance(error, socket.timeout):
+        return False
+    return (isinstance(error, socket.error) and
+            error.args and error.args[0] in (errno.ECONNRESET, errno.EPIPE))
+
+
+def content_decoder(encoding):
+    """
+    Returns a zlib decompressor for a gzip or deflate Content-Encoding, or
+    None for a body that needs no decoding. Deflate is taken to be zlib
+    wrapped, as the HTTP spec says; window bits of 32 + MAX_WBITS make zlib
+    accept either header.
+
+    """
+    if encoding and encoding.strip().lower() in ('gzip', 'x-gzip', 'deflate'):
+        return zlib.decompressobj(32 + zlib.MAX_WBITS)
+    return None
+
+
+class HTTPConnectionPool(object):
+    """
+    A bounded pool of keep-alive connections to a single host:port.
+
+    Idle connections are kept on a LIFO stack, so the most recently used
+    (and therefore most likely still open) socket is handed out first.
+    Connections that have sat idle longer than idle_timeout are evicted,
+    and every connection is health checked before it is reused.
+
+    """
+    def __init__(self, host, port=None, maxsize=DEFAULT_POOL_SIZE,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT, timeout=None):
+        self.host = host
+        self.port = port
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._idle = [] # stack of (connection, time it was returned)
+        self._lock = threading.Lock()
+        self._semaphore = threading.BoundedSemaphore(maxsize)
+        self.connections_created = 0
+        self.connections_reused = 0
+
+    def _new_connection(self, timeout=None):
+        self.connections_created += 1
+        if timeout is None:
+            timeout = self.timeout
+        if timeout is None:
+            return httplib.HTTPConnection(self.host, self.port)
+        return httplib.HTTPConnection(self.host, self.port, timeout=timeout)
+
+    def _set_timeout(self, conn, timeout):
+        """
+        Pooled connections keep the socket timeout of whoever used them
+        last, so it is set again for every request. Without a timeout from
+        the caller or the pool, the connection goes back to the default a
+        new one would get.
+
+        """
+        if timeout is None:
+            timeout = self.timeout
+        if timeout is None:
+            conn.timeout = socket._GLOBAL_DEFAULT_TIMEOUT
+            timeout = socket.getdefaulttimeout()
+        else:
+            conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+
+    def _is_healthy(self, conn, idle_since):
+        """
+        A pooled connection is only reused if it is still fresh and the
+        server has not closed it. A socket that is readable while we have no
+        request outstanding means the peer sent EOF (or garbage), either way
+        it can't be used.
+
+        """
+        if time.time() - idle_since > self.idle_timeout:
+            return False
+        sock = conn.sock
+        if sock is None:
+            return False
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+        except (select.error, ValueError, TypeError):
+            return False
+        return not readable
+
+    def _get(self):
+        self._lock.acquire()
+        try:
+            self._evict_idle()
+            while self._idle:
+                conn, idle_since = self._idle.pop()
+                if self._is_healthy(conn, idle_since):
+                    self.connections_reused += 1
+                    return conn
+                conn.close()
+        finally:
+            self._lock.release()
+        return self._new_connection()
+
+    def _put(self, conn):
+        self._lock.acquire()
+        try:
+            self._evict_idle()
+            self._idle.append((conn, time.time()))
+        finally:
+            self._lock.release()
+
+    def evict_idle(self):
+        """
+        Closes every pooled connection that has outlived idle_timeout,
+        returns the number of connections closed. This also happens every
+        time a connection is taken from or returned to the pool, so sockets
+        at the bottom of the stack don't stay open while newer ones are
+        handed out on top of them.
+
+        """
+        self._lock.acquire()
+        try:
+            return self._evict_idle()
+        finally:
+            self._lock.release()
+
+    def _evict_idle(self):
+        # the caller holds self._lock
+        now = time.time()
+        keep = []
+        closed = 0
+        for conn, idle_since in self._idle:
+            if now - idle_since > self.idle_timeout:
+                conn.close()
+                closed += 1
+            else:
+                keep.append((conn, idle_since))
+        self._idle = keep
+        return closed
+
+    def idle_count(self):
+        return len(self._idle)
+
+    def _send(self, conn, method, path, body, headers):
+        conn.request(method, path, body, headers)
+        return conn.getresponse()
+
+    def request(self, method, path, body=None, headers=None, sink=None,
+                chunk_size=DEFAULT_CHUNK_SIZE, timeout=None):
+        """
+        Performs a request on a pooled connection and returns a
+        PooledResponse. At most maxsize requests run against the host at
+        once, further callers wait for a free slot.
+
+        A reused connection can still have been closed by the server between
+        the health check and the request, so that case is retried once on a
+        brand new connection. Any other error, a timeout included, is raised
+        as a PoolError straight away.
+
+        If sink is given the body is not buffered, it is passed to sink in
+        chunks as they come off the socket and the returned response has an
+        empty body. Anything sink raises is passed on to the caller.
+
+        Only successful (2xx) responses are streamed, the body of an error
+        response is returned in the response as usual.
+
+        A gzip or deflate encoded body is decompressed as it is read, so
+        sink and the returned body always see the plain content.
+
+        timeout overrides the pool's socket timeout for this request only.
+
+        """
+        headers = headers or {}
+        self._semaphore.acquire()
+        try:
+            conn = self._get()
+            reused = conn.sock is not None
+            self._set_timeout(conn, timeout)
+            try:
+                response = self._send(conn, method, path, body, headers)
+            except (httplib.HTTPException, IOError), e:
+                conn.close()
+                if not reused or not closed_by_server(e):
+                    raise PoolError(str(e))
+                conn = self._new_connection(timeout)
+                try:
+                    response = self._send(conn, method, path, body, headers)
+                except (httplib.HTTPException, IOError), e:
+                    conn.close()
+                    raise PoolError(str(e))
+            decoder = content_decoder(response.getheader('content-encoding'))
+            wire_bytes = 0
+            try:
+                if sink is None or not 200 <= response.status < 300:
+                    data = response.read()
+                    wire_bytes = len(data)
+                    if decoder is not None:
+                        data = decoder.decompress(data) + decoder.flush()
+                else:
+                    data = ''
+                    while True:
+                        chunk = response.read(chunk_size)
+                        if not chunk:
+                            break
+                        wire_bytes += len(chunk)
+                        if decoder is not None:
+                            chunk = decoder.decompress(chunk)
+                            if not chunk:
+                                continue
+                        sink(chunk)
+                    if decoder is not None:
+                        chunk = decoder.flush()
+                        if chunk:
+                            sink(chunk)
+            except (httplib.HTTPException, IOError, zlib.error), e:
+                conn.close()
+                raise PoolError(str(e))
+            except:
+                # the body was not read to the end, so the connection
+                # can't be reused
+                conn.close()
+                raise
+            if response.will_close:
+                conn.close()
+            else:
+                self._put(conn)
+            response_headers = dict((k.lower(), v)
+                                    for k, v in response.getheaders())
+            return PooledResponse(response.status, response.reason,
+                                  response_headers, data, wire_bytes)
+        finally:
+            self._semaphore.release()
+
+    def close(self):
+        self._lock.acquire()
+        try:
+            for conn, _ in self._idle:
+                conn.close()
+            self._idle = []
+        finally:
+            self._lock.release()
+
+
+class PoolManager(object):
+    """
+    Hands out one HTTPConnectionPool per host:port.
+
+    pool_sizes maps 'host:port' to a pool size so a busy upstream such as
+    JANE can be given more connections than everything else.
+
+    """
+    def __init__(self, maxsize=DEFAULT_POOL_SIZE, pool_sizes=None,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT, timeout=None):
+        self.maxsize = maxsize
+        self.pool_sizes = pool_sizes or {}
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def pool_for(self, host, port=None):
+        key = '%s:%s' % (host, port or httplib.HTTP_PORT)
+        self._lock.acquire()
+        try:
+            pool = self._pools.get(key)
+            if pool is None:
+                pool = HTTPConnectionPool(host, port,
+                        maxsize=self.pool_sizes.get(key, self.maxsize),
+                        idle_timeout=self.idle_timeout,
+                        timeout=self.timeout)
+                self._pools[key] = pool
+            return pool
+        finally:
+            self._lock.release()
+
+    def urlopen(self, url, method='GET', body=None, headers=None, sink=None,
+                timeout=None):
+        """
+        Requests url through the pool for its host and returns a
+        PooledResponse, see HTTPConnectionPool.request for sink and timeout.
+
+        """
+        parts = urlparse.urlsplit(url)
+        if parts.scheme != 'http':
+            raise PoolError('unsupported url scheme: %s' % parts.scheme)
+        path = parts.path or '/'
+        if parts.query:
+            path = path + '?' + parts.query
+        pool = self.pool_for(parts.hostname, parts.port)
+        return pool.request(method, path, body, headers, sink,
+                            timeout=timeout)
+
+    def evict_idle(self):
+        closed = 0
+        for pool in self._pools.values():
+            closed += pool.evict_idle()
+        return closed
+
+    def close(self):
+        for pool in self._pools.values():
+            pool.close()
+        self._pools = {}
@@ -0,0 +1,221 @@
+"""Unit tests for the jane_http module."""
+
+import BaseHTTPServer
+import errno
+import gzip
+import httplib
+import socket
+import StringIO
+import threading
+import time
+import unittest
+
+import jane_http
+
+
+class KeepAliveHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1 # see jane_standin.StandinHandler
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        if 'slow' in self.path:
+            time.sleep(0.2)
+        if 'missing' in self.path:
+            return self.respond('not found', 404)
+        self.respond('<results>%s</results>' % self.path)
+
+    def do_POST(self):
+        length = int(self.headers.getheader('content-length'))
+        self.respond('<results>%s</results>' % self.rfile.read(length))
+
+    def respond(self, body, status=200):
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/xml')
+        if 'gzip' in self.headers.getheader('accept-encoding', ''):
+            buf = StringIO.StringIO()
+            f = gzip.GzipFile(fileobj=buf, mode='wb')
+            f.write(body)
+            f.close()
+            body = buf.getvalue()
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0),
+                                                KeepAliveHandler)
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.setDaemon(True)
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d/jane/journals?text=x' % self.port
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def testConnectionIsReused(self):
+        manager = jane_http.PoolManager(maxsize=2)
+        for i in range(5):
+            response = manager.urlopen(self.url)
+            self.assertEqual(200, response.status)
+            self.assertEqual('<results>/jane/journals?text=x</results>',
+                             response.read())
+        pool = manager.pool_for('127.0.0.1', self.port)
+        self.assertEqual(1, pool.connections_created)
+        self.assertEqual(4, pool.connections_reused)
+        manager.close()
+
+    def testPoolSizePerHost(self):
+        key = '127.0.0.1:%d' % self.port
+        manager = jane_http.PoolManager(maxsize=2, pool_sizes={key: 7})
+        self.assertEqual(7, manager.pool_for('127.0.0.1', self.port).maxsize)
+        self.assertEqual(2, manager.pool_for('localhost', self.port).maxsize)
+
+    def testIdleEviction(self):
+        manager = jane_http.PoolManager(idle_timeout=0.01)
+        manager.urlopen(self.url)
+        pool = manager.pool_for('127.0.0.1', self.port)
+        self.assertEqual(1, pool.idle_count())
+        time.sleep(0.05)
+        self.assertEqual(1, manager.evict_idle())
+        self.assertEqual(0, pool.idle_count())
+
+    def testIdleConnectionsEvictedOnUse(self):
+        pool = jane_http.HTTPConnectionPool('127.0.0.1', self.port,
+                                            idle_timeout=30)
+        conns = [pool._new_connection() for i in range(4)]
+        try:
+            for conn in conns:
+                conn.connect()
+            long_ago = time.time() - 60
+            # a fresh connection on top of the stack no longer hides a
+            # stale one under it, whether the pool is taken from or added to
+            pool._idle = [(conns[0], long_ago), (conns[1], time.time())]
+            self.assertTrue(pool._get() is conns[1])
+            self.assertEqual(0, pool.idle_count())
+            self.assertEqual(None, conns[0].sock)
+            pool._idle = [(conns[2], long_ago)]
+            pool._put(conns[3])
+            self.assertEqual([conns[3]], [conn for conn, _ in pool._idle])
+            self.assertEqual(None, conns[2].sock)
+        finally:
+            pool.close()
+            for conn in conns:
+                conn.close()
+
+    def testStaleConnectionIsReplaced(self):
+        manager = jane_http.PoolManager(idle_timeout=0.01)
+        manager.urlopen(self.url)
+        time.sleep(0.05)
+        manager.urlopen(self.url)
+        pool = manager.pool_for('127.0.0.1', self.port)
+        self.assertEqual(2, pool.connections_created)
+        self.assertEqual(0, pool.connections_reused)
+
+    def testStreamingSink(self):
+        manager = jane_http.PoolManager()
+        chunks = []
+        response = manager.urlopen(self.url, sink=chunks.append)
+        self.assertEqual('', response.read())
+        self.assertEqual('<results>/jane/journals?text=x</results>',
+                         ''.join(chunks))
+        # the body was read to the end, so the connection is reusable
+        manager.urlopen(self.url)
+        pool = manager.pool_for('127.0.0.1', self.port)
+        self.assertEqual(1, pool.connections_reused)
+
+    def testErrorResponseIsNotStreamed(self):
+        manager = jane_http.PoolManager()
+        chunks = []
+        response = manager.urlopen(self.url + '&missing=1', sink=chunks.append)
+        self.assertEqual(404, response.status)
+        self.assertEqual('not found', response.read())
+        self.assertEqual([], chunks)
+
+    def testFailingSinkDiscardsConnection(self):
+        manager = jane_http.PoolManager()
+        def sink(chunk):
+            raise ValueError('bad chunk')
+        self.assertRaises(ValueError, manager.urlopen, self.url, sink=sink)
+        pool = manager.pool_for('127.0.0.1', self.port)
+        self.assertEqual(0, pool.idle_count())
+
+    def testRequestTimeout(self):
+        manager = jane_http.PoolManager(timeout=5)
+        self.assertRaises(jane_http.PoolError, manager.urlopen,
+                          self.url + '&slow=1', timeout=0.05)
+        pool = manager.pool_for('127.0.0.1', self.port)
+        self.assertEqual(0, pool.idle_count())
+
+    def testTimeoutOnReusedConnectionIsNotRetried(self):
+        manager = jane_http.PoolManager(timeout=5)
+        manager.urlopen(self.url)
+        start = time.time()
+        self.assertRaises(jane_http.PoolError, manager.urlopen,
+                          self.url + '&slow=1', timeout=0.1)
+        self.assertTrue(time.time() - start < 0.19)
+        pool = manager.pool_for('127.0.0.1', self.port)
+        self.assertEqual(1, pool.connections_created)
+        self.assertEqual(1, pool.connections_reused)
+
+    def testClosedByServer(self):
+        self.assertTrue(jane_http.closed_by_server(httplib.BadStatusLine('')))
+        self.assertTrue(jane_http.closed_by_server(
+            socket.error(errno.ECONNRESET, 'reset')))
+        self.assertTrue(jane_http.closed_by_server(
+            socket.error(errno.EPIPE, 'broken pipe')))
+        self.assertFalse(jane_http.closed_by_server(
+            socket.timeout('timed out')))
+        self.assertFalse(jane_http.closed_by_server(
+            socket.error(errno.ECONNREFUSED, 'refused')))
+        self.assertFalse(jane_http.closed_by_server(IOError('disk')))
+
+    def testTimeoutIsReset(self):
+        pool = jane_http.HTTPConnectionPool('127.0.0.1', self.port)
+        try:
+            pool.request('GET', '/jane/journals?text=x', timeout=0.5)
+            conn = pool._idle[-1][0]
+            self.assertEqual(0.5, conn.sock.gettimeout())
+            pool.request('GET', '/jane/journals?text=x')
+            self.assertEqual(1, pool.connections_reused)
+            self.assertEqual(None, conn.sock.gettimeout())
+        finally:
+            pool.close()
+        pool = jane_http.HTTPConnectionPool('127.0.0.1', self.port,
+                                            timeout=5)
+        try:
+            pool.request('GET', '/jane/journals?text=x', timeout=0.5)
+            pool.request('GET', '/jane/journals?text=x')
+            self.assertEqual(5, pool._idle[-1][0].sock.gettimeout())
+        finally:
+            pool.close()
+
+    def testGzipPost(self):
+        manager = jane_http.PoolManager()
+        headers = {'Accept-Encoding': jane_http.ACCEPT_ENCODING}
+        text = 'text=' + 'malaria%20vaccines%20' * 100
+        response = manager.urlopen(self.url, 'POST', text, headers)
+        self.assertEqual('<results>%s</results>' % text, response.read())
+        self.assertEqual('gzip', response.getheader('Content-Encoding'))
+        self.assertTrue(response.wire_bytes < len(text) / 4)
+        chunks = []
+        manager.urlopen(self.url, 'POST', text, headers, sink=chunks.append)
+        self.assertEqual('<results>%s</results>' % text, ''.join(chunks))
+
+    def testUnsupportedScheme(self):
+        manager = jane_http.PoolManager()
+        self.assertRaises(jane_http.PoolError, manager.urlopen,
+                          'https://127.0.0.1/')
+
+
+if __name__ == '__main__':
+    unittest.main()
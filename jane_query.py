@@ -0,0 +1,103 @@
+"""
+Query text normalization and fingerprinting.
+
+The same question reaches janey in many spellings: extra spaces and line
+breaks, different case, leftover janey commands or markup pasted in from
+elsewhere. normalizeQueryText reduces them to one form, and queryFingerprint
+hashes that form together with the JANE request it is sent as, giving a
+short stable key for the cache and for spotting duplicate requests. JANE
+itself is sent the lighter cleanQueryText, which keeps the words as typed.
+
+"""
+import hashlib
+import re
+import threading
+
+COMMAND_PATTERN = re.compile(r'\(janey:[a-z]*\)', re.IGNORECASE)
+# Only things that look like real tags, so prose such as "<5% of children
+# aged >2 years" is left alone.
+MARKUP_PATTERN = re.compile(r'</?[A-Za-z][\w:-]*(\s[^<>]*)?/?>')
+
+# Common English words that carry no weight in a JANE similarity search.
+# Removing them is optional since it changes the text JANE sees.
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have in into is it its of on or
+that the their there these this to was we were which with
+""".split())
+
+
+def cleanQueryText(text):
+    """
+    Returns text with janey commands removed and whitespace collapsed to
+    single spaces, this is the text JANE is asked about.
+
+    """
+    return u' '.join(COMMAND_PATTERN.sub(' ', text).split())
+
+
+def normalizeQueryText(text, stopwords=None):
+    """
+    Returns text with janey commands and markup tags removed, whitespace
+    collapsed to single spaces and case folded. Words in stopwords, if
+    given, are dropped as well.
+
+    """
+    text = COMMAND_PATTERN.sub(' ', text)
+    text = MARKUP_PATTERN.sub(' ', text)
+    words = text.lower().split()
+    if stopwords:
+        words = [word for word in words if word not in stopwords]
+    return u' '.join(words)
+
+
+def queryFingerprint(endpoint, count, normalized_text):
+    """
+    A hex digest identifying the JANE request for a normalized query.
+
+    """
+    key = u'%s\n%s\n%s' % (endpoint, count or '', normalized_text)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+class FingerprintStats(object):
+    """
+    Counts queries, the distinct raw queries among them and the distinct
+    fingerprints those normalize to; the gap between the last two is what
+    normalization gains the cache. A raw key is anything identifying the
+    query before normalization, janey uses the endpoint and the text as it
+    was typed. Only the first max_tracked distinct values of each are
+    remembered, after that the counts stop growing.
+
+    """
+    def __init__(self, max_tracked=10000):
+        self.max_tracked = max_tracked
+        self.queries = 0
+        self._raw = set()
+        self._fingerprints = set()
+        self._lock = threading.Lock()
+
+    def record(self, raw_key, fingerprint):
+        if isinstance(raw_key, unicode):
+            raw_key = raw_key.encode('utf-8')
+        raw_digest = hashlib.sha1(raw_key).digest()
+        self._lock.acquire()
+        try:
+            self.queries += 1
+            if len(self._raw) < self.max_tracked:
+                self._raw.add(raw_digest)
+            if len(self._fingerprints) < self.max_tracked:
+                self._fingerprints.add(fingerprint)
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        raw = len(self._raw)
+        fingerprints = len(self._fingerprints)
+        if raw:
+            merged = 1.0 - float(fingerprints) / raw
+        else:
+            merged = 0.0
+        return {'queries': self.queries,
+                'distinct_raw': raw,
+                'distinct_fingerprints': fingerprints,
+                'merged_rate': merged}
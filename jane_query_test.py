@@ -0,0 +1,61 @@
+"""Unit tests for the jane_query module."""
+
+import unittest
+
+import jane_query
+
+
+class TestNormalization(unittest.TestCase):
+
+    def testNormalizeQueryText(self):
+        self.assertEqual(u'malaria vaccines in africa',
+                         jane_query.normalizeQueryText(
+                             u'  Malaria\n\tVaccines (janey:JOURNALS)  in '
+                             u'<b>Africa</b> (janey:graph)'))
+
+    def testAngleBracketsInProse(self):
+        text = u'Parasitaemia <5% in children aged >2 years treated with ACT'
+        self.assertEqual(u'parasitaemia <5% in children aged >2 years '
+                         u'treated with act',
+                         jane_query.normalizeQueryText(text))
+        self.assertEqual(u'a < b > c', jane_query.normalizeQueryText(
+            u'a <<i>b</i>> <br/>c'))
+
+    def testCleanQueryText(self):
+        self.assertEqual(u'Malaria Vaccines in <5% of <b>Africa</b>',
+                         jane_query.cleanQueryText(
+                             u'  Malaria\n\tVaccines (janey:JOURNALS) in '
+                             u'<5% of <b>Africa</b> (janey:graph)'))
+
+    def testStopwords(self):
+        self.assertEqual(u'vaccines africa',
+                         jane_query.normalizeQueryText(
+                             u'The vaccines of Africa', jane_query.STOPWORDS))
+
+    def testFingerprint(self):
+        fingerprint = jane_query.queryFingerprint
+        self.assertEqual(fingerprint('articles', 100, u'malaria'),
+                         fingerprint('articles', 100, u'malaria'))
+        self.assertNotEqual(fingerprint('articles', 100, u'malaria'),
+                            fingerprint('articles', None, u'malaria'))
+        self.assertNotEqual(fingerprint('journals', None, u'malaria'),
+                            fingerprint('authors', None, u'malaria'))
+        self.assertEqual(40, len(fingerprint('journals', None, u'\xe9t\xe9')))
+
+
+class TestFingerprintStats(unittest.TestCase):
+
+    def testCounts(self):
+        stats = jane_query.FingerprintStats()
+        for raw in [u'Malaria', u'malaria ', u'malaria', u'malaria']:
+            stats.record(raw, jane_query.queryFingerprint(
+                'journals', None, jane_query.normalizeQueryText(raw)))
+        self.assertEqual({'queries': 4,
+                          'distinct_raw': 3,
+                          'distinct_fingerprints': 1,
+                          'merged_rate': 1 - 1 / 3.0},
+                         stats.stats())
+
+
+if __name__ == '__main__':
+    unittest.main()
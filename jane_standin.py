@@ -0,0 +1,233 @@
+"""
+A local stand-in for the JANE service, for testing and benchmarking janey
+without the network.
+
+It answers /jane/journals, /jane/authors and /jane/articles like JANE does,
+taking text, count and offset by GET or POST, from recorded responses or
+synthetic ones made by jane_fixtures. Recorded responses are files named
+journals.xml, authors.xml and articles.xml in a directory; articles are
+sliced by count and offset, the others are served as they are. Latency,
+jitter, an error rate and extra padding can be added to make it behave
+like a slow or flaky upstream.
+
+Point janey at it with JANE_ROOT_URL, e.g.
+
+    python jane_standin.py --port 8081 --latency 0.2 --jitter 0.1
+    JANE_ROOT_URL=http://127.0.0.1:8081/jane/ dev_appserver.py .
+
+"""
+import BaseHTTPServer
+import cgi
+import gzip
+import optparse
+import os
+import random
+import re
+import SocketServer
+import StringIO
+import threading
+import time
+
+import jane_fixtures
+
+ENDPOINTS = ('journals', 'authors', 'articles')
+DEFAULT_COUNT = 10 # articles returned when the query has no count
+DEFAULT_RECORDS = 10 # journals and authors in a synthetic response
+
+ARTICLE_PATTERN = re.compile(r'<article\b.*?</article>', re.DOTALL)
+
+
+class SyntheticFixtures(object):
+    """
+    Makes up responses with a jane_fixtures.FixtureGenerator: records
+    journals or authors, and count articles from offset on.
+
+    """
+    def __init__(self, records=DEFAULT_RECORDS, generator=None):
+        if generator is None:
+            generator = jane_fixtures.FixtureGenerator()
+        self.records = records
+        self.generator = generator
+
+    def response(self, endpoint, text, count, offset):
+        if endpoint == 'articles':
+            return self.generator.articles(count, offset)
+        return self.generator.response(endpoint, self.records)
+
+
+class RecordedFixtures(object):
+    """
+    Serves recorded JANE responses from directory, whatever the query text.
+
+    """
+    def __init__(self, directory):
+        self.responses = {}
+        for endpoint in ENDPOINTS:
+            path = os.path.join(directory, endpoint + '.xml')
+            if os.path.exists(path):
+                f = open(path, 'rb')
+                try:
+                    self.responses[endpoint] = f.read()
+                finally:
+                    f.close()
+
+    def response(self, endpoint, text, count, offset):
+        document = self.responses.get(endpoint)
+        if document is None or endpoint != 'articles':
+            return document
+        articles = ARTICLE_PATTERN.findall(document)
+        return jane_fixtures.xmlDocument('\n'.join(
+            articles[offset:offset + count]))
+
+
+class StandinHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # On a kept-alive connection Nagle and the client's delayed ACKs hold
+    # back any response sent as several writes by about 40ms: unbuffered,
+    # every header line is a write of its own, and buffered, a body over
+    # 8KB is still flushed in 8KB pieces. So writes are buffered to keep
+    # the packets few, and Nagle is turned off so none of them waits.
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        path, _, query = self.path.partition('?')
+        self.answer(path, query)
+
+    def do_POST(self):
+        length = int(self.headers.getheader('content-length') or 0)
+        self.answer(self.path.partition('?')[0], self.rfile.read(length))
+
+    def answer(self, path, query):
+        standin = self.server.standin
+        standin.requests += 1
+        standin.delay()
+        parts = path.strip('/').split('/')
+        if len(parts) != 2 or parts[0] != 'jane' or parts[1] not in ENDPOINTS:
+            return self.reply(404, 'no such endpoint')
+        if standin.fail():
+            standin.errors += 1
+            return self.reply(503, 'JANE is having a bad day')
+        params = cgi.parse_qs(query)
+        try:
+            count = int(params.get('count', [DEFAULT_COUNT])[0])
+            offset = int(params.get('offset', [0])[0])
+        except ValueError:
+            return self.reply(400, 'count and offset must be numbers')
+        text = params.get('text', [''])[0]
+        document = standin.fixtures.response(parts[1], text, count, offset)
+        if document is None:
+            return self.reply(404, 'no recorded %s response' % parts[1])
+        if standin.padding:
+            document = document + '<!-- %s -->' % ('x' * standin.padding)
+        self.reply(200, document, 'text/xml')
+
+    def reply(self, status, body, content_type='text/plain'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        if 'gzip' in self.headers.getheader('accept-encoding', ''):
+            buf = StringIO.StringIO()
+            f = gzip.GzipFile(fileobj=buf, mode='wb')
+            f.write(body)
+            f.close()
+            body = buf.getvalue()
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _ThreadingServer(SocketServer.ThreadingMixIn,
+                       BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class JaneStandin(object):
+    """
+    The stand-in server. start() serves on a background thread and
+    root_url is then what to use as janey's JANE_ROOT_URL.
+
+    latency and jitter are in seconds, each request waits latency plus a
+    random part of up to jitter. error_rate is the fraction of requests
+    answered with a 503, padding the number of bytes added to every
+    response. seed makes the random parts repeatable.
+
+    """
+    def __init__(self, fixtures=None, port=0, latency=0, jitter=0,
+                 error_rate=0, padding=0, seed=None):
+        if fixtures is None:
+            fixtures = SyntheticFixtures()
+        self.fixtures = fixtures
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.padding = padding
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.server = _ThreadingServer(('127.0.0.1', port), StandinHandler)
+        self.server.standin = self
+        self.port = self.server.server_address[1]
+        self.root_url = 'http://127.0.0.1:%d/jane/' % self.port
+        self._thread = None
+
+    def delay(self):
+        self._lock.acquire()
+        try:
+            seconds = self.latency + self._random.uniform(0, self.jitter)
+        finally:
+            self._lock.release()
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def fail(self):
+        self._lock.acquire()
+        try:
+            return self._random.random() < self.error_rate
+        finally:
+            self._lock.release()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever)
+        self._thread.setDaemon(True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('--port', type='int', default=8081)
+    parser.add_option('--fixtures', metavar='DIR',
+                      help='serve recorded responses from DIR')
+    parser.add_option('--records', type='int', default=DEFAULT_RECORDS,
+                      help='journals and authors per synthetic response')
+    parser.add_option('--latency', type='float', default=0)
+    parser.add_option('--jitter', type='float', default=0)
+    parser.add_option('--error-rate', type='float', default=0)
+    parser.add_option('--padding', type='int', default=0)
+    parser.add_option('--seed', type='int')
+    options, args = parser.parse_args()
+    if options.fixtures:
+        fixtures = RecordedFixtures(options.fixtures)
+    else:
+        fixtures = SyntheticFixtures(options.records)
+    standin = JaneStandin(fixtures, options.port, options.latency,
+                          options.jitter, options.error_rate,
+                          options.padding, options.seed)
+    print 'serving JANE on %s' % standin.root_url
+    standin.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Unit tests for the jane_standin module."""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import jane_fixtures
+import jane_http
+import jane_standin
+
+
+class TestStandin(unittest.TestCase):
+
+    def setUp(self):
+        self.standins = []
+        self.manager = jane_http.PoolManager()
+
+    def tearDown(self):
+        self.manager.close()
+        for standin in self.standins:
+            standin.stop()
+
+    def start(self, *args, **kwargs):
+        standin = jane_standin.JaneStandin(*args, **kwargs).start()
+        self.standins.append(standin)
+        return standin
+
+    def testSyntheticEndpoints(self):
+        standin = self.start(jane_standin.SyntheticFixtures(records=3))
+        journals = self.manager.urlopen(standin.root_url +
+                                        'journals?text=malaria').read()
+        self.assertEqual(3, journals.count('<journal '))
+        articles = self.manager.urlopen(standin.root_url + 'articles', 'POST',
+                                        'text=malaria&count=5&offset=20',
+                                        {'Accept-Encoding': 'gzip'}).read()
+        self.assertEqual(5, articles.count('<article '))
+        self.assertTrue('rank="21"' in articles)
+        missing = self.manager.urlopen(standin.root_url + 'abstracts')
+        self.assertEqual(404, missing.status)
+
+    def testErrorsAndPadding(self):
+        standin = self.start(error_rate=1)
+        response = self.manager.urlopen(standin.root_url + 'journals?text=x')
+        self.assertEqual(503, response.status)
+        self.assertEqual(1, standin.errors)
+        padded = self.start(padding=1000)
+        response = self.manager.urlopen(padded.root_url + 'journals?text=x')
+        self.assertTrue(len(response.read()) > 1000)
+
+    def testNoDelayedAckStall(self):
+        standin = self.start(jane_standin.SyntheticFixtures(records=3))
+        # a small response, and one over the 8KB write buffer
+        for query in ['journals?text=malaria', 'articles?text=x&count=100']:
+            url = standin.root_url + query
+            self.manager.urlopen(url) # connect, or make the articles
+            start = time.time()
+            for i in range(5):
+                self.assertEqual(200, self.manager.urlopen(url).status)
+            # a stalled keep-alive response takes about 40ms
+            self.assertTrue((time.time() - start) / 5 < 0.03)
+        pool = self.manager.pool_for('127.0.0.1', standin.port)
+        self.assertEqual(11, pool.connections_reused)
+
+    def testRecordedFixtures(self):
+        directory = tempfile.mkdtemp()
+        try:
+            f = open(os.path.join(directory, 'articles.xml'), 'w')
+            f.write(jane_fixtures.FixtureGenerator().articles(4))
+            f.close()
+            fixtures = jane_standin.RecordedFixtures(directory)
+            standin = self.start(fixtures)
+            articles = self.manager.urlopen(
+                standin.root_url + 'articles?text=x&count=2&offset=1').read()
+            self.assertEqual(2, articles.count('<article '))
+            self.assertTrue('rank="2"' in articles)
+            self.assertEqual(404, self.manager.urlopen(
+                standin.root_url + 'journals?text=x').status)
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
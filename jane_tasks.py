@@ -0,0 +1,189 @@
+"""
+Background work for janey: a task queue to run JANE queries off the
+request path, and a store for their answers until they can be delivered.
+
+A robot can only change a wave in its response to an event, so an answer
+computed in the background is held in PendingReplies until the Wave server
+next calls us about the same wavelet.
+
+LocalTaskQueue runs tasks on in-process worker threads. It stands in for a
+hosted task queue: anything with an add(func, *args) method will do.
+
+"""
+import logging
+import Queue
+import threading
+import time
+import uuid
+
+logger = logging.getLogger('janey-robot')
+
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_AGE = 60 * 60 # seconds an undelivered reply is kept
+
+
+class TaskResult(object):
+    """
+    The outcome of a task added with LocalTaskQueue.submit. wait() returns
+    True once the task has finished, after which value holds what it
+    returned, or error the exception it raised.
+
+    """
+    def __init__(self):
+        self.value = None
+        self.error = None
+        self._done = threading.Event()
+
+    def wait(self, timeout=None):
+        self._done.wait(timeout)
+        return self._done.isSet()
+
+    def _run(self, func, args, kwargs):
+        try:
+            self.value = func(*args, **kwargs)
+        except Exception, e:
+            self.error = e
+        self._done.set()
+
+
+class LocalTaskQueue(object):
+    """
+    Runs queued callables on a small pool of daemon worker threads, in the
+    order they were added. Exceptions are logged and do not stop the
+    worker.
+
+    """
+    def __init__(self, workers=DEFAULT_WORKERS):
+        self._queue = Queue.Queue()
+        self._threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._work,
+                                      name='janey-task-%d' % i)
+            thread.setDaemon(True)
+            thread.start()
+            self._threads.append(thread)
+
+    def add(self, func, *args, **kwargs):
+        self._queue.put((func, args, kwargs))
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Like add, but returns a TaskResult to wait on.
+
+        """
+        result = TaskResult()
+        self.add(result._run, func, args, kwargs)
+        return result
+
+    def join(self):
+        """
+        Blocks until every task added so far has run.
+
+        """
+        self._queue.join()
+
+    def _work(self):
+        while True:
+            func, args, kwargs = self._queue.get()
+            try:
+                try:
+                    func(*args, **kwargs)
+                except:
+                    logger.exception('background task failed')
+            finally:
+                self._queue.task_done()
+
+
+class PendingReply(object):
+    """
+    A reply being worked on in the background. token is also written into
+    the placeholder blip so the placeholder can be found again later.
+
+    """
+    def __init__(self, token, wavelet_key, blip_id):
+        self.token = token
+        self.wavelet_key = wavelet_key
+        self.blip_id = blip_id
+        self.text = None
+        self.created = time.time()
+
+
+class PendingReplies(object):
+    """
+    Thread safe store of PendingReply objects, looked up by the
+    (wave id, wavelet id) they belong to.
+
+    """
+    def __init__(self, max_age=DEFAULT_MAX_AGE):
+        self.max_age = max_age
+        self._replies = {}
+        self._lock = threading.Lock()
+
+    def add(self, wavelet_key, blip_id):
+        """
+        Records a new reply to blip_id and returns its token. Tokens are
+        random rather than counted, so a placeholder left behind by an
+        earlier process is never mistaken for one of ours.
+
+        """
+        token = uuid.uuid4().hex[:12]
+        self._lock.acquire()
+        try:
+            self._replies[token] = PendingReply(token, wavelet_key, blip_id)
+        finally:
+            self._lock.release()
+        return token
+
+    def complete(self, token, text):
+        self._lock.acquire()
+        try:
+            reply = self._replies.get(token)
+            if reply is not None:
+                reply.text = text
+        finally:
+            self._lock.release()
+
+    def ready(self, wavelet_key):
+        """
+        Claims the replies for a wavelet whose text has arrived and returns
+        them oldest first; they are taken out of the store, so events
+        handled at the same time never both get the same reply. A reply
+        that can't be delivered yet has to be handed back with put_back.
+        Replies too old to be worth delivering are forgotten.
+
+        """
+        now = time.time()
+        self._lock.acquire()
+        try:
+            ready = []
+            for token, reply in self._replies.items():
+                if now - reply.created > self.max_age:
+                    del self._replies[token]
+                elif reply.wavelet_key == wavelet_key and reply.text is not None:
+                    del self._replies[token]
+                    ready.append(reply)
+        finally:
+            self._lock.release()
+        ready.sort(key=lambda reply: reply.created)
+        return ready
+
+    def put_back(self, reply):
+        """
+        Returns a reply claimed by ready to the store, for a later event.
+
+        """
+        self._lock.acquire()
+        try:
+            self._replies[reply.token] = reply
+        finally:
+            self._lock.release()
+
+    def remove(self, token):
+        self._lock.acquire()
+        try:
+            self._replies.pop(token, None)
+        finally:
+            self._lock.release()
+
+    def __len__(self):
+        return len(self._replies)
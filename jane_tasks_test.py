@@ -0,0 +1,89 @@
+"""Unit tests for the jane_tasks module."""
+
+import unittest
+
+import jane_tasks
+
+
+class TestLocalTaskQueue(unittest.TestCase):
+
+    def testTasksRun(self):
+        queue = jane_tasks.LocalTaskQueue(workers=1)
+        results = []
+        for i in range(5):
+            queue.add(results.append, i)
+        queue.join()
+        self.assertEqual([0, 1, 2, 3, 4], results)
+
+    def testFailingTaskDoesNotStopWorker(self):
+        queue = jane_tasks.LocalTaskQueue(workers=1)
+        results = []
+        queue.add(lambda: 1 / 0)
+        queue.add(results.append, 'after')
+        queue.join()
+        self.assertEqual(['after'], results)
+
+    def testSubmit(self):
+        queue = jane_tasks.LocalTaskQueue(workers=2)
+        ok = queue.submit(lambda x: x * 2, 21)
+        failed = queue.submit(lambda: 1 / 0)
+        self.assertTrue(ok.wait(5))
+        self.assertEqual(42, ok.value)
+        self.assertTrue(failed.wait(5))
+        self.assertTrue(isinstance(failed.error, ZeroDivisionError))
+
+    def testWaitTimesOut(self):
+        queue = jane_tasks.LocalTaskQueue(workers=1)
+        blocker = jane_tasks.TaskResult()
+        queue.add(blocker.wait, 5)
+        slow = queue.submit(lambda: 'late')
+        self.assertFalse(slow.wait(0.01))
+        blocker._done.set()
+        self.assertTrue(slow.wait(5))
+
+
+class TestPendingReplies(unittest.TestCase):
+
+    def testOnlyCompletedRepliesAreReady(self):
+        replies = jane_tasks.PendingReplies()
+        first = replies.add(('w', 'wl'), 'b1')
+        second = replies.add(('w', 'wl'), 'b2')
+        other = replies.add(('w', 'other'), 'b3')
+        self.assertEqual([], replies.ready(('w', 'wl')))
+        replies.complete(second, 'answer')
+        replies.complete(other, 'elsewhere')
+        ready = replies.ready(('w', 'wl'))
+        self.assertEqual([second], [reply.token for reply in ready])
+        self.assertEqual('answer', ready[0].text)
+        self.assertEqual('b2', ready[0].blip_id)
+        self.assertEqual(2, len(replies))
+        self.assertNotEqual(first, second)
+
+    def testTokensAreUniqueAcrossStores(self):
+        # a restarted process must not hand out the tokens of the last one
+        first = jane_tasks.PendingReplies().add(('w', 'wl'), 'b1')
+        second = jane_tasks.PendingReplies().add(('w', 'wl'), 'b1')
+        self.assertNotEqual(first, second)
+        self.assertEqual(12, len(first))
+
+    def testReadyClaimsReplies(self):
+        replies = jane_tasks.PendingReplies()
+        token = replies.add(('w', 'wl'), 'b1')
+        replies.complete(token, 'answer')
+        ready = replies.ready(('w', 'wl'))
+        self.assertEqual([token], [reply.token for reply in ready])
+        self.assertEqual([], replies.ready(('w', 'wl')))
+        replies.put_back(ready[0])
+        self.assertEqual([token], [reply.token
+                                   for reply in replies.ready(('w', 'wl'))])
+
+    def testOldRepliesAreDropped(self):
+        replies = jane_tasks.PendingReplies(max_age=-1)
+        token = replies.add(('w', 'wl'), 'b1')
+        replies.complete(token, 'answer')
+        self.assertEqual([], replies.ready(('w', 'wl')))
+        self.assertEqual(0, len(replies))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,20 +1,76 @@
 from waveapi import events
-from waveapi import robot
 import re
+import heapq
 import logging
+import os
 import urllib
-from BeautifulSoup import BeautifulStoneSoup
+import marshal
+import time
+import xml.parsers.expat
+from BeautifulSoup import BeautifulStoneSoup, Tag
+import jane_http
+import jane_cache
+import jane_fetch
+import jane_graph
+import jane_query
+import jane_tasks
 
 logger = logging.getLogger('janey-robot')
 logger.setLevel(logging.DEBUG)
 
 current_version = '2.2.1'
+# where JANE lives; set JANE_ROOT_URL to use e.g. jane_standin.py instead
+JANE_ROOT_URL = os.environ.get('JANE_ROOT_URL',
+                               'http://biosemantics.org:8080/jane/')
+JANE_POOL_SIZE = 8 # keep-alive connections held open to the JANE server
+jane_pool = jane_http.PoolManager(maxsize=JANE_POOL_SIZE)
+QUERY_CACHE_TTL = 60 * 60 # seconds a parsed JANE answer is served from the cache
+PARSE_SCHEMA_VERSION = 1 # bump when the packed record layout below changes
+# With ASYNC_REPLIES on, JANE commands get a placeholder reply straight away
+# and are answered from a background queue; this needs threads, which the
+# App Engine runtime does not allow, so it is off by default.
+ASYNC_REPLIES = False
+PLACEHOLDER_MESSAGE = "asking JANE, the answer will appear here shortly \
+[janey:pending %s]"
+pending_replies = jane_tasks.PendingReplies()
+task_queue = None # created on first use, see GetTaskQueue
+# Several commands in one blip can be answered at the same time on worker
+# threads; off by default for the same reason as ASYNC_REPLIES.
+CONCURRENT_COMMANDS = False
+COMMAND_WORKERS = 4
+COMMAND_DEADLINE = 20 # seconds all the commands in a blip have to finish
+COMMAND_TIMEOUT_MESSAGE = "JANE took too long to answer this one, sorry!"
+command_pool = None # created on first use, see GetCommandPool
+# Threads used to handle the events of one request at the same time, e.g.
+# several blips submitted together; 1 handles them one after the other.
+EVENT_WORKERS = 1
+STALE_CACHE_TTL = 24 * 60 * 60 # seconds an old answer is kept for JANE outages
+# Queries are cached under their normalized text, see jane_query;
+# jane_query.STOPWORDS here also drops common English words from the key.
+# JANE is sent the text as typed, less commands and extra whitespace.
+QUERY_STOPWORDS = None
+query_stats = jane_query.FingerprintStats()
+query_cache = jane_cache.QueryCache(jane_cache.MemoryBackend(max_entries=256),
+                                    ttl=QUERY_CACHE_TTL,
+                                    stale_ttl=STALE_CACHE_TTL)
+# Calls to JANE get adaptive timeouts, retries and a circuit breaker. Hedged
+# duplicate requests need threads, so like ASYNC_REPLIES they are off.
+HEDGE_REQUESTS = False
+jane_fetcher = jane_fetch.ResilientFetcher(hedge=HEDGE_REQUESTS)
+jane_flights = jane_fetch.SingleFlight() # shares identical in-flight queries
+# JANE takes the query as a form encoded POST body, so long blips don't end
+# up in the url; False goes back to GET requests.
+JANE_USE_POST = True
+JANE_ACCEPT_ENCODING = jane_http.ACCEPT_ENCODING # None for plain responses
+JANE_USER_AGENT = 'janey-robot/' + current_version + \
+    ' (+http://janey-robot.appspot.com/)'
 HELP_MESSAGE = "I query http://www.biosemantics.org/jane/, my commands are:  \
                    (janey:journals) - returns a list of recommended journals\n \
                    (janey:articles) - returns a list of related articles\n \
                    (janey:authors) - returns a list of related authors\n \
                    (janey:about) - gives a little info about me\n \
                    (janey:graph) - mini co-authorship network\n \
+                   (janey:network) - mini network of co-authors\n \
                    (janey:help) - prints this message"       
 ABOUT_MESSAGE = "I pass the content of the blip I am called from to the \
 Journal Name Author Estimator service, and I put some of the \
@@ -71,47 +127,75 @@ class articleInfo:
         self.authors = []
         
         
-def sort_results_by_rank(i, j):
+# How many results each command lists under each ordering.
+TOP_K = {
+    'journals': 5,
+    'articles': 5,
+    'authors': 5,
+}
+
+
+def byRank(result, index):
     """
-    All root objects returned in the jane xml tree have a rank
-    and score attribute, this is a custom sort on rank.
+    All root objects returned in the jane xml tree have a rank and score
+    attribute. Rank 1 is best, ties keep the order JANE returned them in.
 
     """
-    if i.rank > j.rank:
-        return 1
-    elif j.rank == i.rank:
-        return 0
-    else: # j.rank > i.rank
-        return -1
+    return (-result.rank, -index)
 
 
-def sort_results_by_score(i, j):
+def byScore(result, index):
     """
-    All root objects returned in the jane xml tree have a rank
-    and score attribute, this is a custom sort on score
+    Highest score is best, ties go to the better rank.
 
     """
-    if i.score > j.score:
-        return 1
-    elif j.score == i.score:
-        return 0
-    else: # j.rank > i.rank
-        return -1
+    return (result.score, -result.rank, -index)
 
 
-def sort_results_by_year(i, j):
+def selectTopResults(results, k, orderings):
     """
-    Article objects have a year attribute. This is the year that they were published.
-    This custom sort, sorts articles by year, yeahh!
+    Picks the k best results under each of the orderings in a single pass,
+    keeping one bounded heap per ordering instead of sorting the whole list
+    once per ordering. An ordering maps (result, index) to a key where
+    bigger is better; keys include the index so they are never equal.
+
+    Returns one list per ordering, best first. If there are fewer than k
+    results each list simply holds all of them.
 
     """
-    if i.year > j.year:
-        return 1
-    elif j.year == i.year:
-        return 0
-    else: # j.rank > i.rank
-        return -1
-        
+    heaps = [[] for ordering in orderings]
+    if k <= 0:
+        return heaps
+    for index, result in enumerate(results):
+        for ordering, heap in zip(orderings, heaps):
+            entry = (ordering(result, index), result)
+            if len(heap) < k:
+                heapq.heappush(heap, entry)
+            elif entry[0] > heap[0][0]:
+                heapq.heapreplace(heap, entry)
+    top_lists = []
+    for heap in heaps:
+        heap.sort(reverse=True)
+        top_lists.append([result for key, result in heap])
+    return top_lists
+
+
+def articleYear(article):
+    """
+    Article objects have a year attribute. This is the year that they were
+    published. Used as a sort key, sorts articles by year, yeahh!
+
+    """
+    return article.year
+
+
+def nodeText(node):
+    """
+    All the text inside node, including any inside markup nested in it.
+
+    """
+    return u''.join(node.findAll(text=True))
+
 
 def genPubMedLinkFromPMID(pmid):
     return "http://www.ncbi.nlm.nih.gov/pubmed/" + pmid
@@ -126,7 +210,7 @@ def GetJournalInfo(soup):
     journals = soup.findAll('journal')
     return_results = []
     for journal in journals:
-        title = journal.journalname.contents[0]
+        title = nodeText(journal.journalname)
         rank = journal['rank']
         score = journal['score']
         j = journalInfo(title)
@@ -136,31 +220,52 @@ def GetJournalInfo(soup):
     return return_results
 
 
+ARTICLE_FIELD_TAGS = ('title', 'pmid', 'year')
+
+
 def GetArticleInfo(soup):
     """
     Parses the returned xml from JANE and extracts some information about
     articles.
     
+    The tree is walked once, picking up each article's fields as the walk
+    passes through it, rather than searching every article again for its
+    title, pmid, year and authors.
+
     """
-    articles = soup.findAll('article')
     return_results = []
-    for article in articles:
-        # extract the info from the xml tree
-        title = article.title.contents[0]
-        rank = article['rank']
-        score = article['score']
-        pmid = article.pmid.contents[0]
-        year = article.year.contents[0]
-        author_tags = article.findAll('author')
-        author_names = [tag.contents[0] for tag in author_tags]
-        # add the info into our article info class object
-        a = articleInfo(pmid)
-        a.score = int(score) # read as str, convert to int for sorting
-        a.rank = int(rank) # read as str, convert to int for sorting
-        a.title = title
-        a.year = int(year) # read as str, convert to int for sorting
-        a.authors = author_names
-        return_results.append(a)
+    fields = None
+    last_node = None
+    for node in soup.recursiveChildGenerator():
+        if isinstance(node, Tag):
+            name = node.name
+            if fields is None:
+                if name == 'article':
+                    article = node
+                    fields = {}
+                    author_names = []
+                    last_node = node._lastRecursiveChild()
+            elif name == 'author':
+                author_names.append(nodeText(node))
+            elif name in ARTICLE_FIELD_TAGS and name not in fields:
+                fields[name] = nodeText(node)
+        if node is last_node:
+            # extract the info from the xml tree
+            title = fields['title']
+            rank = article['rank']
+            score = article['score']
+            pmid = fields['pmid']
+            year = fields['year']
+            # add the info into our article info class object
+            a = articleInfo(pmid)
+            a.score = int(score) # read as str, convert to int for sorting
+            a.rank = int(rank) # read as str, convert to int for sorting
+            a.title = title
+            a.year = int(year) # read as str, convert to int for sorting
+            a.authors = author_names
+            return_results.append(a)
+            fields = None
+            last_node = None
     return return_results
 
 
@@ -183,7 +288,7 @@ def GetAuthorInfo(soup):
     for metric, name, evidence in zip (author_metric, author_names, author_evidence):
         rank = metric['rank']
         score = metric['score']
-        name = name.contents[0]
+        name = nodeText(name)
         author_articles = GetArticleInfo(evidence)
         evidence = evidence
         # add the info into our article info class object
@@ -195,153 +300,501 @@ def GetAuthorInfo(soup):
     return return_results
 
 
-def formatJournalResults(journal_results):
+class StreamingJaneParser:
     """
-    Take the rank and score and format for printing.
-    Picking the top 5 is arbitrary. If less than 5 results are 
-    returned by the API this module will break.
-    
-    TODO: factor out the number of results that are returned.
+    Event driven parser for JANE responses, an alternative to building a
+    BeautifulStoneSoup tree and walking it with the Get*Info functions.
+
+    Feed it the response in chunks as they arrive from the socket, it hands
+    each journalInfo, articleInfo or authorInfo to on_record as soon as the
+    closing tag of the record has been seen, so only the record being built
+    is held in memory. By default records are collected in self.results.
+
+    The records match what GetJournalInfo, GetArticleInfo and GetAuthorInfo
+    build from the same document. Tag names are lowercased, as the soup
+    does. The authors response is read as metric/name/evidence triplets of
+    children of the root, like GetAuthorInfo.
 
     """
-    journal_results.sort(sort_results_by_rank)
-    top_5_by_rank = journal_results[0:5]
-    journal_results.sort(sort_results_by_score)
-    top_5_by_score = journal_results[0:5]
+    TEXT_FIELDS = ('journalname', 'title', 'pmid', 'year', 'author')
+
+    def __init__(self, kind, on_record=None):
+        self.kind = kind
+        self.results = []
+        if on_record is None:
+            on_record = self.results.append
+        self.on_record = on_record
+        self._parser = xml.parsers.expat.ParserCreate()
+        self._parser.buffer_text = True
+        self._parser.StartElementHandler = self._start
+        self._parser.EndElementHandler = self._end
+        self._parser.CharacterDataHandler = self._characters
+        self._depth = 0
+        self._field = None # (tag, depth, field) whose text is being collected
+        self._text = []
+        self._seen = {}
+        self._journal = None
+        self._article = None
+        self._author = None
+        self._root_children = 0
+
+    def feed(self, data):
+        self._parser.Parse(data, False)
+
+    def close(self):
+        self._parser.Parse('', True)
+        return self.results
+
+    def _collect(self, tag, field):
+        if self._field is None and field not in self._seen:
+            self._field = (tag, self._depth, field)
+            self._text = []
+
+    def _start(self, name, attrs):
+        name = name.lower()
+        self._depth += 1
+        if self.kind == 'authors' and self._depth == 2:
+            position = self._root_children % 3
+            if position == 0:
+                self._author = authorInfo(None)
+                self._author.rank = int(attrs['rank'])
+                self._author.score = int(attrs['score'])
+                self._seen = {}
+            elif position == 1 and self._author is not None:
+                self._collect(name, 'name')
+            return
+        if name == 'journal':
+            self._journal = journalInfo(None)
+            self._journal.rank = int(attrs['rank'])
+            self._journal.score = int(attrs['score'])
+            self._seen = {}
+        elif name == 'article':
+            self._article = articleInfo(None)
+            self._article.rank = int(attrs['rank'])
+            self._article.score = int(attrs['score'])
+            self._seen = {}
+        elif name == 'journalname' and self._journal is not None:
+            self._collect(name, name)
+        elif name in self.TEXT_FIELDS and self._article is not None:
+            self._collect(name, name)
+
+    def _characters(self, data):
+        if self._field is not None:
+            self._text.append(data)
+
+    def _end(self, name):
+        name = name.lower()
+        if self._field is not None and self._field[:2] == (name, self._depth):
+            field = self._field[2]
+            self._field = None
+            self._setField(field, u''.join(self._text))
+        if name == 'article' and self._article is not None:
+            if self._author is not None:
+                self._author.articles.append(self._article)
+            else:
+                self.on_record(self._article)
+            self._article = None
+        elif name == 'journal' and self._journal is not None:
+            self.on_record(self._journal)
+            self._journal = None
+        if self.kind == 'authors' and self._depth == 2:
+            if self._root_children % 3 == 2 and self._author is not None:
+                self.on_record(self._author)
+                self._author = None
+            self._root_children += 1
+        self._depth -= 1
+
+    def _setField(self, field, text):
+        if field == 'author':
+            self._article.authors.append(text)
+            return
+        self._seen[field] = True
+        if field == 'journalname':
+            self._journal.journalname = text
+        elif field == 'name':
+            self._author.name = text
+        elif field == 'title':
+            self._article.title = text
+        elif field == 'pmid':
+            self._article.pmid = text
+        elif field == 'year':
+            self._article.year = int(text)
+
+
+def packJournal(journal):
+    return (unicode(journal.journalname), journal.rank, journal.score)
+
+
+def unpackJournal(row):
+    j = journalInfo(row[0])
+    j.rank = row[1]
+    j.score = row[2]
+    return j
+
+
+def packArticle(article):
+    authors = tuple([unicode(author) for author in article.authors])
+    return (unicode(article.pmid), unicode(article.title), article.rank,
+            article.score, article.year, authors)
+
+
+def unpackArticle(row):
+    a = articleInfo(row[0])
+    a.title = row[1]
+    a.rank = row[2]
+    a.score = row[3]
+    a.year = row[4]
+    a.authors = list(row[5])
+    return a
+
+
+def packAuthor(author):
+    articles = tuple([packArticle(article) for article in author.articles])
+    return (unicode(author.name), author.rank, author.score, articles)
+
+
+def unpackAuthor(row):
+    au = authorInfo(row[0])
+    au.rank = row[1]
+    au.score = row[2]
+    au.articles = [unpackArticle(article) for article in row[3]]
+    return au
+
+
+RESULT_PACKERS = {
+    'journals': (packJournal, unpackJournal),
+    'articles': (packArticle, unpackArticle),
+    'authors': (packAuthor, unpackAuthor),
+}
+
+
+def packResults(kind, results):
+    """
+    Flattens parsed journalInfo, articleInfo or authorInfo objects into
+    plain tuples and marshals them, tagged with the schema version. This is
+    what goes into the query cache: it is compact, and unpacking it is much
+    cheaper than building a soup. The soup strings are copied to plain
+    unicode so the cached records don't keep the parse tree alive.
+
+    """
+    pack = RESULT_PACKERS[kind][0]
+    rows = [pack(result) for result in results]
+    return marshal.dumps((PARSE_SCHEMA_VERSION, kind, rows))
+
+
+def unpackResults(data):
+    """
+    Rebuilds the result objects from packResults output. Returns None for
+    data written under another schema version, or that is corrupt, so it is
+    treated as a miss.
+
+    """
+    try:
+        version, kind, rows = marshal.loads(data)
+    except (ValueError, EOFError, TypeError):
+        return None
+    if version != PARSE_SCHEMA_VERSION or kind not in RESULT_PACKERS:
+        return None
+    unpack = RESULT_PACKERS[kind][1]
+    try:
+        return [unpack(row) for row in rows]
+    except (ValueError, TypeError, IndexError):
+        return None
 
-    text = "top 5 journals by score: "
-    for journal in top_5_by_score:
+
+def formatJournalResults(journal_results, k=None):
+    """
+    Take the rank and score and format for printing, listing the top k
+    journals by each (TOP_K['journals'] unless k is given).
+
+    """
+    if k is None:
+        k = TOP_K['journals']
+    top_by_rank, top_by_score = selectTopResults(journal_results, k,
+                                                 (byRank, byScore))
+
+    text = "top " + str(k) + " journals by score: "
+    for journal in top_by_score:
         text = text + journal.journalname  + " " +  str(journal.score) + "\n"
     
-    text = text + "\ntop 5 journals by rank: \n"
-    for journal in top_5_by_rank:
+    text = text + "\ntop " + str(k) + " journals by rank: \n"
+    for journal in top_by_rank:
         text = text + journal.journalname + " " + str(journal.rank) + "\n"      
     return text
 
 
-def formatArticleResults(Results):
+def formatArticleResults(Results, k=None):
     """
-    Take the rank and score and format for printing.
-    Picking the top 5 is arbitrary. If less than 5 results are 
-    returned by the API this module will break.
-    
-    TODO: factor out the number of results that are returned.
+    Take the rank and score and format for printing, listing the top k
+    articles by each (TOP_K['articles'] unless k is given).
 
     """    
-    Results.sort(sort_results_by_rank)
-    top_5_by_rank = Results[0:5]
-    Results.sort(sort_results_by_score)
-    top_5_by_score = Results[0:5]
+    if k is None:
+        k = TOP_K['articles']
+    top_by_rank, top_by_score = selectTopResults(Results, k,
+                                                 (byRank, byScore))
     
-    text = "top 5 articles by score: "
-    for article in top_5_by_score:
+    text = "top " + str(k) + " articles by score: "
+    for article in top_by_score:
         text = text + article.title + " " +  str(article.score) + "\n"
         pubmed_link = genPubMedLinkFromPMID(article.pmid)
         text = text + article.pmid + "(" + pubmed_link + ")\n"
     
-    text = text + "\ntop 5 articles by rank: \n"
-    for article in top_5_by_rank:
+    text = text + "\ntop " + str(k) + " articles by rank: \n"
+    for article in top_by_rank:
         text = text + article.title + " " + str(article.rank) + "\n"
         pubmed_link = genPubMedLinkFromPMID(article.pmid)
         text = text + article.pmid + "(" + pubmed_link + ")\n"                    
     return text
 
 
-def genLink(a, b):
-    return '"' + a.pmid + " " + str(a.year) + '" -> "' + b.pmid + " " + str(b.year) + '"\n'
+def genLink(a, b, weight=1):
+    return ('"' + a.pmid + " " + str(a.year) + '" -> "' + b.pmid + " " +
+            str(b.year) + '" [weight=' + str(weight) + ']\n')
     #return a.pmid + " -> " + b.pmid + "\n"
 
 
-def graphArticleRelationships(Results):
+MAX_GRAPH_LINKS = 12 # artifical limit to fit in demo window
+
+
+def buildArticleGraph(Results):
     """
-    Take the rank and score and format for printing.
-    Picking the top 5 is arbitrary. If less than 5 results are 
-    returned by the API this module will break.
-    
-    TODO: factor out the number of results that are returned.
+    Sorts the articles oldest first and builds the weighted co-authorship
+    graph over them, node i being articles[i]. Returns (articles, graph).
+
+    """
+    articles = sorted(Results, key=articleYear)
+    graph = jane_graph.buildCoauthorshipGraph(
+        [article.authors for article in articles])
+    return articles, graph
+
+
+def graphArticleRelationships(Results, max_links=MAX_GRAPH_LINKS):
+    """
+    Draws a DOT graph linking articles that share authors, weighted by the
+    number of shared authors. The whole graph is computed and then only the
+    max_links heaviest links are drawn.
 
     """    
-    Results.sort(sort_results_by_year)
+    articles, graph = buildArticleGraph(Results)
     text = "#!dot\n" # required for graph robot
-    targets = Results
-    max_links = 12 # artifical limit to fit in demo window
-    link_num = 0 
-    for a in Results:
-        a_auths = a.authors
-        targets.remove(a) # if a -> b, then b -> a, so don't check twice
-        for b in targets:
-            b_auths = b.authors
-            for a_auth in a_auths:
-                if a_auth in b_auths and link_num < max_links:
-                    edge = genLink(a, b)
-                    text = text + edge
-                    link_num = link_num + 1
-                    break
+    for k in graph.strongestEdges(max_links):
+        a = articles[graph.sources[k]]
+        b = articles[graph.targets[k]]
+        text = text + genLink(a, b, graph.weights[k])
     return text
 
 
-def formatAuthorResults(Results):
+def genAuthorLink(a, b, weight=1):
+    return ('"' + a.replace('"', '\\"') + '" -> "' + b.replace('"', '\\"') +
+            '" [weight=' + str(weight) + ']\n')
+
+
+def graphAuthorNetwork(Results, max_links=MAX_GRAPH_LINKS):
     """
-    Take the rank and score and format for printing.
-    Picking the top 5 is arbitrary. If less than 5 results are 
-    returned by the API this module will break.
-    
-    TODO: factor out the number of results that are returned.
+    Draws a DOT graph of who wrote with whom, from the evidence articles
+    JANE returns for each author. An article that is evidence for several
+    authors is only counted once. The whole network is computed and then
+    only the max_links heaviest links are drawn.
+
+    """
+    seen_pmids = set()
+    author_lists = []
+    for author in Results:
+        for article in author.articles:
+            if article.pmid in seen_pmids:
+                continue
+            seen_pmids.add(article.pmid)
+            author_lists.append(article.authors)
+    names, graph = jane_graph.buildAuthorNetwork(author_lists)
+    text = "#!dot\n" # required for graph robot
+    for k in graph.strongestEdges(max_links):
+        a = names[graph.sources[k]]
+        b = names[graph.targets[k]]
+        text = text + genAuthorLink(a, b, graph.weights[k])
+    return text
+
 
+def formatAuthorResults(Results, k=None):
     """
-    Results.sort(sort_results_by_rank)
-    top_5_by_rank = Results[0:5]
-    Results.sort(sort_results_by_score)
-    top_5_by_score = Results[0:5]
+    Take the rank and score and format for printing, listing the top k
+    authors by each (TOP_K['authors'] unless k is given).
 
-    text = "top 5 authors by score: "
-    for author in top_5_by_score:
+    """
+    if k is None:
+        k = TOP_K['authors']
+    top_by_rank, top_by_score = selectTopResults(Results, k,
+                                                 (byRank, byScore))
+
+    text = "top " + str(k) + " authors by score: "
+    for author in top_by_score:
         text = text + author.name + " " +  str(author.score) + "\n"
     
-    text = text + "\ntop 5 authors by rank: \n"
-    for author in top_5_by_rank:
+    text = text + "\ntop " + str(k) + " authors by rank: \n"
+    for author in top_by_rank:
         text = text + author.name + " " + str(author.rank) + "\n"
     
     return text
 
 
+# The graph needs a wide article set to find overlapping authors, and the
+# article listing is just the top of that same set, so both commands are
+# planned onto one count=100 articles fetch and share its parse.
+WIDEST_ARTICLE_COUNT = 100
+QUERY_PLANS = {
+    # command: (JANE endpoint, result kind, count)
+    'journals': ('journals', 'journals', None),
+    'authors': ('authors', 'authors', None),
+    'articles': ('articles', 'articles', WIDEST_ARTICLE_COUNT),
+    'graph': ('articles', 'articles', WIDEST_ARTICLE_COUNT),
+    'network': ('authors', 'authors', None),
+}
+
+
+def planQuery(command):
+    """
+    Returns the (endpoint, kind, count) tuple describing which JANE
+    request answers command.
+
+    """
+    return QUERY_PLANS[command]
+
+
+def normalizeQuery(query_text):
+    return jane_query.normalizeQueryText(query_text, QUERY_STOPWORDS)
+
+
+def generateQueryKey(command, query_text):
+    """
+    The fingerprint of the JANE request answering command, used as the
+    cache key. Commands planned onto the same request and texts that only
+    differ in spacing, case or markup all share one key.
+
+    """
+    endpoint, kind, count = planQuery(command)
+    return jane_query.queryFingerprint(endpoint, count,
+                                       normalizeQuery(query_text))
+
+
 def generateQueryUrl(command, query_text):
     """
-    If the command is to graph, then we pull more results in order to find
-    an overlap between authors.
+    Commands that can be answered from the same dataset are planned onto
+    the same url.
     
     """
-    jane_root_url = 'http://biosemantics.org:8080/jane/'
-    encoded_query_text = urllib.quote(query_text.rstrip().lstrip())
-    if command == 'graph':
-        query_url = jane_root_url + "articles?text=" + encoded_query_text
-        query_url = query_url + "&count=100"
-    else:
-        query_url = jane_root_url + command + "?text=" + encoded_query_text
+    cleaned_text = jane_query.cleanQueryText(query_text)
+    encoded_query_text = urllib.quote(cleaned_text.encode('utf-8'))
+    endpoint, kind, count = planQuery(command)
+    query_url = JANE_ROOT_URL + endpoint + "?text=" + encoded_query_text
+    if count:
+        query_url = query_url + "&count=" + str(count)
 
     return query_url
     
     
-def downloadXMLFromnJane(query_url):
+def openJaneUrl(query_url, sink=None, timeout=None):
     """
-    TODO: convert to a POST call rather than a GET call 
-    TODO: create a propoer user agent so JANE recognises the calls as coming from janey
-    TODO: add proper error handling to this botched script
-    
+    Sends the request for query_url to JANE and returns the response, see
+    jane_http for sink. With JANE_USE_POST the query string is sent as the
+    request body instead; query_url stays what the query is cached under.
+
+    Every request says it comes from janey and accepts a compressed
+    response, which jane_http decompresses as it is read. A 4xx status from
+    JANE is raised as a jane_fetch.RejectedError, which is not retried, and
+    any other error status as a jane_fetch.FetchError.
+
     """
-    try:
-        html = urllib.urlopen(query_url)
-        document = html.read()
-        vanilla_doc = document.decode('us-ascii', 'ignore')
-        soup = BeautifulStoneSoup(vanilla_doc)
-    except:
-        return "error"
-    return soup
+    headers = {'User-Agent': JANE_USER_AGENT}
+    if JANE_ACCEPT_ENCODING:
+        headers['Accept-Encoding'] = JANE_ACCEPT_ENCODING
+    if JANE_USE_POST and '?' in query_url:
+        url, body = query_url.split('?', 1)
+        headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        response = jane_pool.urlopen(url, 'POST', body, headers, sink=sink,
+                                     timeout=timeout)
+    else:
+        response = jane_pool.urlopen(query_url, headers=headers, sink=sink,
+                                     timeout=timeout)
+    if 400 <= response.status < 500:
+        raise jane_fetch.RejectedError('JANE answered %d %s' %
+                                       (response.status, response.reason))
+    if response.status != 200:
+        raise jane_fetch.FetchError('JANE answered %d %s' %
+                                    (response.status, response.reason))
+    return response
+
+
+def makeSoup(document):
+    """
+    Builds the soup for a JANE response. The encoding is read from the
+    document, and character references and XML and HTML entities are
+    decoded, as expat does for StreamingJaneParser.
 
-def QueryJaneAPI(command, query_text):
     """
-    uses http GET
-    
+    return BeautifulStoneSoup(
+        document, convertEntities=BeautifulStoneSoup.XHTML_ENTITIES)
+
+
+def parseSoup(soup, kind):
+    if kind == "journals":
+        return GetJournalInfo(soup)
+    elif kind == "authors":
+        return GetAuthorInfo(soup)
+    return GetArticleInfo(soup)
+
+
+def downloadXMLFromnJane(query_url, timeout=None):
+    html = openJaneUrl(query_url, timeout=timeout)
+    return makeSoup(html.read())
+
+
+USE_STREAMING_PARSER = True # False goes back to building a soup per query
+
+
+def streamResultsFromJane(query_url, kind, timeout=None):
+    """
+    Fetches query_url and parses the response while it is still coming in
+    from the socket, returns the list of parsed records.
+
+    The response is also kept as it arrives. If expat rejects it as
+    malformed, the rest is still read and the whole document is given to
+    the more forgiving soup parser, without asking JANE again.
+
+    """
+    parser = StreamingJaneParser(kind)
+    chunks = []
+    errors = []
+
+    def sink(data):
+        chunks.append(data)
+        if not errors:
+            try:
+                parser.feed(data)
+            except xml.parsers.expat.ExpatError, e:
+                errors.append(e)
+
+    openJaneUrl(query_url, sink=sink, timeout=timeout)
+    if not errors:
+        try:
+            return parser.close()
+        except xml.parsers.expat.ExpatError, e:
+            errors.append(e)
+    logger.warning('falling back to soup for %s: %s', query_url, errors[0])
+    return parseSoup(makeSoup(''.join(chunks)), kind)
+
+
+def fetchResultsFromJane(query_url, kind, timeout=None):
+    """
+    Returns the parsed records of the given kind for query_url, raising if
+    JANE could not be reached within timeout seconds.
+
+    """
+    if USE_STREAMING_PARSER:
+        return streamResultsFromJane(query_url, kind, timeout)
+    return parseSoup(downloadXMLFromnJane(query_url, timeout), kind)
+
+def QueryJaneAPI(command, query_text, fetched=None):
+    """
     The 3 relevant URLs are
     http://biosemantics.org:8080/jane/journals
     http://biosemantics.org:8080/jane/authors
@@ -356,29 +809,66 @@ def QueryJaneAPI(command, query_text):
     For example:
     http://biosemantics.org:8080/jane/journals?text=malaria%20vaccines
 
+    The parsed results are cached on the query fingerprint (see
+    generateQueryKey), so a repeated query skips both the round trip to
+    JANE and the parse, while the formatting below is always redone.
+    Callers handling several commands at once can pass a fetched dict,
+    which remembers parsed results by fingerprint for the rest of that
+    request even if the cache drops them.
+
+    Calls to JANE go through jane_fetcher. If they fail, or the circuit
+    breaker has given up on JANE for now, a stale cached answer is served
+    rather than an error. Identical queries arriving while one is already
+    being fetched wait for it through jane_flights instead of asking again.
+
     """
     query_url = generateQueryUrl(command, query_text)
-    soup = downloadXMLFromnJane(query_url)
-    
-    if not soup:
-        return "error in communicating with JANE server"
-    
+    query_key = generateQueryKey(command, query_text)
+    endpoint, kind, count = planQuery(command)
+    query_stats.record(u'%s\n%s\n%s' % (endpoint, count, query_text),
+                       query_key)
+
+    results = None
+    if fetched is not None and query_key in fetched:
+        results = fetched[query_key]
+    else:
+        packed_results = query_cache.get(query_key)
+        if packed_results is not None:
+            logger.debug('query cache hit for %s', query_url)
+            results = unpackResults(packed_results)
+    if results is None:
+        try:
+            results = jane_flights.do(query_key, jane_fetcher.call, command,
+                    lambda timeout: fetchResultsFromJane(query_url, kind,
+                                                         timeout))
+        except Exception, e:
+            logger.warning('JANE query %s failed: %s', query_url, e)
+            packed_results = query_cache.get_stale(query_key)
+            if packed_results is not None:
+                results = unpackResults(packed_results)
+            if results is None:
+                return "error in communicating with JANE server"
+            logger.debug('serving stale results for %s', query_url)
+        else:
+            query_cache.set(query_key, packResults(kind, results))
+    if fetched is not None:
+        fetched[query_key] = results
+
     return_text = ""
     if command == "journals":
-        journal_results = GetJournalInfo(soup)
-        return_text = formatJournalResults(journal_results)
+        return_text = formatJournalResults(results)
     elif command == "authors":
-        author_results = GetAuthorInfo(soup)
-        return_text = formatAuthorResults(author_results)
+        return_text = formatAuthorResults(results)
     elif command == "articles":
-        article_results = GetArticleInfo(soup)
-        return_text = formatArticleResults(article_results)
+        return_text = formatArticleResults(results)
     elif command == "graph":
-        article_results = GetArticleInfo(soup)
-        return_text = graphArticleRelationships(article_results)                 
+        return_text = graphArticleRelationships(results)
+    elif command == "network":
+        return_text = graphAuthorNetwork(results)
     return return_text
     
 
+
 def OnRobotAdded(properties, context):
     """
     Invoked when the robot has been added.
@@ -411,19 +901,24 @@ def StripCommandFromBlipText(blipText, command):
     return stripped_text
 
 
-def StripCommandFromBlip(properties, context, blip_text, command):
+def StripCommandsFromBlip(properties, context, blip_text, commands):
     """
     Take a blip and modify the blip in place
-    Remove the janey command string from the blip
+    Remove the janey command strings from the blip
 
     """
-    logger.debug('stripping the command from the blip')    
+    logger.debug('stripping the commands from the blip')    
     blip = context.GetBlipById(properties['blipId'])
-    stripped_text = StripCommandFromBlipText(blip_text, command)
+    stripped_text = blip_text
+    for command in commands:
+        stripped_text = StripCommandFromBlipText(stripped_text, command)
     blip.GetDocument().SetText(stripped_text)
 
 
-def ReplyToBlipWithJaneInfo(properties, context, blip_text, command):
+JANE_COMMANDS = ['authors', 'journals', 'articles', 'graph', 'network']
+
+
+def CommandResponse(command, query_text, fetched=None):
     """
     If we recognize the command, send a query to the Jane API
     If not demur with a polite response
@@ -433,24 +928,190 @@ def ReplyToBlipWithJaneInfo(properties, context, blip_text, command):
         response = HELP_MESSAGE
     elif command == 'about':
         response = ABOUT_MESSAGE
-    elif command in ['authors', 'journals', 'articles', 'graph']:
-        query_text = StripCommandFromBlipText(blip_text, command)
+    elif command in JANE_COMMANDS:
         logger.debug('about to call JANE API')    
-        query_result = QueryJaneAPI(command, query_text)
-        response = query_result
+        response = QueryJaneAPI(command, query_text, fetched)
     else:
         response = "Hmm, I'm not sure what you mean, sorry!,\
          try (janey:help) for a list of commands I understand"
-        
+    return response
+
+
+def RunCommandGroup(commands, query_text):
+    """
+    Answers commands one after the other, sharing whatever they fetch.
+
+    """
+    fetched = {}
+    return [CommandResponse(command, query_text, fetched)
+            for command in commands]
+
+
+def GetCommandPool():
+    global command_pool
+    if command_pool is None:
+        command_pool = jane_tasks.LocalTaskQueue(workers=COMMAND_WORKERS)
+    return command_pool
+
+
+def AnswerCommands(commands, query_text):
+    """
+    Works out the reply to the commands found in one blip.
+
+    Commands answered by the same JANE request (see planQuery) are grouped
+    so they share one fetch. With CONCURRENT_COMMANDS on, the groups run
+    at the same time on worker threads, so the blip costs about as much as
+    its slowest request rather than the sum of them all. Every group has to
+    finish within one COMMAND_DEADLINE from the start; any that doesn't is
+    answered with a timeout message.
+
+    A single command gets its answer as is, several get their answers one
+    after the other in the order they were written, each under its command.
+
+    """
+    groups = []
+    group_by_key = {}
+    for command in commands:
+        if command in JANE_COMMANDS:
+            key = generateQueryKey(command, query_text)
+        else:
+            key = None # help, about and unknown commands need no fetch
+        if key not in group_by_key:
+            group_by_key[key] = []
+            groups.append(group_by_key[key])
+        group_by_key[key].append(command)
+
+    responses = {}
+    if CONCURRENT_COMMANDS and len(groups) > 1:
+        deadline = time.time() + COMMAND_DEADLINE
+        pool = GetCommandPool()
+        results = [pool.submit(RunCommandGroup, group, query_text)
+                   for group in groups]
+        for group, result in zip(groups, results):
+            if not result.wait(max(0, deadline - time.time())):
+                group_responses = [COMMAND_TIMEOUT_MESSAGE] * len(group)
+            elif result.error is not None:
+                logger.error('%s failed: %s', group, result.error)
+                group_responses = ["error in communicating with JANE server"
+                                   ] * len(group)
+            else:
+                group_responses = result.value
+            for command, response in zip(group, group_responses):
+                responses[command] = response
+    else:
+        for group in groups:
+            for command, response in zip(group,
+                    RunCommandGroup(group, query_text)):
+                responses[command] = response
+
+    if len(commands) == 1:
+        return responses[commands[0]]
+    sections = ["(janey:" + command + ")\n" + responses[command]
+                for command in commands]
+    return "\n\n".join(sections)
+
+
+def ReplyToBlipWithJaneInfo(properties, context, blip_text, commands):
+    """
+    Replies to the blip with the answer to the commands found in it, a
+    single command name or a list of them. The query sent to JANE is the
+    blip text with every command removed.
+
+    """
+    if isinstance(commands, basestring):
+        commands = [commands]
+    query_text = blip_text
+    for command in commands:
+        query_text = StripCommandFromBlipText(query_text, command)
+    if ASYNC_REPLIES:
+        jane_commands = [c for c in commands if c in JANE_COMMANDS]
+        if jane_commands:
+            DeferJaneReply(properties, context, commands, query_text)
+            return
+    response = AnswerCommands(commands, query_text)
     blip = context.GetBlipById(properties['blipId']) 
     blip.CreateChild().GetDocument().SetText(response)
     
     
+def GetTaskQueue():
+    global task_queue
+    if task_queue is None:
+        task_queue = jane_tasks.LocalTaskQueue()
+    return task_queue
+
+
+def RunDeferredQuery(token, commands, query_text):
+    """
+    Runs on the task queue: queries JANE and stores the answer until it can
+    be delivered.
+
+    """
+    try:
+        response = AnswerCommands(commands, query_text)
+    except:
+        logger.exception('deferred JANE query failed')
+        response = "error in communicating with JANE server"
+    pending_replies.complete(token, response)
+
+
+def DeferJaneReply(properties, context, commands, query_text):
+    """
+    Replies with a placeholder blip right away and queues the JANE query,
+    so handling the event does not wait on the JANE server. The answer is
+    put into the placeholder by DeliverPendingReplies.
+
+    """
+    blip = context.GetBlipById(properties['blipId'])
+    wavelet_key = (blip.GetWaveId(), blip.GetWaveletId())
+    token = pending_replies.add(wavelet_key, blip.GetId())
+    blip.CreateChild().GetDocument().SetText(PLACEHOLDER_MESSAGE % token)
+    GetTaskQueue().add(RunDeferredQuery, token, commands, query_text)
+    logger.debug('queued %s as %s', commands, token)
+
+
+def FindPlaceholderBlip(context, token):
+    marker = PLACEHOLDER_MESSAGE % token
+    for blip in context.GetBlips():
+        if marker in blip.GetDocument().GetText():
+            return blip
+    return None
+
+
+def DeliverPendingReplies(properties, context):
+    """
+    Robots can only change a wave when the server calls them, so answers
+    from the background queue are delivered on the next event we get for
+    their wavelet. The placeholder blip is filled in if the server sent it
+    along; otherwise the answer goes into a new reply to the original blip.
+    Answers with neither blip in the context wait for a later event.
+
+    Answers are claimed from pending_replies before they are delivered, so
+    events of one wavelet handled at the same time (see EVENT_WORKERS)
+    never deliver the same answer twice.
+
+    """
+    for wavelet in context.GetWavelets():
+        wavelet_key = (wavelet.GetWaveId(), wavelet.GetId())
+        for reply in pending_replies.ready(wavelet_key):
+            placeholder = FindPlaceholderBlip(context, reply.token)
+            if placeholder is not None:
+                placeholder.GetDocument().SetText(reply.text)
+            else:
+                blip = context.GetBlipById(reply.blip_id)
+                if blip is None:
+                    pending_replies.put_back(reply)
+                    continue
+                blip.CreateChild().GetDocument().SetText(reply.text)
+            logger.debug('delivered reply %s', reply.token)
+
+
 def OnBlipSubmitted(properties, context):
     """
     Invoked when a blip has been added.
 
     """
+    if ASYNC_REPLIES:
+        DeliverPendingReplies(properties, context)
     blip = context.GetBlipById(properties['blipId']) 
     blip_text_view = blip.GetDocument()
     blip_text = blip_text_view.GetText()
@@ -463,21 +1124,44 @@ def OnBlipSubmitted(properties, context):
     re6 = '(\\))'    # Any Single Character 3
     rg = re.compile(re1+re2+re3+re4+re5+re6, re.IGNORECASE|re.DOTALL)
     logger.debug('about to search blip text')    
-    m = rg.search(blip_text)
-
-    if m:
+    commands = []
+    for m in rg.finditer(blip_text):
         command = m.group(4)
-        StripCommandFromBlip(properties, context, blip_text, command)
-        ReplyToBlipWithJaneInfo(properties, context, blip_text, command)
-        logger.debug('query syntax recognised, command was %s', command)
+        if command not in commands:
+            commands.append(command)
 
+    if commands:
+        StripCommandsFromBlip(properties, context, blip_text, commands)
+        ReplyToBlipWithJaneInfo(properties, context, blip_text, commands)
+        logger.debug('query syntax recognised, commands were %s', commands)
 
-if __name__ == '__main__':
+
+def main():
+    """
+    App Engine caches a handler script that defines main() and calls it on
+    every request instead of running the whole script again, so the
+    connection pool, query cache, circuit breaker, pending replies and
+    stats above live as long as the instance rather than one request.
+
+    """
+    # imported here so the module can be loaded away from App Engine, e.g.
+    # by parser-benchmark.py
+    from waveapi import robot
     logger.debug('text: %s' % "running version " + current_version)
     myRobot = robot.Robot('janey-robot', 
             image_url='http://janey-robot.appspot.com/assets/icon.png',
             version=current_version,
-            profile_url='http://janey-robot.appspot.com/')
+            profile_url='http://janey-robot.appspot.com/',
+            event_workers=EVENT_WORKERS)
     myRobot.RegisterHandler(events.WAVELET_SELF_ADDED, OnRobotAdded)
     myRobot.RegisterHandler(events.BLIP_SUBMITTED, OnBlipSubmitted)
-    myRobot.Run()
\ No newline at end of file
+    if ASYNC_REPLIES:
+        # more chances to hand over answers from the background queue
+        myRobot.RegisterHandler(events.DOCUMENT_CHANGED, DeliverPendingReplies)
+        myRobot.RegisterHandler(events.WAVELET_BLIP_CREATED,
+                                DeliverPendingReplies)
+    myRobot.Run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,455 @@
+"""Unit tests for janey-robot.py."""
+
+import imp
+import marshal
+import os
+import threading
+import time
+import unittest
+
+import jane_fetch
+import jane_standin
+import jane_tasks
+from waveapi import events
+from waveapi import robot_abstract
+from waveapi import simplejson
+
+janey = imp.load_source('janey_robot', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'janey-robot.py'))
+
+HEADER = '<?xml version="1.0" encoding="UTF-8"?>'
+JOURNALS_XML = HEADER + (
+    '<results>'
+    '<journal rank="1" score="90"><journalname>Ecology &amp; Evolution'
+    '</journalname></journal>'
+    '<journal rank="2" score="80"><journalname>Revue m\xc3\xa9dicale '
+    '&#233;trang&#232;re</journalname></journal>'
+    '<journal rank="3" score="70"><journalname><i>Lancet</i> Infect Dis'
+    '</journalname></journal>'
+    '</results>')
+ARTICLE_XML = (
+    '<article rank="%d" score="%d"><title>Parasitaemia &lt;5%% in '
+    '<i>P. falciparum</i> &amp; <b>P. vivax</b></title><pmid>%d</pmid>'
+    '<year>2009</year><authors><author>M\xc3\xbcller A</author>'
+    '<author>O&apos;Brien <sup>B</sup></author></authors></article>')
+ARTICLES_XML = HEADER + '<results>%s%s</results>' % (
+    ARTICLE_XML % (1, 20, 101), ARTICLE_XML % (2, 10, 102))
+AUTHORS_XML = HEADER + (
+    '<results>'
+    '<author rank="1" score="50"/><name>Garc\xc3\xada &amp; Co</name>'
+    '<evidence>%s</evidence>'
+    '<author rank="2" score="40"/><name>D<i>e</i> Souza</name>'
+    '<evidence>%s</evidence>'
+    '</results>') % (ARTICLE_XML % (1, 20, 101), ARTICLE_XML % (2, 10, 102))
+DOCUMENTS = {
+    'journals': JOURNALS_XML,
+    'articles': ARTICLES_XML,
+    'authors': AUTHORS_XML,
+}
+
+
+class Result(object):
+
+    def __init__(self, name, rank, score):
+        self.name = name
+        self.rank = rank
+        self.score = score
+
+
+class TestSelectTopResults(unittest.TestCase):
+
+    def setUp(self):
+        self.results = [Result('a', 3, 10), Result('b', 1, 30),
+                        Result('c', 2, 30), Result('d', 4, 5),
+                        Result('e', 2, 20)]
+
+    def select(self, k, results=None):
+        if results is None:
+            results = self.results
+        by_rank, by_score = janey.selectTopResults(
+            results, k, (janey.byRank, janey.byScore))
+        return ([result.name for result in by_rank],
+                [result.name for result in by_score])
+
+    def testBestFirst(self):
+        self.assertEqual((['b', 'c', 'e'], ['b', 'c', 'e']), self.select(3))
+
+    def testTiesKeepInputOrder(self):
+        # c and e share rank 2; b and c share score 30, b has the better rank
+        self.assertEqual(['b', 'c', 'e', 'a'], self.select(4)[0])
+        same = [Result(name, 1, 7) for name in 'vwxyz']
+        self.assertEqual((['v', 'w', 'x'], ['v', 'w', 'x']),
+                         self.select(3, same))
+
+    def testKLargerThanResults(self):
+        self.assertEqual((['b', 'c', 'e', 'a', 'd'],
+                          ['b', 'c', 'e', 'a', 'd']), self.select(10))
+        self.assertEqual(([], []), self.select(3, []))
+
+    def testKZero(self):
+        self.assertEqual(([], []), self.select(0))
+
+    def testInputNotReordered(self):
+        before = list(self.results)
+        self.select(2)
+        self.assertEqual(before, self.results)
+
+
+class TestPackedResults(unittest.TestCase):
+
+    def parse(self, kind):
+        parser = janey.StreamingJaneParser(kind)
+        parser.feed(DOCUMENTS[kind])
+        return parser.close()
+
+    def testRoundTrip(self):
+        for kind in DOCUMENTS:
+            results = self.parse(kind)
+            packed = janey.packResults(kind, results)
+            unpacked = janey.unpackResults(packed)
+            self.assertEqual(len(results), len(unpacked))
+            self.assertEqual(packed, janey.packResults(kind, unpacked))
+        article = janey.unpackResults(janey.packResults(
+            'articles', self.parse('articles')))[0]
+        self.assertEqual((u'101', 1, 20, 2009),
+                         (article.pmid, article.rank, article.score,
+                          article.year))
+        self.assertEqual([u'M\xfcller A', u"O'Brien B"], article.authors)
+
+    def testOtherSchemaVersionIsAMiss(self):
+        packed = janey.packResults('journals', self.parse('journals'))
+        real_version = janey.PARSE_SCHEMA_VERSION
+        janey.PARSE_SCHEMA_VERSION = real_version + 1
+        try:
+            self.assertEqual(None, janey.unpackResults(packed))
+        finally:
+            janey.PARSE_SCHEMA_VERSION = real_version
+        self.assertEqual(3, len(janey.unpackResults(packed)))
+
+    def testCorruptDataIsAMiss(self):
+        packed = janey.packResults('articles', self.parse('articles'))
+        for data in ['', 'not marshal data', packed[:len(packed) // 2],
+                     marshal.dumps(5), marshal.dumps((1, 'articles')),
+                     marshal.dumps((janey.PARSE_SCHEMA_VERSION, 'abstracts',
+                                    [])),
+                     marshal.dumps((janey.PARSE_SCHEMA_VERSION, 'articles',
+                                    5)),
+                     marshal.dumps((janey.PARSE_SCHEMA_VERSION, 'articles',
+                                    [5])),
+                     marshal.dumps((janey.PARSE_SCHEMA_VERSION, 'authors',
+                                    [(u'name', 1)]))]:
+            self.assertEqual(None, janey.unpackResults(data))
+
+
+class TestAnswerCommands(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.blocked = set()
+        self.failing = set()
+        self.saved = dict((name, getattr(janey, name)) for name in
+                          ('QueryJaneAPI', 'CONCURRENT_COMMANDS',
+                           'COMMAND_DEADLINE', 'command_pool'))
+        janey.QueryJaneAPI = self.queryJaneAPI
+
+    def tearDown(self):
+        self.release.set()
+        for name, value in self.saved.items():
+            setattr(janey, name, value)
+
+    def queryJaneAPI(self, command, query_text, fetched=None):
+        self.calls.append((command, query_text, fetched))
+        if command in self.blocked:
+            self.release.wait(5)
+        if command in self.failing:
+            raise IOError('connection reset')
+        fetched.setdefault('commands', []).append(command)
+        return '%s for %s after %s' % (command, query_text,
+                                       ' '.join(fetched['commands']))
+
+    def testSingleCommand(self):
+        self.assertEqual('journals for malaria after journals',
+                         janey.AnswerCommands(['journals'], 'malaria'))
+
+    def testGroupsShareAFetch(self):
+        # articles and graph are planned onto the same JANE request
+        response = janey.AnswerCommands(['graph', 'journals', 'help',
+                                         'articles'], 'malaria')
+        self.assertEqual(['graph', 'articles', 'journals'],
+                         [call[0] for call in self.calls])
+        fetched = [call[2] for call in self.calls]
+        self.assertTrue(fetched[0] is fetched[1])
+        self.assertFalse(fetched[0] is fetched[2])
+        self.assertEqual('\n\n'.join([
+            '(janey:graph)\ngraph for malaria after graph',
+            '(janey:journals)\njournals for malaria after journals',
+            '(janey:help)\n' + janey.HELP_MESSAGE,
+            '(janey:articles)\narticles for malaria after graph articles',
+        ]), response)
+
+    def testConcurrentAnswersInCommandOrder(self):
+        janey.CONCURRENT_COMMANDS = True
+        janey.command_pool = jane_tasks.LocalTaskQueue(workers=4)
+        response = janey.AnswerCommands(['authors', 'journals', 'graph',
+                                         'articles'], 'malaria')
+        self.assertEqual('\n\n'.join([
+            '(janey:authors)\nauthors for malaria after authors',
+            '(janey:journals)\njournals for malaria after journals',
+            '(janey:graph)\ngraph for malaria after graph',
+            '(janey:articles)\narticles for malaria after graph articles',
+        ]), response)
+
+    def testSharedDeadline(self):
+        janey.CONCURRENT_COMMANDS = True
+        janey.COMMAND_DEADLINE = 0.2
+        janey.command_pool = jane_tasks.LocalTaskQueue(workers=4)
+        self.blocked.update(['journals', 'authors'])
+        start = time.time()
+        response = janey.AnswerCommands(['journals', 'authors', 'articles'],
+                                        'malaria')
+        elapsed = time.time() - start
+        # every group waits out the same deadline, not one each
+        self.assertTrue(0.2 <= elapsed < 0.4, elapsed)
+        self.assertEqual('\n\n'.join([
+            '(janey:journals)\n' + janey.COMMAND_TIMEOUT_MESSAGE,
+            '(janey:authors)\n' + janey.COMMAND_TIMEOUT_MESSAGE,
+            '(janey:articles)\narticles for malaria after articles',
+        ]), response)
+
+    def testGroupError(self):
+        janey.CONCURRENT_COMMANDS = True
+        janey.command_pool = jane_tasks.LocalTaskQueue(workers=4)
+        self.failing.add('graph')
+        response = janey.AnswerCommands(['graph', 'journals', 'articles'],
+                                        'malaria')
+        error = 'error in communicating with JANE server'
+        self.assertEqual('\n\n'.join([
+            '(janey:graph)\n' + error,
+            '(janey:journals)\njournals for malaria after journals',
+            '(janey:articles)\n' + error,
+        ]), response)
+
+
+WAVE_ID = 'example.com!w+test'
+WAVELET_ID = 'example.com!conv+root'
+
+
+def waveBody(blips, submitted=None):
+    """
+    The JSON body of a request carrying blips, a list of (blip id, text),
+    and a BLIP_SUBMITTED event for each blip id in submitted, by default
+    just the first blip.
+
+    """
+    if submitted is None:
+        submitted = [blips[0][0]]
+    blip_data = {}
+    for blip_id, content in blips:
+        blip_data[blip_id] = {
+            'blipId': blip_id, 'content': content, 'waveId': WAVE_ID,
+            'waveletId': WAVELET_ID, 'creator': 'someone@example.com',
+            'contributors': ['someone@example.com'], 'childBlipIds': [],
+            'annotations': [], 'elements': {}, 'parentBlipId': None,
+            'lastModifiedTime': 1, 'version': 3}
+    return simplejson.dumps({
+        'blips': blip_data,
+        'events': [{'type': 'BLIP_SUBMITTED', 'timestamp': 1,
+                    'modifiedBy': 'someone@example.com',
+                    'properties': {'blipId': blip_id}}
+                   for blip_id in submitted],
+        'wavelet': {'waveId': WAVE_ID, 'waveletId': WAVELET_ID,
+                    'rootBlipId': blips[0][0], 'title': '',
+                    'creator': 'someone@example.com', 'creationTime': 1,
+                    'lastModifiedTime': 1, 'version': 5,
+                    'dataDocuments': None,
+                    'participants': ['someone@example.com']}})
+
+
+class TestDeferredReplies(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = dict((name, getattr(janey, name)) for name in
+                          ('QueryJaneAPI', 'ASYNC_REPLIES', 'pending_replies',
+                           'task_queue', 'FindPlaceholderBlip'))
+        janey.QueryJaneAPI = lambda command, query_text, fetched=None: (
+            '%s about %s' % (command, query_text.strip()))
+        janey.ASYNC_REPLIES = True
+        janey.pending_replies = jane_tasks.PendingReplies()
+        janey.task_queue = jane_tasks.LocalTaskQueue(workers=1)
+
+    def tearDown(self):
+        for name, value in self.saved.items():
+            setattr(janey, name, value)
+
+    def submit(self, blips):
+        context, events = robot_abstract.ParseJSONBody(waveBody(blips))
+        janey.OnBlipSubmitted(events[0].properties, context)
+        return context
+
+    def texts(self, context):
+        return sorted([blip.GetDocument().GetText()
+                       for blip in context.GetBlips()])
+
+    def deferQuery(self):
+        context = self.submit([('b+1', 'malaria (janey:journals)')])
+        self.assertEqual(1, len(janey.pending_replies))
+        texts = self.texts(context)
+        texts.remove('malaria ')
+        placeholder = texts[0]
+        token = placeholder.split()[-1].rstrip(']')
+        self.assertEqual(janey.PLACEHOLDER_MESSAGE % token, placeholder)
+        janey.task_queue.join()
+        self.assertEqual(1, len(janey.pending_replies))
+        return placeholder
+
+    def testPlaceholderIsFilledIn(self):
+        placeholder = self.deferQuery()
+        context = self.submit([('b+2', 'a later blip'),
+                               ('b+1', 'malaria '), ('b+9', placeholder)])
+        self.assertEqual(['a later blip', 'journals about malaria',
+                          'malaria '], self.texts(context))
+        self.assertEqual(0, len(janey.pending_replies))
+
+    def testPlaceholderFromAnotherProcessIsLeftAlone(self):
+        self.deferQuery()
+        # what an earlier process, whose answer was lost, left behind
+        stale = janey.PLACEHOLDER_MESSAGE % '1'
+        context = self.submit([('b+2', 'a later blip'),
+                               ('b+1', 'malaria '), ('b+8', stale)])
+        self.assertEqual(sorted(['a later blip', 'journals about malaria',
+                                 'malaria ', stale]), self.texts(context))
+
+    def testReplyToOriginalBlip(self):
+        self.deferQuery()
+        context = self.submit([('b+2', 'a later blip'), ('b+1', 'malaria ')])
+        self.assertEqual(['a later blip', 'journals about malaria',
+                          'malaria '], self.texts(context))
+        self.assertEqual(0, len(janey.pending_replies))
+
+    def testWaitsForABlipToReplyTo(self):
+        self.deferQuery()
+        context = self.submit([('b+2', 'a later blip')])
+        self.assertEqual(['a later blip'], self.texts(context))
+        self.assertEqual(1, len(janey.pending_replies))
+
+
+    def testConcurrentEventsDeliverOnce(self):
+        token = janey.pending_replies.add((WAVE_ID, WAVELET_ID), 'b+1')
+        janey.pending_replies.complete(token, 'journals about malaria')
+        find_placeholder = janey.FindPlaceholderBlip
+        def slowFindPlaceholderBlip(context, token):
+            time.sleep(0.1) # give the other event time to look for it too
+            return find_placeholder(context, token)
+        janey.FindPlaceholderBlip = slowFindPlaceholderBlip
+        robot = robot_abstract.Robot('janey-robot', '1', event_workers=2)
+        robot.RegisterHandler(events.BLIP_SUBMITTED, janey.OnBlipSubmitted)
+        # no placeholder, so both events would reply to the original blip
+        context, event_list = robot_abstract.ParseJSONBody(waveBody(
+            [('b+1', 'malaria '), ('b+2', 'one blip'),
+             ('b+3', 'another blip')], submitted=['b+2', 'b+3']))
+        robot.HandleEvents(event_list, context)
+        self.assertEqual(['another blip', 'journals about malaria',
+                          'malaria ', 'one blip'], self.texts(context))
+        response = robot_abstract.SerializeContext(context, '1')
+        self.assertEqual(1, response.count('journals about malaria'))
+        self.assertEqual(0, len(janey.pending_replies))
+
+
+class TestParsers(unittest.TestCase):
+
+    def streamed(self, kind, document, chunk_size=7):
+        parser = janey.StreamingJaneParser(kind)
+        for start in range(0, len(document), chunk_size):
+            parser.feed(document[start:start + chunk_size])
+        return parser.close()
+
+    def souped(self, kind, document):
+        return janey.parseSoup(janey.makeSoup(document), kind)
+
+    def testStreamingMatchesSoup(self):
+        for kind, document in DOCUMENTS.items():
+            streamed = janey.packResults(kind, self.streamed(kind, document))
+            souped = janey.packResults(kind, self.souped(kind, document))
+            self.assertEqual(streamed, souped)
+
+    def testDecodedText(self):
+        for parse in (self.streamed, self.souped):
+            journals = parse('journals', JOURNALS_XML)
+            self.assertEqual([u'Ecology & Evolution',
+                              u'Revue m\xe9dicale \xe9trang\xe8re',
+                              u'Lancet Infect Dis'],
+                             [journal.journalname for journal in journals])
+            article = parse('articles', ARTICLES_XML)[0]
+            self.assertEqual(u'Parasitaemia <5% in P. falciparum & P. vivax',
+                             article.title)
+            self.assertEqual([u'M\xfcller A', u"O'Brien B"], article.authors)
+            authors = parse('authors', AUTHORS_XML)
+            self.assertEqual([u'Garc\xeda & Co', u'De Souza'],
+                             [author.name for author in authors])
+            self.assertEqual([u'101', u'102'],
+                             [author.articles[0].pmid for author in authors])
+
+    def testFallbackReusesTheResponse(self):
+        # expat knows no HTML entities, the soup decodes them
+        document = JOURNALS_XML.replace('m\xc3\xa9dicale', 'm&eacute;dicale')
+        requests = []
+        def openJaneUrl(query_url, sink=None, timeout=None):
+            requests.append(query_url)
+            for start in range(0, len(document), 16):
+                sink(document[start:start + 16])
+        real_open = janey.openJaneUrl
+        janey.openJaneUrl = openJaneUrl
+        try:
+            journals = janey.fetchResultsFromJane('journals?text=x',
+                                                  'journals')
+        finally:
+            janey.openJaneUrl = real_open
+        self.assertEqual(['journals?text=x'], requests)
+        self.assertEqual(u'Revue m\xe9dicale \xe9trang\xe8re',
+                         journals[1].journalname)
+        self.assertEqual(3, len(journals))
+
+
+class TestOpenJaneUrl(unittest.TestCase):
+
+    def setUp(self):
+        self.standin = jane_standin.JaneStandin(
+            jane_standin.SyntheticFixtures(records=3)).start()
+        self.real_fetcher = janey.jane_fetcher
+        self.real_backoff = jane_fetch.RETRY_BACKOFF
+        janey.jane_fetcher = jane_fetch.ResilientFetcher(max_retries=2)
+        jane_fetch.RETRY_BACKOFF = 0
+
+    def tearDown(self):
+        janey.jane_fetcher = self.real_fetcher
+        jane_fetch.RETRY_BACKOFF = self.real_backoff
+        janey.jane_pool.close()
+        self.standin.stop()
+
+    def testClientErrorIsNotRetried(self):
+        query_url = self.standin.root_url + 'abstracts?text=malaria'
+        self.assertRaises(jane_fetch.RejectedError, janey.openJaneUrl,
+                          query_url)
+        self.assertRaises(jane_fetch.RejectedError, janey.jane_fetcher.call,
+                          'journals', lambda timeout:
+                          janey.fetchResultsFromJane(query_url, 'journals',
+                                                     timeout))
+        self.assertEqual(0, janey.jane_fetcher.retries)
+        self.assertEqual(0, janey.jane_fetcher.breaker.failures)
+
+    def testServerErrorIsRetried(self):
+        self.standin.stop()
+        self.standin = jane_standin.JaneStandin(
+            jane_standin.SyntheticFixtures(records=3), error_rate=1).start()
+        query_url = self.standin.root_url + 'journals?text=malaria'
+        self.assertRaises(jane_fetch.FetchError, janey.jane_fetcher.call,
+                          'journals', lambda timeout:
+                          janey.fetchResultsFromJane(query_url, 'journals',
+                                                     timeout))
+        self.assertEqual(2, janey.jane_fetcher.retries)
+        self.assertEqual(1, janey.jane_fetcher.breaker.failures)
+
+
+if __name__ == '__main__':
+    unittest.main()
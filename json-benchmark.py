@@ -0,0 +1,66 @@
+"""
+Times decoding Wave JSON-RPC bodies with waveapi.simplejson: loads, which
+uses the stdlib's C accelerated json module when there is one, and the
+pure Python JSONDecoder it falls back to otherwise. Run from the
+repository root:
+
+    python json-benchmark.py [recorded bodies...]
+
+Without recorded bodies it uses the one recorded in the waveapi tests, the
+scenarios of robot-benchmark.py and a wavelet of many blips.
+
+"""
+import imp
+import os
+import sys
+import time
+
+from waveapi import robot_abstract_test
+from waveapi import simplejson
+
+REPEAT = 200
+MANY_BLIPS = 50
+
+
+def timed(func, body, repeat):
+    start = time.time()
+    for i in xrange(repeat):
+        func(body)
+    return (time.time() - start) * 1000 / repeat
+
+
+def bodies(paths):
+    if paths:
+        result = []
+        for path in paths:
+            f = open(path)
+            try:
+                result.append((os.path.basename(path), f.read()))
+            finally:
+                f.close()
+        return result
+    robot_benchmark = imp.load_source('robot_benchmark', 'robot-benchmark.py')
+    result = [('recorded', robot_abstract_test.DEBUG_DATA)]
+    result.extend(robot_benchmark.builtinScenarios())
+    result.append(('%d blips' % MANY_BLIPS, robot_benchmark.waveBody(
+        [robot_benchmark.BLIP_TEXT % i for i in range(MANY_BLIPS)])))
+    return result
+
+
+def run(scenarios):
+    pure = simplejson.JSONDecoder().decode
+    print 'loads backend: %s' % simplejson.decoder_backend()
+    print '%16s %8s %10s %10s %8s' % ('body', 'bytes', 'pure ms', 'loads ms',
+                                     'speedup')
+    for name, body in scenarios:
+        if pure(body) != simplejson.loads(body):
+            raise AssertionError('decoders disagree on %s' % name)
+        pure_time = timed(pure, body, REPEAT)
+        loads_time = timed(simplejson.loads, body, REPEAT)
+        print '%16s %8d %10.3f %10.3f %7.1fx' % (name, len(body), pure_time,
+                                                loads_time,
+                                                pure_time / loads_time)
+
+
+if __name__ == '__main__':
+    run(bodies(sys.argv[1:]))
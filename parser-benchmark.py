@@ -0,0 +1,75 @@
+"""
+Times the BeautifulStoneSoup parse path used by downloadXMLFromnJane
+against StreamingJaneParser on jane_fixtures articles responses, checking
+that both produce the same records. The node column counts the Tag and
+NavigableString objects the soup allocates. Run from the repository root:
+
+    python parser-benchmark.py [sizes...]
+
+"""
+import imp
+import sys
+import time
+
+import jane_fixtures
+
+janey = imp.load_source('janey_robot', 'janey-robot.py')
+generator = jane_fixtures.FixtureGenerator()
+
+CHUNK_SIZE = 8192 # what jane_http hands the parser per socket read
+REPEATS = 5
+
+
+def articles_xml(count):
+    return generator.articles(count)
+
+
+def soup_parse(document):
+    return janey.GetArticleInfo(janey.makeSoup(document))
+
+
+def count_nodes(soup):
+    count = 0
+    for node in soup.recursiveChildGenerator():
+        count += 1
+    return count
+
+
+def stream_parse(document):
+    parser = janey.StreamingJaneParser('articles')
+    for start in range(0, len(document), CHUNK_SIZE):
+        parser.feed(document[start:start + CHUNK_SIZE])
+    return parser.close()
+
+
+def best_time(parse, document):
+    best = None
+    for i in range(REPEATS):
+        start = time.time()
+        parse(document)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def run(sizes):
+    print '%8s %10s %10s %10s %10s %8s' % ('articles', 'bytes', 'soup nodes',
+                                          'soup ms', 'stream ms', 'speedup')
+    for size in sizes:
+        document = articles_xml(size)
+        expected = janey.packResults('articles', soup_parse(document))
+        if janey.packResults('articles', stream_parse(document)) != expected:
+            raise AssertionError('stream_parse disagrees on %d articles' %
+                                 size)
+        soup_nodes = count_nodes(janey.makeSoup(document))
+        soup_time = best_time(soup_parse, document)
+        stream_time = best_time(stream_parse, document)
+        print '%8d %10d %10d %10.2f %10.2f %7.1fx' % (size, len(document),
+                soup_nodes, soup_time * 1000, stream_time * 1000,
+                soup_time / stream_time)
+
+
+if __name__ == '__main__':
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10, 100, 1000]
+    run(sizes)
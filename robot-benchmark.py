@@ -0,0 +1,331 @@
+"""
+End to end benchmark of the robot's request path. Wave JSON-RPC bodies are
+run through the same steps as RobotEventHandler.post, with janey's handlers
+answering them from a jane_standin server, and each step is timed:
+
+    decode     simplejson.loads of the request body
+    collapse   util.CollapseJavaCollections
+    context    ops.CreateContext and the event list
+    fetch      talking to JANE, parsing excluded
+    parse      StreamingJaneParser
+    format     the format*/graph* functions turning results into text
+    handle     the rest of the event handlers
+    serialize  SerializeContext, writing the response JSON
+
+There is no separate encode stage: since the response JSON is written
+straight from the context in one pass (util.SerializeFieldsToJSON), building
+it and encoding it are the same step and both are timed as serialize.
+
+For each scenario it prints the mean milliseconds per request spent in
+each step, the net number of gc tracked objects each step left allocated,
+and requests per second; at the end, how often the camel case key caches
+were hit. The query cache is emptied before every request
+so each one goes to JANE. Events and commands are handled one at a time,
+as janey does by default, so the stages add up to the time a request takes.
+Run from the repository root:
+
+    python robot-benchmark.py [options] [recorded bodies...]
+
+Recorded bodies are files holding the JSON a Wave server posted, e.g.
+copied from the robot's 'Incoming:' log lines; without any, a built in
+set of scenarios is run. --save writes the results as a baseline and
+--compare prints the change against one. robot-benchmark-baseline.json is
+a baseline of the built in scenarios at the default 20 iterations; the
+numbers depend on the machine, so save a fresh one before comparing
+against a change:
+
+    python robot-benchmark.py --save before.json
+    python robot-benchmark.py --compare before.json
+
+"""
+import gc
+import imp
+import logging
+import optparse
+import os
+import time
+
+import jane_cache
+import jane_standin
+from waveapi import events
+from waveapi import model
+from waveapi import ops
+from waveapi import robot_abstract
+from waveapi import simplejson
+from waveapi import util
+
+janey = imp.load_source('janey_robot', 'janey-robot.py')
+
+STAGES = ('decode', 'collapse', 'context', 'fetch', 'parse', 'format',
+          'handle', 'serialize')
+FORMATTERS = ('formatJournalResults', 'formatArticleResults',
+              'formatAuthorResults', 'graphArticleRelationships',
+              'graphAuthorNetwork')
+WAVE_ID = 'example.com!w+bench'
+WAVELET_ID = 'example.com!conv+root'
+BLIP_TEXT = ('Efficacy of the RTS,S malaria vaccine against clinical '
+             'Plasmodium falciparum infection in African children %s')
+
+
+class StageTimer(object):
+    """
+    Adds up time and net gc tracked allocations per stage. Stages nest:
+    time spent in an inner stage is not counted in the outer one.
+
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.seconds = dict((stage, 0.0) for stage in STAGES)
+        self.objects = dict((stage, 0) for stage in STAGES)
+        self._stack = []
+
+    def _now(self):
+        return time.time(), gc.get_count()[0]
+
+    def start(self, stage):
+        if self._stack:
+            self._charge(self._stack[-1])
+        self._stack.append([stage, self._now()])
+
+    def stop(self):
+        self._charge(self._stack.pop())
+        if self._stack:
+            self._stack[-1][1] = self._now()
+
+    def _charge(self, entry):
+        stage, (started, count) = entry
+        now, now_count = self._now()
+        self.seconds[stage] += now - started
+        self.objects[stage] += now_count - count
+        entry[1] = (now, now_count)
+
+    def timed(self, stage, func):
+        def wrapper(*args, **kwargs):
+            self.start(stage)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.stop()
+        return wrapper
+
+
+def instrument(timer):
+    """
+    Wraps the janey functions that make up the fetch, parse and format
+    stages so their time is charged to timer.
+
+    """
+    pool = janey.jane_pool
+    pool.urlopen = timer.timed('fetch', pool.urlopen)
+    base_parser = janey.StreamingJaneParser
+
+    class TimedParser(base_parser):
+        def feed(self, data):
+            timer.start('parse')
+            try:
+                base_parser.feed(self, data)
+            finally:
+                timer.stop()
+        def close(self):
+            timer.start('parse')
+            try:
+                return base_parser.close(self)
+            finally:
+                timer.stop()
+
+    janey.StreamingJaneParser = TimedParser
+    for name in FORMATTERS:
+        setattr(janey, name, timer.timed('format', getattr(janey, name)))
+
+
+def makeRobot():
+    robot = robot_abstract.Robot('janey-robot', janey.current_version)
+    robot.RegisterHandler(events.WAVELET_SELF_ADDED, janey.OnRobotAdded)
+    robot.RegisterHandler(events.BLIP_SUBMITTED, janey.OnBlipSubmitted)
+    return robot
+
+
+def blipData(blip_id, content):
+    return {'blipId': blip_id, 'content': content, 'waveId': WAVE_ID,
+            'waveletId': WAVELET_ID, 'creator': 'someone@example.com',
+            'contributors': {'javaClass': 'java.util.ArrayList',
+                             'list': ['someone@example.com']},
+            'childBlipIds': {'javaClass': 'java.util.ArrayList', 'list': []},
+            'annotations': {'javaClass': 'java.util.ArrayList', 'list': []},
+            'elements': {'javaClass': 'java.util.HashMap', 'map': {}},
+            'parentBlipId': None, 'lastModifiedTime': 1, 'version': 3,
+            'javaClass': 'com.google.wave.api.impl.BlipData'}
+
+
+def waveBody(contents):
+    """
+    The JSON body of a request submitting one blip per string in contents.
+
+    """
+    blips = {}
+    events = []
+    for i, content in enumerate(contents):
+        blip_id = 'b+%d' % i
+        blips[blip_id] = blipData(blip_id, content)
+        events.append({'type': 'BLIP_SUBMITTED', 'timestamp': 1,
+                       'modifiedBy': 'someone@example.com',
+                       'properties': {'javaClass': 'java.util.HashMap',
+                                      'map': {'blipId': blip_id}},
+                       'javaClass': 'com.google.wave.api.impl.EventData'})
+    return simplejson.dumps({
+        'blips': {'javaClass': 'java.util.HashMap', 'map': blips},
+        'events': {'javaClass': 'java.util.ArrayList', 'list': events},
+        'wavelet': {'waveId': WAVE_ID, 'waveletId': WAVELET_ID,
+                    'rootBlipId': 'b+0', 'title': '', 'creator':
+                    'someone@example.com', 'creationTime': 1,
+                    'lastModifiedTime': 1, 'version': 5,
+                    'dataDocuments': None,
+                    'participants': {'javaClass': 'java.util.ArrayList',
+                                     'list': ['someone@example.com']},
+                    'javaClass': 'com.google.wave.api.impl.WaveletData'}})
+
+
+def builtinScenarios():
+    scenarios = []
+    for command in ('journals', 'articles', 'authors', 'graph', 'network'):
+        text = BLIP_TEXT % ('(janey:%s)' % command)
+        scenarios.append((command, waveBody([text])))
+    scenarios.append(('three commands', waveBody([BLIP_TEXT % (
+        '(janey:journals) (janey:authors) (janey:graph)')])))
+    scenarios.append(('three blips', waveBody([
+        BLIP_TEXT % '(janey:journals)', BLIP_TEXT % '(janey:articles)',
+        BLIP_TEXT % '(janey:help)'])))
+    return scenarios
+
+
+def handleRequest(robot, json_body, timer):
+    """
+    What RobotEventHandler.post does, one timed stage at a time.
+
+    """
+    timer.start('decode')
+    json = simplejson.loads(json_body)
+    timer.stop()
+    timer.start('collapse')
+    data = util.CollapseJavaCollections(json)
+    timer.stop()
+    timer.start('context')
+    context = ops.CreateContext(data)
+    event_list = [model.Event(event_data)
+                  for event_data in data['events']]
+    timer.stop()
+    timer.start('handle')
+    robot.HandleEvents(event_list, context)
+    timer.stop()
+    timer.start('serialize')
+    json_response = robot_abstract.SerializeContext(context, robot.version)
+    timer.stop()
+    return json_response
+
+
+def runScenario(robot, json_body, iterations, timer):
+    handleRequest(robot, json_body, timer) # warm up
+    timer.reset()
+    # The gc count only says how many objects were allocated while the
+    # collector is off, it drops back to zero after every collection.
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.time()
+        for i in range(iterations):
+            janey.query_cache.backend = jane_cache.MemoryBackend(
+                janey.query_cache.backend.max_entries)
+            handleRequest(robot, json_body, timer)
+        elapsed = time.time() - start
+    finally:
+        gc.enable()
+    stages = {}
+    for stage in STAGES:
+        stages[stage] = {'ms': timer.seconds[stage] * 1000 / iterations,
+                         'objects': timer.objects[stage] / iterations}
+    return {'stages': stages, 'requests_per_second': iterations / elapsed}
+
+
+def printResults(name, result, baseline=None):
+    print '%s: %.1f requests/s' % (name, result['requests_per_second']),
+    if baseline:
+        print '(%+.1f%%)' % percentChange(baseline['requests_per_second'],
+                                         result['requests_per_second'])
+    else:
+        print
+    for stage in STAGES:
+        numbers = result['stages'][stage]
+        line = '    %-10s %9.3f ms %8d objects' % (stage, numbers['ms'],
+                                                   numbers['objects'])
+        if baseline and stage in baseline['stages']:
+            line += '  %+7.1f%%' % percentChange(
+                baseline['stages'][stage]['ms'], numbers['ms'])
+        print line
+
+
+def percentChange(old, new):
+    if not old:
+        return 0.0
+    return (new - old) * 100.0 / old
+
+
+def readFile(path):
+    f = open(path)
+    try:
+        return f.read()
+    finally:
+        f.close()
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [options] [bodies...]')
+    parser.add_option('-n', '--iterations', type='int', default=20)
+    parser.add_option('--latency', type='float', default=0,
+                      help='seconds the stand-in waits before answering')
+    parser.add_option('--save', metavar='FILE',
+                      help='save the results as a baseline')
+    parser.add_option('--compare', metavar='FILE',
+                      help='compare against a saved baseline')
+    options, paths = parser.parse_args()
+
+    if paths:
+        scenarios = [(os.path.basename(path), readFile(path))
+                     for path in paths]
+    else:
+        scenarios = builtinScenarios()
+    baselines = {}
+    if options.compare:
+        baselines = simplejson.loads(readFile(options.compare))
+
+    logging.basicConfig()
+    janey.logger.setLevel(logging.WARNING)
+    standin = jane_standin.JaneStandin(latency=options.latency).start()
+    janey.JANE_ROOT_URL = standin.root_url
+    robot = makeRobot()
+    timer = StageTimer()
+    instrument(timer)
+    results = {}
+    try:
+        for name, json_body in scenarios:
+            results[name] = runScenario(robot, json_body,
+                                        options.iterations, timer)
+            printResults(name, results[name], baselines.get(name))
+    finally:
+        janey.jane_pool.close()
+        standin.stop()
+    for case, stats in sorted(util.CamelCaseStats().items()):
+        print '%s camel case keys: %d hits, %d misses (%.1f%% hits)' % (
+            case, stats['hits'], stats['misses'], stats['hit_rate'] * 100)
+
+    if options.save:
+        f = open(options.save, 'w')
+        try:
+            f.write(simplejson.dumps(results, sort_keys=True))
+        finally:
+            f.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Times janey's parsers and the article graph on jane_fixtures responses of
+growing size, to see how they hold up as the count asked of JANE goes up.
+For each size it reports the soup parse (GetArticleInfo, GetAuthorInfo),
+the streaming parse and graphArticleRelationships, in milliseconds. Run
+from the repository root:
+
+    python scale-benchmark.py [sizes...]
+
+The default sizes stop at 10000, the soup parses get slow well before
+100000.
+
+"""
+import imp
+import sys
+import time
+
+import jane_fixtures
+
+janey = imp.load_source('janey_robot', 'janey-robot.py')
+
+SOUP_PARSERS = {
+    'articles': janey.GetArticleInfo,
+    'authors': janey.GetAuthorInfo,
+}
+
+
+def timed(func, *args):
+    start = time.time()
+    result = func(*args)
+    return result, (time.time() - start) * 1000
+
+
+def soup_parse(kind, document):
+    return SOUP_PARSERS[kind](janey.makeSoup(document))
+
+
+def stream_parse(kind, document):
+    parser = janey.StreamingJaneParser(kind)
+    parser.feed(document)
+    return parser.close()
+
+
+def run(sizes):
+    print '%8s %9s %11s %12s %10s %10s %12s %9s' % ('records', 'kind',
+            'bytes', 'generate ms', 'soup ms', 'stream ms', 'graph ms',
+            'edges')
+    for size in sizes:
+        generator = jane_fixtures.FixtureGenerator(
+            author_pool=max(jane_fixtures.DEFAULT_AUTHOR_POOL, size))
+        for kind in ('articles', 'authors'):
+            document, generate_time = timed(generator.response, kind, size)
+            results, soup_time = timed(soup_parse, kind, document)
+            streamed, stream_time = timed(stream_parse, kind, document)
+            if (janey.packResults(kind, results) !=
+                janey.packResults(kind, streamed)):
+                raise AssertionError('parsers disagree on %d %s' %
+                                     (size, kind))
+            if kind == 'articles':
+                graph, graph_time = timed(janey.graphArticleRelationships,
+                                          streamed)
+                edges = janey.buildArticleGraph(streamed)[1].edgeCount()
+                graph_column = '%12.2f %9d' % (graph_time, edges)
+            else:
+                graph_column = '%12s %9s' % ('-', '-')
+            print '%8d %9s %11d %12.2f %10.2f %10.2f %s' % (size, kind,
+                    len(document), generate_time, soup_time, stream_time,
+                    graph_column)
+
+
+if __name__ == '__main__':
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10, 100, 1000, 10000]
+    run(sizes)
@@ -138,12 +138,7 @@ class Element(object):
     """
     props = {}
     data = {}
-    for attr in dir(self):
-      if attr.startswith('_'):
-        continue
-      val = getattr(self, attr)
-      if val is None or callable(val):
-        continue
+    for attr, _, val in util.SerializableAttributes(self):
       val = util.Serialize(val)
       if attr == 'type' or attr == 'java_class':
         data[attr] = val
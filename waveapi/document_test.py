@@ -23,6 +23,7 @@ __author__ = 'davidbyttow@google.com (David Byttow)'
 import unittest
 
 import document
+import simplejson
 import util
 
 
@@ -106,6 +107,24 @@ class TestElement(unittest.TestCase):
     self.assertEquals(props['width'], 100)
     self.assertEquals(props['height'], 100)
 
+  def testWireFormat(self):
+    element = document.FormElement(document.ELEMENT_TYPE.INPUT, 'input',
+                                   label='label')
+    annotation = document.Annotation('style/fontWeight', 'bold',
+                                     document.Range(1, 2))
+    for i in range(2):
+      self.assertEquals(
+          '{"type": "INPUT", "properties": {"javaClass": "java.util.HashMap", '
+          '"map": {"defaultValue": "", "name": "input", "value": "", '
+          '"label": "label"}}, '
+          '"java_class": "com.google.wave.api.FormElement"}',
+          simplejson.dumps(util.Serialize(element)))
+      self.assertEquals(
+          '{"javaClass": "com.google.wave.api.Annotation", "range": '
+          '{"javaClass": "com.google.wave.api.Range", "end": 2, "start": 1}, '
+          '"name": "style/fontWeight", "value": "bold"}',
+          util.SerializeToJSON(annotation))
+
 
 if __name__ == '__main__':
   unittest.main()
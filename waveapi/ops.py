@@ -26,6 +26,7 @@ __author__ = 'davidbyttow@google.com (David Byttow)'
 import document
 import logging
 import model
+import threading
 import util
 
 
@@ -483,6 +484,8 @@ class _ContextImpl(model.Context):
   def __init__(self):
     super(_ContextImpl, self).__init__()
     self.builder = OpBuilder(self)
+    self._temp_ids = {}
+    self._local = threading.local()
 
   def AddOperation(self, op):
     """Adds an operation to the list of operations to applied by the server.
@@ -491,10 +494,50 @@ class _ContextImpl(model.Context):
     and applied in order. Adding an operation this way will have no effect
     on the state of the context or its entities.
 
+    If an operation scope is open on the calling thread, the operation is
+    added to the scope instead; see BeginOperationScope.
+
     Args:
       op: An instance of an Operation.
     """
-    self._operations.append(op)
+    scope = getattr(self._local, 'scope', None)
+    if scope is not None:
+      scope.operations.append(op)
+    else:
+      self._operations.append(op)
+
+  def BeginOperationScope(self, name):
+    """Starts collecting the operations added on the calling thread.
+
+    Used to handle events on several threads at once: each thread collects
+    its own operations, which are added to the context in a fixed order
+    once every thread is done. Temporary ids handed out inside the scope
+    include its name so they are the same however the threads interleave.
+
+    Args:
+      name: A string unique among the scopes open at the same time.
+    """
+    self._local.scope = _OperationScope(name)
+
+  def EndOperationScope(self):
+    """Closes the calling thread's scope.
+
+    Returns:
+      The operations added since BeginOperationScope, in order.
+    """
+    scope = self._local.scope
+    self._local.scope = None
+    return scope.operations
+
+  def NextTempId(self, kind):
+    """Returns the next temporary id suffix for a kind of new entity."""
+    scope = getattr(self._local, 'scope', None)
+    if scope is not None:
+      counters, prefix = scope.temp_ids, scope.name + '_'
+    else:
+      counters, prefix = self._temp_ids, ''
+    counters[kind] = counters.get(kind, 0) + 1
+    return prefix + str(counters[kind])
 
   def AddWave(self, wave_data):
     """Adds a transient wave based on the data supplied.
@@ -550,19 +593,36 @@ class _ContextImpl(model.Context):
     if blip_id in self.blips:
       del self.blips[blip_id]
 
+  def SerializeFields(self):
+    """The fields of the operation bundle, before serialization.
+
+    Returns:
+      List of (key, value) pairs in the order Serialize adds them.
+    """
+    return [('javaClass', 'com.google.wave.api.impl.OperationMessageBundle'),
+            ('operations', self._operations)]
+
   def Serialize(self):
     """Serialize the operation bundle.
 
     Returns:
       Dict representing this object.
     """
-    data = {
-        'javaClass': 'com.google.wave.api.impl.OperationMessageBundle',
-        'operations': util.Serialize(self._operations)
-    }
+    data = {}
+    for key, value in self.SerializeFields():
+      data[key] = util.Serialize(value)
     return data
 
 
+class _OperationScope(object):
+  """Operations and temporary id counters of one thread's scope."""
+
+  def __init__(self, name):
+    self.name = name
+    self.operations = []
+    self.temp_ids = {}
+
+
 def CreateContext(data):
   """Creates a Context instance from raw data supplied by the server.
 
@@ -662,19 +722,16 @@ class OpBuilder(object):
       context: A Context instance to generate operations on.
     """
     self.__context = context
-    self.__nextBlipId = 1
-    self.__nextWaveId = 1
 
   def __CreateNewBlipData(self, wave_id, wavelet_id):
     """Creates JSON of the blip used for this session."""
-    temp_blip_id = 'TBD_' + wavelet_id + '_' + str(self.__nextBlipId)
-    self.__nextBlipId += 1
+    temp_blip_id = ('TBD_' + wavelet_id + '_' +
+                    self.__context.NextTempId('blip'))
     return BlipData(wave_id, wavelet_id, temp_blip_id)
 
   def __CreateNewWaveletData(self, participants):
     """Creates an ephemeral BlipData instance used for this session."""
-    wave_id = 'TBD_' + str(self.__nextWaveId)
-    self.__nextWaveId += 1
+    wave_id = 'TBD_' + self.__context.NextTempId('wave')
     wavelet_id = "conv+root"
     participants = set(participants)
     return WaveletData(wave_id, wavelet_id, participants)
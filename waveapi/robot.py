@@ -20,13 +20,16 @@ __author__ = 'davidbyttow@google.com (David Byttow)'
 
 
 import logging
-import traceback
 
 from google.appengine.ext import webapp
 from google.appengine.ext.webapp.util import run_wsgi_app
 
 import robot_abstract
 
+# Whether to log the whole JSON of every response. Off, responses are
+# streamed out as they are serialized and only their size is logged.
+LOG_OUTGOING_JSON = False
+
 
 class RobotCapabilitiesHandler(webapp.RequestHandler):
   """Handler for serving capabilities.xml given a robot."""
@@ -86,18 +89,19 @@ class RobotEventHandler(webapp.RequestHandler):
     logging.info('Incoming: ' + json_body)
 
     context, events = robot_abstract.ParseJSONBody(json_body)
-    for event in events:
-      try:
-        self._robot.HandleEvent(event, context)
-      except:
-        logging.error(traceback.format_exc())
-
-    json_response = robot_abstract.SerializeContext(context,
-                                                    self._robot.version)
-    # Build the response.
-    logging.info('Outgoing: ' + json_response)
+    self._robot.HandleEvents(events, context)
+
     self.response.headers['Content-Type'] = 'application/json'
-    self.response.out.write(json_response)
+    if LOG_OUTGOING_JSON:
+      json_response = robot_abstract.SerializeContext(context,
+                                                      self._robot.version)
+      logging.info('Outgoing: ' + json_response)
+      self.response.out.write(json_response)
+    else:
+      # Stream the response rather than building the whole string first.
+      written = robot_abstract.WriteContext(context, self._robot.version,
+                                            self.response.out.write)
+      logging.info('Outgoing: %d bytes', written)
 
 
 class Robot(robot_abstract.Robot):
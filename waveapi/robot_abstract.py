@@ -22,6 +22,11 @@ as well as some helper functions for web requests and responses.
 
 __author__ = 'davidbyttow@google.com (David Byttow)'
 
+import logging
+import Queue
+import threading
+import traceback
+
 import events
 import model
 import ops
@@ -41,9 +46,23 @@ def ParseJSONBody(json_body):
 
 def SerializeContext(context, version):
   """Return a JSON string representing the given context."""
-  context_dict = util.Serialize(context)
-  context_dict['version'] = str(version)
-  return simplejson.dumps(context_dict)
+  fields = context.SerializeFields() + [('version', str(version))]
+  return util.SerializeFieldsToJSON(fields)
+
+
+def WriteContext(context, version, out):
+  """Stream the JSON SerializeContext returns to out, piece by piece.
+
+  Args:
+    context: The context to serialize.
+    version: The robot version.
+    out: Function called with each piece of the JSON string in turn.
+
+  Returns:
+    The number of characters written.
+  """
+  fields = context.SerializeFields() + [('version', str(version))]
+  return util.WriteFieldsJSON(fields, out)
 
 
 def NewWave(context, participants=None):
@@ -61,13 +80,21 @@ class Robot(object):
   dispatches events to the appropriate handlers.
   """
 
-  def __init__(self, name, version, image_url='', profile_url=''):
-    """Initializes self with robot information."""
+  def __init__(self, name, version, image_url='', profile_url='',
+               event_workers=1):
+    """Initializes self with robot information.
+
+    Args:
+      event_workers: Optional number of threads HandleEvents may use to
+          handle the events of one request at the same time. Defaults to 1,
+          which handles them one after the other on the calling thread.
+    """
     self._handlers = {}
     self.name = name
     self.version = version
     self.image_url = image_url
     self.profile_url = profile_url
+    self.event_workers = event_workers
     self.cron_jobs = []
 
   def RegisterListener(self, listener):
@@ -123,6 +150,68 @@ class Robot(object):
       # instead of passing the properties dictionary.
       handler(event.properties, context)
 
+  def HandleEvents(self, event_list, context):
+    """Handles every event of a request, logging any handler that fails.
+
+    With more than one event worker, events on different blips are handled
+    concurrently, while events on the same blip (or on no blip) are still
+    handled in order on one thread. Either way the operations they generate
+    are added to the context in event order, so the response does not
+    depend on how the threads were scheduled.
+
+    Args:
+      event_list: The events parsed from the request.
+      context: The Context of this session.
+    """
+    groups = []
+    group_by_blip = {}
+    for index, event in enumerate(event_list):
+      blip_id = event.properties.get('blipId')
+      if blip_id not in group_by_blip:
+        group_by_blip[blip_id] = []
+        groups.append(group_by_blip[blip_id])
+      group_by_blip[blip_id].append((index, event))
+
+    workers = min(self.event_workers, len(groups))
+    if workers <= 1:
+      for event in event_list:
+        self._HandleEventSafely(event, context)
+      return
+
+    pending = Queue.Queue()
+    for group in groups:
+      pending.put(group)
+    collected = [[]] * len(event_list)
+
+    def Work():
+      while True:
+        try:
+          group = pending.get_nowait()
+        except Queue.Empty:
+          return
+        for index, event in group:
+          context.BeginOperationScope('e%d' % index)
+          try:
+            self._HandleEventSafely(event, context)
+          finally:
+            collected[index] = context.EndOperationScope()
+
+    threads = [threading.Thread(target=Work) for _ in range(workers)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    for operations in collected:
+      for op in operations:
+        context.AddOperation(op)
+
+  def _HandleEventSafely(self, event, context):
+    """Calls HandleEvent, logging rather than raising any exception."""
+    try:
+      self.HandleEvent(event, context)
+    except:
+      logging.error(traceback.format_exc())
+
   def GetCapabilitiesXml(self):
     """Return this robot's capabilities as an XML string."""
     lines = ['<w:version>%s</w:version>' % self.version]
@@ -18,8 +18,10 @@
 
 __author__ = 'jacobly@google.com (Jacob Lee)'
 
+import time
 import unittest
 
+import model
 import robot_abstract
 
 DEBUG_DATA = r'{"blips":{"map":{"wdykLROk*13":{"lastModifiedTime":1242079608457,"contributors":{"javaClass":"java.util.ArrayList","list":["davidbyttow@google.com"]},"waveletId":"test.com!conv+root","waveId":"test.com!wdykLROk*11","parentBlipId":null,"version":3,"creator":"davidbyttow@google.com","content":"\n","blipId":"wdykLROk*13","javaClass":"com.google.wave.api.impl.BlipData","annotations":{"javaClass":"java.util.ArrayList","list":[{"range":{"start":0,"javaClass":"com.google.wave.api.Range","end":1},"name":"user/e/davidbyttow@google.com","value":"David","javaClass":"com.google.wave.api.Annotation"}]},"elements":{"map":{},"javaClass":"java.util.HashMap"},"childBlipIds":{"javaClass":"java.util.ArrayList","list":[]}}},"javaClass":"java.util.HashMap"},"events":{"javaClass":"java.util.ArrayList","list":[{"timestamp":1242079611003,"modifiedBy":"davidbyttow@google.com","javaClass":"com.google.wave.api.impl.EventData","properties":{"map":{"participantsRemoved":{"javaClass":"java.util.ArrayList","list":[]},"participantsAdded":{"javaClass":"java.util.ArrayList","list":["monty@appspot.com"]}},"javaClass":"java.util.HashMap"},"type":"WAVELET_PARTICIPANTS_CHANGED"}]},"wavelet":{"lastModifiedTime":1242079611003,"title":"","waveletId":"test.com!conv+root","rootBlipId":"wdykLROk*13","javaClass":"com.google.wave.api.impl.WaveletData","dataDocuments":null,"creationTime":1242079608457,"waveId":"test.com!wdykLROk*11","participants":{"javaClass":"java.util.ArrayList","list":["davidbyttow@google.com","monty@appspot.com"]},"creator":"davidbyttow@google.com","version":5}}'
@@ -82,6 +84,17 @@ class TestHelpers(unittest.TestCase):
     self.assertEqual(expected_json, serialized)
 
 
+  def testWriteContext(self):
+    context, _ = robot_abstract.ParseJSONBody(DEBUG_DATA)
+    wavelet = context.GetRootWavelet()
+    for i in range(20):
+      wavelet.CreateBlip().GetDocument().SetText('Hello %d' % i)
+    pieces = []
+    written = robot_abstract.WriteContext(context, '1', pieces.append)
+    expected = robot_abstract.SerializeContext(context, '1')
+    self.assertEqual(expected, ''.join(pieces))
+    self.assertEqual(len(expected), written)
+
 class TestGetCapabilitiesXml(unittest.TestCase):
 
   def setUp(self):
@@ -173,5 +186,43 @@ class TestRegisterListener(unittest.TestCase):
                      [listener.on_wavelet_blip_created])
 
 
+class TestHandleEvents(unittest.TestCase):
+  """Tests for dispatching a request's events with HandleEvents."""
+
+  def HandleEvents(self, workers, delays):
+    """Replies to one event per blip, sleeping delays[blip] first."""
+    context, _ = robot_abstract.ParseJSONBody(DEBUG_DATA)
+    wavelet = context.GetWavelets()[0]
+
+    def OnBlipSubmitted(properties, context):
+      blip_id = properties['blipId']
+      time.sleep(delays[blip_id])
+      data = context.builder.WaveletAppendBlip(wavelet.GetWaveId(),
+                                               wavelet.GetId())
+      context.builder.DocumentInsert(wavelet.GetWaveId(), wavelet.GetId(),
+                                     data['blipId'], blip_id)
+
+    robot = robot_abstract.Robot('batch', '1', event_workers=workers)
+    robot.RegisterHandler('BLIP_SUBMITTED', OnBlipSubmitted)
+    robot.RegisterHandler('BLIP_SUBMITTED', lambda properties, context: 1 / 0)
+    event_list = [model.Event({'type': 'BLIP_SUBMITTED',
+                               'properties': {'blipId': blip_id}})
+                  for blip_id in sorted(delays)]
+    robot.HandleEvents(event_list, context)
+    return robot_abstract.SerializeContext(context, '1')
+
+  def testOperationsFollowEventOrder(self):
+    fast_first = self.HandleEvents(3, {'a': 0, 'b': 0.02, 'c': 0.04})
+    slow_first = self.HandleEvents(3, {'a': 0.04, 'b': 0.02, 'c': 0})
+    self.assertEqual(fast_first, slow_first)
+    self.assertTrue(fast_first.index('"a"') < fast_first.index('"b"') <
+                    fast_first.index('"c"'))
+    self.assertTrue('TBD_test.com!conv+root_e1_1' in fast_first)
+
+  def testSingleWorkerIsUnchanged(self):
+    serialized = self.HandleEvents(1, {'a': 0, 'b': 0})
+    self.assertTrue('TBD_test.com!conv+root_2' in serialized)
+
+
 if __name__ == '__main__':
   unittest.main()
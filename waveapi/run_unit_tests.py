@@ -22,6 +22,7 @@ import model_test
 import module_test_runner
 import ops_test
 import robot_abstract_test
+import simplejson_test
 import util_test
 
 
@@ -33,6 +34,7 @@ def RunUnitTests():
       model_test,
       ops_test,
       robot_abstract_test,
+      simplejson_test,
       util_test,
   ]
   test_runner.RunAllTests()
@@ -74,12 +74,50 @@ so it may be used as a serializer for that as well.
 __version__ = '1.3'
 __all__ = [
     'dump', 'dumps', 'load', 'loads',
-    'JSONDecoder', 'JSONEncoder',
+    'JSONDecoder', 'JSONEncoder', 'decoder_backend',
 ]
 
 from decoder import JSONDecoder
 from encoder import JSONEncoder
 
+def _stdlib_decoder():
+    """
+    Return the standard library's JSONDecoder class if it is there (Python
+    2.6 and later) and has its C scanner, otherwise None.
+    """
+    try:
+        import json
+        from json import scanner
+    except ImportError:
+        return None
+    if getattr(scanner, 'c_make_scanner', None) is None:
+        return None
+    return json.JSONDecoder
+
+_fast_decoder = _stdlib_decoder()
+
+def decoder_backend():
+    """
+    Name the decoder ``loads`` and ``load`` use when no ``cls`` is given:
+    ``'json'`` for the standard library's C accelerated one, otherwise
+    ``'simplejson'``.
+    """
+    if _fast_decoder is None:
+        return 'simplejson'
+    return 'json'
+
+def _decode(s, encoding, cls, object_hook, kw):
+    if cls is None and not kw and _fast_decoder is not None:
+        # Not strict, so control characters are allowed inside strings as
+        # they are by JSONDecoder.
+        return _fast_decoder(encoding=encoding, object_hook=object_hook,
+                             strict=False).decode(s)
+    if cls is None:
+        cls = JSONDecoder
+    if object_hook is not None:
+        kw['object_hook'] = object_hook
+    return cls(encoding=encoding, **kw).decode(s)
+
 def dump(obj, fp, skipkeys=False, ensure_ascii=True, check_circular=True,
         allow_nan=True, cls=None, **kw):
     """
@@ -168,13 +206,10 @@ def load(fp, encoding=None, cls=None, object_hook=None, **kw):
     can be used to implement custom decoders (e.g. JSON-RPC class hinting).
     
     To use a custom ``JSONDecoder`` subclass, specify it with the ``cls``
-    kwarg.
+    kwarg.  Without one the standard library's C accelerated decoder is
+    used when available, see ``decoder_backend``.
     """
-    if cls is None:
-        cls = JSONDecoder
-    if object_hook is not None:
-        kw['object_hook'] = object_hook
-    return cls(encoding=encoding, **kw).decode(fp.read())
+    return _decode(fp.read(), encoding, cls, object_hook, kw)
 
 def loads(s, encoding=None, cls=None, object_hook=None, **kw):
     """
@@ -192,13 +227,10 @@ def loads(s, encoding=None, cls=None, object_hook=None, **kw):
     can be used to implement custom decoders (e.g. JSON-RPC class hinting).
 
     To use a custom ``JSONDecoder`` subclass, specify it with the ``cls``
-    kwarg.
+    kwarg.  Without one the standard library's C accelerated decoder is
+    used when available, see ``decoder_backend``.
     """
-    if cls is None:
-        cls = JSONDecoder
-    if object_hook is not None:
-        kw['object_hook'] = object_hook
-    return cls(encoding=encoding, **kw).decode(s)
+    return _decode(s, encoding, cls, object_hook, kw)
 
 def read(s):
     """
@@ -3,8 +3,6 @@ Implementation of JSONDecoder
 """
 import re
 
-from scanner import Scanner, pattern
-
 FLAGS = re.VERBOSE | re.MULTILINE | re.DOTALL
 
 def _floatconstants():
@@ -49,20 +47,7 @@ _CONSTANTS = {
     'null': None,
 }
 
-def JSONConstant(match, context, c=_CONSTANTS):
-    return c[match.group(0)], None
-pattern('(-?Infinity|NaN|true|false|null)')(JSONConstant)
-
-def JSONNumber(match, context):
-    match = JSONNumber.regex.match(match.string, *match.span())
-    integer, frac, exp = match.groups()
-    if frac or exp:
-        res = float(integer + (frac or '') + (exp or ''))
-    else:
-        res = int(integer)
-    return res, None
-pattern(r'(-?(?:0|[1-9]\d*))(\.\d+)?([eE][-+]?\d+)?')(JSONNumber)
-
+NUMBER = re.compile(r'(-?(?:0|[1-9]\d*))(\.\d+)?([eE][-+]?\d+)?', FLAGS)
 STRINGCHUNK = re.compile(r'(.*?)(["\\])', FLAGS)
 BACKSLASH = {
     '"': u'"', '\\': u'\\', '/': u'/',
@@ -74,6 +59,13 @@ DEFAULT_ENCODING = "utf-8"
 def scanstring(s, end, encoding=None, _b=BACKSLASH, _m=STRINGCHUNK.match):
     if encoding is None:
         encoding = DEFAULT_ENCODING
+    # Most strings have no escapes and come out as one slice of s.
+    close = s.find('"', end)
+    if close != -1 and s.find('\\', end, close) == -1:
+        content = s[end:close]
+        if not isinstance(content, unicode):
+            content = unicode(content, encoding)
+        return content, close + 1
     chunks = []
     _append = chunks.append
     begin = end - 1
@@ -114,88 +106,115 @@ def scanstring(s, end, encoding=None, _b=BACKSLASH, _m=STRINGCHUNK.match):
         _append(m)
     return u''.join(chunks), end
 
-def JSONString(match, context):
-    encoding = getattr(context, 'encoding', None)
-    return scanstring(match.string, match.end(), encoding)
-pattern(r'"')(JSONString)
-
 WHITESPACE = re.compile(r'\s*', FLAGS)
+WHITESPACE_CHARS = ' \t\n\r\f\v'
 
-def JSONObject(match, context, _w=WHITESPACE.match):
-    pairs = {}
-    s = match.string
-    end = _w(s, match.end()).end()
-    nextchar = s[end:end + 1]
-    # trivial empty object
-    if nextchar == '}':
-        return pairs, end + 1
-    if nextchar != '"':
-        raise ValueError(errmsg("Expecting property name", s, end))
-    end += 1
-    encoding = getattr(context, 'encoding', None)
-    while True:
-        key, end = scanstring(s, end, encoding)
-        end = _w(s, end).end()
-        if s[end:end + 1] != ':':
-            raise ValueError(errmsg("Expecting : delimiter", s, end))
-        end = _w(s, end + 1).end()
-        try:
-            value, end = JSONScanner.iterscan(s, idx=end).next()
-        except StopIteration:
-            raise ValueError(errmsg("Expecting object", s, end))
-        pairs[key] = value
-        end = _w(s, end).end()
+def make_scanner(context, _w=WHITESPACE.match, _ws=WHITESPACE_CHARS,
+                 _number=NUMBER.match, _constants=_CONSTANTS):
+    """
+    Return a function scan_once(s, idx) that decodes the JSON value starting
+    exactly at ``s[idx]`` and returns it with the index just past its end,
+    raising StopIteration if no value starts there.  It reads ``s`` once,
+    from left to right, deciding what comes next from the first character.
+    """
+    encoding = context.encoding
+    object_hook = context.object_hook
+
+    def skip(s, end):
+        if s[end:end + 1] in _ws:
+            end = _w(s, end).end()
+        return end
+
+    def scan_object(s, end):
+        pairs = {}
+        end = skip(s, end)
         nextchar = s[end:end + 1]
-        end += 1
+        # trivial empty object
         if nextchar == '}':
-            break
-        if nextchar != ',':
-            raise ValueError(errmsg("Expecting , delimiter", s, end - 1))
-        end = _w(s, end).end()
-        nextchar = s[end:end + 1]
-        end += 1
+            return pairs, end + 1
         if nextchar != '"':
-            raise ValueError(errmsg("Expecting property name", s, end - 1))
-    object_hook = getattr(context, 'object_hook', None)
-    if object_hook is not None:
-        pairs = object_hook(pairs)
-    return pairs, end
-pattern(r'{')(JSONObject)
-            
-def JSONArray(match, context, _w=WHITESPACE.match):
-    values = []
-    s = match.string
-    end = _w(s, match.end()).end()
-    # look-ahead for trivial empty array
-    nextchar = s[end:end + 1]
-    if nextchar == ']':
-        return values, end + 1
-    while True:
-        try:
-            value, end = JSONScanner.iterscan(s, idx=end).next()
-        except StopIteration:
-            raise ValueError(errmsg("Expecting object", s, end))
-        values.append(value)
-        end = _w(s, end).end()
-        nextchar = s[end:end + 1]
+            raise ValueError(errmsg("Expecting property name", s, end))
         end += 1
+        while True:
+            key, end = scanstring(s, end, encoding)
+            if s[end:end + 1] != ':':
+                end = skip(s, end)
+                if s[end:end + 1] != ':':
+                    raise ValueError(errmsg("Expecting : delimiter", s, end))
+            end = skip(s, end + 1)
+            try:
+                value, end = scan_once(s, end)
+            except StopIteration:
+                raise ValueError(errmsg("Expecting object", s, end))
+            pairs[key] = value
+            end = skip(s, end)
+            nextchar = s[end:end + 1]
+            end += 1
+            if nextchar == '}':
+                break
+            if nextchar != ',':
+                raise ValueError(errmsg("Expecting , delimiter", s, end - 1))
+            end = skip(s, end)
+            nextchar = s[end:end + 1]
+            end += 1
+            if nextchar != '"':
+                raise ValueError(errmsg("Expecting property name", s, end - 1))
+        if object_hook is not None:
+            pairs = object_hook(pairs)
+        return pairs, end
+
+    def scan_array(s, end):
+        values = []
+        end = skip(s, end)
+        # look-ahead for trivial empty array
+        nextchar = s[end:end + 1]
         if nextchar == ']':
-            break
-        if nextchar != ',':
-            raise ValueError(errmsg("Expecting , delimiter", s, end))
-        end = _w(s, end).end()
-    return values, end
-pattern(r'\[')(JSONArray)
- 
-ANYTHING = [
-    JSONObject,
-    JSONArray,
-    JSONString,
-    JSONConstant,
-    JSONNumber,
-]
+            return values, end + 1
+        _append = values.append
+        while True:
+            try:
+                value, end = scan_once(s, end)
+            except StopIteration:
+                raise ValueError(errmsg("Expecting object", s, end))
+            _append(value)
+            end = skip(s, end)
+            nextchar = s[end:end + 1]
+            end += 1
+            if nextchar == ']':
+                break
+            if nextchar != ',':
+                raise ValueError(errmsg("Expecting , delimiter", s, end))
+            end = skip(s, end)
+        return values, end
+
+    def scan_once(s, idx):
+        nextchar = s[idx:idx + 1]
+        if nextchar == '"':
+            return scanstring(s, idx + 1, encoding)
+        elif nextchar == '{':
+            return scan_object(s, idx + 1)
+        elif nextchar == '[':
+            return scan_array(s, idx + 1)
+        elif nextchar == 'n' and s[idx:idx + 4] == 'null':
+            return None, idx + 4
+        elif nextchar == 't' and s[idx:idx + 4] == 'true':
+            return True, idx + 4
+        elif nextchar == 'f' and s[idx:idx + 5] == 'false':
+            return False, idx + 5
+        match = _number(s, idx)
+        if match is not None:
+            integer, frac, exp = match.groups()
+            if frac or exp:
+                res = float(integer + (frac or '') + (exp or ''))
+            else:
+                res = int(integer)
+            return res, match.end()
+        for constant in ('NaN', 'Infinity', '-Infinity'):
+            if s.startswith(constant, idx):
+                return _constants[constant], idx + len(constant)
+        raise StopIteration
 
-JSONScanner = Scanner(ANYTHING)
+    return scan_once
 
 class JSONDecoder(object):
     """
@@ -227,7 +246,6 @@ class JSONDecoder(object):
     their corresponding ``float`` values, which is outside the JSON spec.
     """
 
-    _scanner = Scanner(ANYTHING)
     __all__ = ['__init__', 'decode', 'raw_decode']
 
     def __init__(self, encoding=None, object_hook=None):
@@ -246,6 +264,7 @@ class JSONDecoder(object):
         """
         self.encoding = encoding
         self.object_hook = object_hook
+        self.scan_once = make_scanner(self)
 
     def decode(self, s, _w=WHITESPACE.match):
         """
@@ -258,7 +277,7 @@ class JSONDecoder(object):
             raise ValueError(errmsg("Extra data", s, end, len(s)))
         return obj
 
-    def raw_decode(self, s, **kw):
+    def raw_decode(self, s, idx=0):
         """
         Decode a JSON document from ``s`` (a ``str`` or ``unicode`` beginning
         with a JSON document) and return a 2-tuple of the Python
@@ -267,9 +286,8 @@ class JSONDecoder(object):
         This can be used to decode a JSON document from a string that may
         have extraneous data at the end.
         """
-        kw.setdefault('context', self)
         try:
-            obj, end = self._scanner.iterscan(s, **kw).next()
+            obj, end = self.scan_once(s, idx)
         except StopIteration:
             raise ValueError("No JSON object could be decoded")
         return obj, end
@@ -0,0 +1,108 @@
+#!/usr/bin/python2.4
+#
+# Copyright (C) 2009 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for decoding with the bundled simplejson."""
+
+
+import unittest
+
+import robot_abstract_test
+import simplejson
+
+DOCUMENTS = [
+    ('{}', {}),
+    ('[]', []),
+    (' [ 1 , -2 , 3.5 , 1e3 , -0.25E-2 ] ', [1, -2, 3.5, 1000.0, -0.0025]),
+    ('12345678901234567890', 12345678901234567890L),
+    ('[true, false, null]', [True, False, None]),
+    ('{"a": {"b": [{"c": "d"}, []]}, "e": {}}',
+     {u'a': {u'b': [{u'c': u'd'}, []]}, u'e': {}}),
+    (r'"quote \" slash \\ \/ \b\f\n\r\t \u00e9\u2603"',
+     u'quote " slash \\ / \b\f\n\r\t \xe9\u2603'),
+    ('"caf\xc3\xa9"', u'caf\xe9'),
+    (u'"caf\xe9"', u'caf\xe9'),
+    ('"line\nbreak"', u'line\nbreak'),
+    ('\n{\t"key"\r:\n"value"\n}\n', {u'key': u'value'}),
+]
+
+BAD_DOCUMENTS = [
+    '',
+    '[1, 2',
+    '{"a" 1}',
+    '{"a": 1,}',
+    '{1: 2}',
+    '"unterminated',
+    '"bad \\x escape"',
+    '"bad \\u12 escape"',
+    '[1] [2]',
+    'nul',
+]
+
+
+class TestDecoder(unittest.TestCase):
+  """Tests the pure Python decoder and loads, whichever backend it uses."""
+
+  def assertDecodes(self, decode):
+    for document, expected in DOCUMENTS:
+      self.assertEqual(expected, decode(document))
+      self.assertEqual(type(expected), type(decode(document)))
+    for document in BAD_DOCUMENTS:
+      self.assertRaises(ValueError, decode, document)
+
+  def testJSONDecoder(self):
+    self.assertDecodes(simplejson.JSONDecoder().decode)
+
+  def testLoads(self):
+    self.assertDecodes(simplejson.loads)
+
+  def testStringsAreUnicode(self):
+    for decode in (simplejson.JSONDecoder().decode, simplejson.loads):
+      value = decode('{"key": ["value"]}')
+      self.assertEqual(unicode, type(value.keys()[0]))
+      self.assertEqual(unicode, type(value['key'][0]))
+
+  def testConstants(self):
+    decoded = simplejson.JSONDecoder().decode('[NaN, Infinity, -Infinity]')
+    self.assertNotEqual(decoded[0], decoded[0])
+    self.assertEqual([float('inf'), float('-inf')], decoded[1:])
+
+  def testObjectHook(self):
+    hook = lambda pairs: sorted(pairs.items())
+    document = '{"b": {"c": 1}, "a": 2}'
+    expected = [(u'a', 2), (u'b', [(u'c', 1)])]
+    self.assertEqual(expected, simplejson.loads(document, object_hook=hook))
+    self.assertEqual(expected, simplejson.JSONDecoder(
+        object_hook=hook).decode(document))
+
+  def testEncoding(self):
+    self.assertEqual(u'caf\xe9',
+                     simplejson.loads('"caf\xe9"', encoding='latin-1'))
+
+  def testRawDecode(self):
+    self.assertEqual(([1], 3),
+                     simplejson.JSONDecoder().raw_decode('[1] trailing'))
+
+  def testWaveBody(self):
+    body = robot_abstract_test.DEBUG_DATA
+    self.assertEqual(simplejson.JSONDecoder().decode(body),
+                     simplejson.loads(body))
+
+  def testDecoderBackend(self):
+    self.assertTrue(simplejson.decoder_backend() in ('json', 'simplejson'))
+
+
+if __name__ == '__main__':
+  unittest.main()
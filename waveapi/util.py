@@ -22,10 +22,29 @@ Contains miscellaneous functions used internally by the API.
 __author__ = 'davidbyttow@google.com (David Byttow)'
 
 
+import sys
+
 import document
+from simplejson import encoder
 
 
 CUSTOM_SERIALIZE_METHOD_NAME = 'Serialize'
+SERIALIZE_FIELDS_METHOD_NAME = 'SerializeFields'
+
+# Serialization plans per class, see _AttributePlan, and whether types are
+# user-defined, see IsInstance. A plan leaves out attributes that were
+# callable on the class when it was made, so replacing a method on a class
+# with plain data after its instances have been serialized is not picked up.
+_MAX_ATTRIBUTE_PLANS = 1024
+_attribute_plans = {}
+_instance_types = {}
+
+# Number of chunks of JSON a streaming _JSONWriter holds before writing them.
+DEFAULT_BUFFER_CHUNKS = 512
+
+# Cache of the orders in which dicts iterate their keys, see _DictOrder.
+_MAX_DICT_ORDERS = 1024
+_dict_orders = {}
 
 
 def IsListOrDict(inst):
@@ -43,7 +62,12 @@ def IsInstance(obj):
   # NOTE(davidbyttow): This seems like a reasonably safe hack for now...
   # I'm not exactly sure how to test if something is a subclass of object.
   # And no, "is InstanceType" does not work here. :(
-  return str(type(obj)).startswith('<class ')
+  obj_type = type(obj)
+  is_instance = _instance_types.get(obj_type)
+  if is_instance is None:
+    is_instance = str(obj_type).startswith('<class ')
+    _instance_types[obj_type] = is_instance
+  return is_instance
 
 
 def CollapseJavaCollections(data):
@@ -82,6 +106,56 @@ def CollapseJavaCollections(data):
   return data
 
 
+class ConversionCache(object):
+  """A bounded memo table for a string conversion such as camel casing.
+
+  Calling it returns convert(s), computed once per distinct s. Only the
+  first max_entries distinct strings are remembered, later ones are
+  converted every time. Hits and misses are counted to show how well it
+  works; with several threads the counts are approximate.
+  """
+
+  def __init__(self, convert, max_entries=1024):
+    self.convert = convert
+    self.max_entries = max_entries
+    self.hits = 0
+    self.misses = 0
+    self._table = {}
+
+  def __call__(self, s):
+    converted = self._table.get(s)
+    if converted is not None:
+      self.hits += 1
+      return converted
+    self.misses += 1
+    converted = self.convert(s)
+    if len(self._table) < self.max_entries:
+      self._table[s] = converted
+    return converted
+
+  def Stats(self):
+    """Returns a dict of the hits, misses, hit rate and table size."""
+    lookups = self.hits + self.misses
+    if lookups:
+      hit_rate = float(self.hits) / lookups
+    else:
+      hit_rate = 0.0
+    return {'hits': self.hits, 'misses': self.misses, 'hit_rate': hit_rate,
+            'entries': len(self._table)}
+
+
+def _ToLowerCamelCase(s):
+  return reduce(lambda a, b: a + (a and b.capitalize() or b), s.split('_'))
+
+
+def _ToUpperCamelCase(s):
+  return ''.join(fragment.capitalize() for fragment in s.split('_'))
+
+
+_lower_camel_case = ConversionCache(_ToLowerCamelCase)
+_upper_camel_case = ConversionCache(_ToUpperCamelCase)
+
+
 def ToLowerCamelCase(s):
   """Converts a string to lower camel case.
 
@@ -97,7 +171,7 @@ def ToLowerCamelCase(s):
   Returns:
     The lower camel cased string.
   """
-  return reduce(lambda a, b: a + (a and b.capitalize() or b), s.split('_'))
+  return _lower_camel_case(s)
 
 
 def ToUpperCamelCase(s):
@@ -115,7 +189,7 @@ def ToUpperCamelCase(s):
   Returns:
     The upper camel cased string.
   """
-  return ''.join(fragment.capitalize() for fragment in s.split('_'))
+  return _upper_camel_case(s)
 
 
 def DefaultKeyWriter(key_name):
@@ -129,7 +203,83 @@ def DefaultKeyWriter(key_name):
   Returns:
     Key name in lower camel-cased form.
   """
-  return ToLowerCamelCase(key_name)
+  return _lower_camel_case(key_name)
+
+
+def CamelCaseStats():
+  """Returns the Stats of the lower and upper camel case caches.
+
+  Returns:
+    Dict with the lower and upper camel case cache stats under 'lower' and
+    'upper'.
+  """
+  return {'lower': _lower_camel_case.Stats(),
+          'upper': _upper_camel_case.Stats()}
+
+
+def _AttributePlan(obj, key_writer):
+  """Returns the attributes of obj that may be serialized.
+
+  These are the public attributes dir(obj) lists, less those that come from
+  the class and are callable there. Class attributes that are None stay in,
+  as they may be set later; SerializableAttributes skips them while they
+  are still None. The plan is worked out once for
+  each class, set of instance attributes and key writer, and cached.
+
+  Args:
+    obj: The instance to plan for.
+    key_writer: Key writer function.
+
+  Returns:
+    List of (attribute name, key) pairs in dir() order, key being the name
+    rewritten by key_writer; None if obj has no __dict__.
+  """
+  instance_dict = getattr(obj, '__dict__', None)
+  if not isinstance(instance_dict, dict):
+    return None
+  cls = type(obj)
+  plan_key = (cls, tuple(instance_dict), key_writer)
+  plan = _attribute_plans.get(plan_key)
+  if plan is None:
+    plan = []
+    for attr_name in dir(obj):
+      if attr_name.startswith('_'):
+        continue
+      if attr_name not in instance_dict:
+        if callable(getattr(cls, attr_name, None)):
+          continue
+      plan.append((attr_name, key_writer(attr_name)))
+    if len(_attribute_plans) < _MAX_ATTRIBUTE_PLANS:
+      _attribute_plans[plan_key] = plan
+  return plan
+
+
+def SerializableAttributes(obj, key_writer=DefaultKeyWriter):
+  """Lists the attributes of an instance that get serialized.
+
+  These are its public attributes that are neither callable nor None.
+
+  Args:
+    obj: The instance.
+    key_writer: Optional key writer function.
+
+  Returns:
+    List of (attribute name, key, value) triples in dir() order, key being
+    the attribute name rewritten by key_writer.
+  """
+  attributes = []
+  plan = _AttributePlan(obj, key_writer)
+  if plan is None:
+    plan = [(attr_name, key_writer(attr_name)) for attr_name in dir(obj)
+            if not attr_name.startswith('_')]
+  for attr_name, key in plan:
+    attr = getattr(obj, attr_name)
+    if callable(attr):
+      continue
+    if attr is None:
+      continue
+    attributes.append((attr_name, key, attr))
+  return attributes
 
 
 def _SerializeAttributes(obj, key_writer=DefaultKeyWriter):
@@ -150,16 +300,8 @@ def _SerializeAttributes(obj, key_writer=DefaultKeyWriter):
     The serialized object.
   """
   data = {}
-  for attr_name in dir(obj):
-    if attr_name.startswith('_'):
-      continue
-    attr = getattr(obj, attr_name)
-    if callable(attr):
-      continue
-    if attr is None:
-      continue
-    # Looks okay, serialize it.
-    data[key_writer(attr_name)] = Serialize(attr)
+  for _, key, attr in SerializableAttributes(obj, key_writer):
+    data[key] = Serialize(attr)
   return data
 
 
@@ -226,6 +368,261 @@ def Serialize(obj, key_writer=DefaultKeyWriter):
   return obj
 
 
+def _DictOrder(keys):
+  """Returns the order in which a dict built from keys iterates them.
+
+  A dict's iteration order only depends on the keys inserted into it and the
+  order they were inserted in, so dicts built the same way always list their
+  keys the same way.
+
+  Args:
+    keys: Tuple of keys, in the order they are inserted.
+
+  Returns:
+    List of (text, index) pairs in iteration order, text being the JSON
+    that comes before the key's value in the encoded dict and index the
+    position in keys of the key's last insertion.
+  """
+  order = _dict_orders.get(keys)
+  if order is None:
+    data = {}
+    for index, key in enumerate(keys):
+      data[key] = index
+    order = []
+    for key, index in data.iteritems():
+      text = _EncodeKey(key) + ': '
+      if order:
+        text = ', ' + text
+      order.append((text, index))
+    if len(_dict_orders) < _MAX_DICT_ORDERS:
+      _dict_orders[keys] = order
+  return order
+
+
+def _EncodeKey(key):
+  """Encodes a dict key the way simplejson does, None if it is skipped."""
+  if isinstance(key, (str, unicode)):
+    pass
+  elif isinstance(key, float):
+    key = encoder.floatstr(key)
+  elif isinstance(key, (int, long)):
+    key = str(key)
+  elif key is True:
+    key = 'true'
+  elif key is False:
+    key = 'false'
+  elif key is None:
+    key = 'null'
+  else:
+    raise TypeError('key %r is not a string' % (key,))
+  return encoder.encode_basestring_ascii(key)
+
+
+class _JSONWriter(object):
+  """Writes serialized instances as JSON in a single walk.
+
+  Each Write method appends the JSON text simplejson.dumps would give for
+  its part of the serialized data to chunks. Given an out function the
+  writer streams: whenever buffer_chunks chunks have piled up between two
+  values of a list or dict, they are joined and passed to out.
+  """
+
+  def __init__(self, out=None, buffer_chunks=DEFAULT_BUFFER_CHUNKS):
+    self.chunks = []
+    self.append = self.chunks.append
+    self.out = out
+    if out is None:
+      self.buffer_chunks = sys.maxint
+    else:
+      self.buffer_chunks = buffer_chunks
+
+  def WriteValue(self, value):
+    """Writes plain data, as simplejson.dumps would."""
+    append = self.append
+    if isinstance(value, (str, unicode)):
+      append(encoder.encode_basestring_ascii(value))
+    elif value is None:
+      append('null')
+    elif value is True:
+      append('true')
+    elif value is False:
+      append('false')
+    elif isinstance(value, (int, long)):
+      append(str(value))
+    elif isinstance(value, float):
+      append(encoder.floatstr(value))
+    elif isinstance(value, (list, tuple)):
+      self.WriteList(value, self.WriteValue)
+    elif isinstance(value, dict):
+      if not value:
+        append('{}')
+        return
+      append('{')
+      first = True
+      for key, item in value.iteritems():
+        if first:
+          first = False
+        else:
+          append(', ')
+        append(_EncodeKey(key))
+        append(': ')
+        self.WriteValue(item)
+      append('}')
+    else:
+      raise TypeError('%r is not JSON serializable' % (value,))
+
+  def WriteSerialized(self, value, key_writer=DefaultKeyWriter):
+    """Writes what Serialize(value, key_writer) would return.
+
+    As in Serialize, key_writer only applies to the keys of value itself;
+    nested values are written with the default key writer.
+    """
+    if IsInstance(value):
+      if value and hasattr(value, SERIALIZE_FIELDS_METHOD_NAME):
+        write = self.WriteSerialized
+        self.WriteObject([(key, write, field) for key, field in
+                          getattr(value, SERIALIZE_FIELDS_METHOD_NAME)()])
+        return
+      if value and hasattr(value, CUSTOM_SERIALIZE_METHOD_NAME):
+        method = getattr(value, CUSTOM_SERIALIZE_METHOD_NAME)
+        if callable(method):
+          self.WriteValue(method())
+          return
+      self.WriteAttributes(value, key_writer)
+    elif IsDict(value):
+      write = self.WriteSerialized
+      items = [(key_writer(k), write, v) for k, v in value.iteritems()]
+      self.WriteObject([('javaClass', self.WriteValue, 'java.util.HashMap'),
+                        ('map', self.WriteObject, items)])
+    elif IsListOrDict(value):
+      self.WriteObject([('javaClass', self.WriteValue, 'java.util.ArrayList'),
+                        ('list', self.WriteSerializedList, value)])
+    else:
+      self.WriteValue(value)
+
+  def WriteAttributes(self, obj, key_writer=DefaultKeyWriter):
+    """Writes what _SerializeAttributes(obj, key_writer) would return."""
+    write = self.WriteSerialized
+    self.WriteObject([(key, write, attr) for _, key, attr in
+                      SerializableAttributes(obj, key_writer)])
+
+  def WriteSerializedList(self, values):
+    self.WriteList(values, self.WriteSerialized)
+
+  def WriteList(self, values, write):
+    append = self.append
+    if not values:
+      append('[]')
+      return
+    chunks = self.chunks
+    append('[')
+    first = True
+    for value in values:
+      if first:
+        first = False
+      else:
+        append(', ')
+      write(value)
+      if len(chunks) >= self.buffer_chunks:
+        self.Flush()
+    append(']')
+
+  def WriteObject(self, items):
+    """Writes the dict built by inserting each key of items in turn.
+
+    Args:
+      items: List of (key, write, value) triples, write being the method
+          that writes value.
+    """
+    append = self.append
+    if not items:
+      append('{}')
+      return
+    chunks = self.chunks
+    append('{')
+    for text, index in _DictOrder(tuple([item[0] for item in items])):
+      append(text)
+      _, write, value = items[index]
+      write(value)
+      if len(chunks) >= self.buffer_chunks:
+        self.Flush()
+    append('}')
+
+  def Flush(self):
+    """Passes the buffered JSON to out."""
+    if self.chunks:
+      self.out(''.join(self.chunks))
+      del self.chunks[:]
+
+  def GetJSON(self):
+    return ''.join(self.chunks)
+
+
+def SerializeToJSON(obj, key_writer=DefaultKeyWriter):
+  """Serializes any instance straight to a JSON string.
+
+  Gives exactly the string simplejson.dumps(Serialize(obj, key_writer))
+  does, but in a single walk over obj that writes the JSON as it goes rather
+  than building the serialized dicts and lists first. An instance may
+  define SerializeFields, returning the (key, value) pairs its Serialize
+  puts in a dict before serializing each value, to be written the same way.
+
+  Args:
+    obj: The instance to serialize.
+    key_writer: Optional key writer function.
+
+  Returns:
+    The JSON string.
+  """
+  writer = _JSONWriter()
+  writer.WriteSerialized(obj, key_writer)
+  return writer.GetJSON()
+
+
+def SerializeFieldsToJSON(fields):
+  """Serializes fields as a JSON object, in a single walk.
+
+  Gives exactly the string simplejson.dumps(data) does, data being the dict
+  built by inserting each key with its serialized value in turn.
+
+  Args:
+    fields: List of (key, value) pairs.
+
+  Returns:
+    The JSON string.
+  """
+  writer = _JSONWriter()
+  write = writer.WriteSerialized
+  writer.WriteObject([(key, write, value) for key, value in fields])
+  return writer.GetJSON()
+
+
+def WriteFieldsJSON(fields, out, buffer_chunks=DEFAULT_BUFFER_CHUNKS):
+  """Streams the JSON of SerializeFieldsToJSON(fields) to out.
+
+  Rather than the whole string, only up to about buffer_chunks chunks of it
+  are held at a time, which keeps memory down for large bundles.
+
+  Args:
+    fields: List of (key, value) pairs.
+    out: Function called with each piece of the JSON string in turn, such
+        as the write method of a file.
+    buffer_chunks: Optional number of chunks to buffer before calling out.
+
+  Returns:
+    The number of characters written.
+  """
+  written = [0]
+  def Out(text):
+    written[0] += len(text)
+    out(text)
+  writer = _JSONWriter(Out, buffer_chunks)
+  write = writer.WriteSerialized
+  writer.WriteObject([(key, write, value) for key, value in fields])
+  writer.Flush()
+  return written[0]
+
+
 def ClipRange(r, clip_range):
   """Clips one range to another.
 
@@ -24,6 +24,7 @@ import unittest
 
 import document
 import ops
+import simplejson
 import util
 
 
@@ -118,6 +119,28 @@ class TestUtils(unittest.TestCase):
     for k, v in a.iteritems():
       self.assertEquals(v, b[k])
 
+  def testConversionCache(self):
+    calls = []
+    def Convert(s):
+      calls.append(s)
+      return s.upper()
+    cache = util.ConversionCache(Convert, max_entries=2)
+    for s in ('a', 'b', 'a', 'c', 'c', 'a', ''):
+      self.assertEquals(s.upper(), cache(s))
+    # 'c' came after the table was full so is converted every time.
+    self.assertEquals(['a', 'b', 'c', 'c', ''], calls)
+    self.assertEquals({'hits': 2, 'misses': 5, 'hit_rate': 2 / 7.0,
+                       'entries': 2}, cache.Stats())
+
+  def testCamelCaseStats(self):
+    before = util.CamelCaseStats()['lower']
+    util.ToLowerCamelCase('some_key_name')
+    util.DefaultKeyWriter('some_key_name')
+    after = util.CamelCaseStats()['lower']
+    self.assertEquals(before['hits'] + before['misses'] + 2,
+                      after['hits'] + after['misses'])
+    self.assertTrue(after['hits'] > before['hits'])
+
   def testSerializeList(self):
     data = [1, 2, 3]
     output = util.Serialize(data)
@@ -150,6 +173,91 @@ class TestUtils(unittest.TestCase):
     self.assertEquals(Data.java_class, output['javaClass'])
     self.assertEquals(data.public, output['public'])
 
+  def testSerializableAttributes(self):
+
+    class Data(object):
+      java_class = 'json.org.JSONObject'
+      unset = None
+
+      def __init__(self, extra=False):
+        self.some_value = 1
+        self.empty = None
+        self._protected = 2
+        if extra:
+          self.unset = 'set'
+          self.Func = 'shadowed'
+
+      def Func(self):
+        pass
+
+    for i in range(2):
+      self.assertEquals(
+          [('java_class', 'javaClass', Data.java_class),
+           ('some_value', 'someValue', 1)],
+          util.SerializableAttributes(Data()))
+      self.assertEquals(
+          [('Func', 'Func', 'shadowed'),
+           ('java_class', 'javaClass', Data.java_class),
+           ('some_value', 'someValue', 1),
+           ('unset', 'unset', 'set')],
+          util.SerializableAttributes(Data(extra=True)))
+    upper = util.SerializableAttributes(Data(), util.ToUpperCamelCase)
+    self.assertEquals(['JavaClass', 'SomeValue'], [key for _, key, _ in upper])
+
+    Data.unset = 'later'
+    self.assertEquals(
+        [('java_class', 'javaClass', Data.java_class),
+         ('some_value', 'someValue', 1),
+         ('unset', 'unset', 'later')],
+        util.SerializableAttributes(Data()))
+
+  def testSerializeToJSON(self):
+
+    class Data(object):
+      java_class = 'json.org.JSONObject'
+
+      def __init__(self):
+        self.some_list = [1, 2.5, None, (True, False)]
+        self.some_dict = {'key_name': u'caf\xe9 "quoted"\n', 'other': set()}
+        self.child = document.Range(1, 2)
+        self.empty = {}
+        self._protected = 2
+
+    for data in (Data(), [Data(), {}], {'a': [Data()]}, 'text', 42, None):
+      self.assertEquals(simplejson.dumps(util.Serialize(data)),
+                        util.SerializeToJSON(data))
+
+    def Upper(key_name):
+      return key_name.upper()
+
+    class A(object):
+
+      def __init__(self, c_d):
+        self.c_d = c_d
+
+    for data in ({'a_b': A(c_d={'e_f': 1})}, A(c_d=A(c_d={'e_f': 1}))):
+      self.assertEquals(simplejson.dumps(util.Serialize(data, Upper)),
+                        util.SerializeToJSON(data, Upper))
+
+  def testSerializeFieldsToJSON(self):
+    fields = [('javaClass', 'bundle'), ('operations', [document.Range()]),
+              ('version', '1'), ('zeta', {'b_c': 1})]
+    data = {}
+    for key, value in fields:
+      data[key] = util.Serialize(value)
+    self.assertEquals(simplejson.dumps(data),
+                      util.SerializeFieldsToJSON(fields))
+
+  def testWriteFieldsJSON(self):
+    fields = [('javaClass', 'bundle'),
+              ('operations', [document.Range(i, i + 1) for i in range(50)])]
+    pieces = []
+    written = util.WriteFieldsJSON(fields, pieces.append, buffer_chunks=20)
+    expected = util.SerializeFieldsToJSON(fields)
+    self.assertEquals(expected, ''.join(pieces))
+    self.assertEquals(len(expected), written)
+    self.assertTrue(len(pieces) > 1)
+
   def testClipRange(self):
     def R(x, y):
       return document.Range(x, y)